@@ -0,0 +1,99 @@
+"""Measure batch ingestion throughput against a running API.
+
+    python benchmark_batch_ingest.py [--url http://localhost:8000] [--files 200] [--pages 5]
+                                     [--duplicates 0.1]
+
+Builds a zip of generated PDFs, posts it to /api/pdf/batch and reports files/sec from
+the summary line. Every run uses fresh content, so extraction isn't served from cache.
+"""
+import argparse
+import io
+import json
+import time
+import uuid
+import zipfile
+from typing import List
+import requests
+
+def make_pdf(text: str, pages: int, lines: int = 1) -> bytes:
+    """A minimal PDF with the given number of lines of text per page."""
+    return pdf_from_lines([
+        [f"{text} page {page}{f' line {line}' if lines > 1 else ''}" for line in range(lines)] for page in range(pages)
+    ])
+
+def _pdf_string(text: str) -> str:
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def pdf_from_lines(pages: List[List[str]]) -> bytes:
+    """A minimal PDF with the given lines of text on each page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        body = " T* ".join(f"{_pdf_string(line)} Tj" for line in lines)
+        stream = f"BT /F1 12 Tf 14 TL 72 720 Td {body} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(pages))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def make_archive(files: int, pages: int, duplicates: float) -> bytes:
+    run = uuid.uuid4().hex[:8]
+    unique = max(1, round(files * (1 - duplicates)))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for i in range(files):
+            archive.writestr(f"benchmark-{run}/doc-{i:05d}.pdf", make_pdf(f"Benchmark {run} document {i % unique}", pages))
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch PDF ingestion")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the API")
+    parser.add_argument("--files", type=int, default=200, help="PDFs in the batch")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per PDF")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="Fraction of PDFs repeating another one")
+    args = parser.parse_args()
+
+    archive = make_archive(args.files, args.pages, args.duplicates)
+    print(f"Posting {args.files} PDFs ({len(archive) / 1e6:.1f} MB zipped) to {args.url}/api/pdf/batch")
+
+    started = time.perf_counter()
+    first_result = None
+    summary = None
+    failures = []
+    with requests.post(f"{args.url}/api/pdf/batch", data=archive, stream=True,
+                       headers={"Content-Type": "application/zip"}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if "summary" in result:
+                summary = result["summary"]
+                continue
+            if first_result is None:
+                first_result = time.perf_counter() - started
+            if result["status"] == "failed":
+                failures.append(result)
+    elapsed = time.perf_counter() - started
+
+    for failure in failures[:5]:
+        print(f"  failed: {failure['filename']}: {failure.get('error')}")
+    print(json.dumps(summary, indent=2))
+    if first_result is not None:
+        print(f"First result after {first_result:.2f}s")
+    print(f"Client-side: {args.files / elapsed:.1f} files/sec over {elapsed:.2f}s (including the upload)")
+
+if __name__ == "__main__":
+    main()
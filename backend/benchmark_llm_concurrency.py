@@ -0,0 +1,134 @@
+"""Load test the async LLM providers against a local fake provider.
+
+    python benchmark_llm_concurrency.py [--provider gpt-3.5-turbo|gemini-pro] [--latency 0.2]
+                                        [--concurrency 1 2 4 8 16 32 64] [--rounds 5]
+
+Starts an HTTP server on localhost that answers the OpenAI chat completions and Gemini
+generateContent endpoints after a fixed delay, points a provider at it and runs batches
+of concurrent completions. Throughput should grow linearly with concurrency (efficiency
+near 100%) until LLM_MAX_CONNECTIONS is reached or the client's CPU time per request,
+times the request rate, uses up a core.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+from typing import Any, Dict, List
+import uvicorn
+from fastapi import FastAPI, Request
+from services.llm_providers import GeminiProvider, LLMProvider, OpenAIProvider
+
+def fake_provider_app(latency: float) -> FastAPI:
+    """An app answering like the OpenAI and Gemini APIs, after latency seconds."""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Fake answer."}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+        }
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str):
+        await asyncio.sleep(latency)
+        return {
+            "candidates": [{"content": {"parts": [{"text": "Fake answer."}]}}],
+            "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 3}
+        }
+
+    return app
+
+def _serve(port: int, latency: float):
+    uvicorn.run(fake_provider_app(latency), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+class FakeProviderServer:
+    """Runs fake_provider_app on a free localhost port in its own process, so serving the
+    fake doesn't compete with the client for the event loop being measured."""
+
+    def __init__(self, latency: float):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=_serve, args=(self.port, latency), daemon=True
+        )
+
+    async def __aenter__(self) -> "FakeProviderServer":
+        self.process.start()
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+                writer.close()
+                return self
+            except OSError:
+                if time.monotonic() > deadline or not self.process.is_alive():
+                    raise RuntimeError("Fake provider server did not start")
+                await asyncio.sleep(0.05)
+
+    async def __aexit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+    def provider(self, model: str) -> LLMProvider:
+        """A real provider for the model, pointed at this server."""
+        if model == GeminiProvider.name:
+            provider = GeminiProvider()
+            provider.base_url = f"http://127.0.0.1:{self.port}/v1beta"
+        else:
+            provider = OpenAIProvider()
+            provider.base_url = f"http://127.0.0.1:{self.port}/v1"
+        provider.api_key = "fake"
+        return provider
+
+async def measure(provider: LLMProvider, concurrency: int, rounds: int) -> Dict[str, Any]:
+    """Run rounds batches of concurrency simultaneous completions and return the throughput."""
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(rounds):
+        await asyncio.gather(*[provider.complete("Say something.", 16) for _ in range(concurrency)])
+    seconds = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "per_sec": concurrency * rounds / seconds,
+        "cpu_ms_per_request": 1000 * (time.process_time() - cpu_started) / (concurrency * rounds)
+    }
+
+async def run(model: str, latency: float, levels: List[int], rounds: int) -> List[Dict[str, Any]]:
+    """Measure every concurrency level against a fresh fake server. Each result includes its
+    efficiency: throughput relative to concurrency times the single-request throughput."""
+    async with FakeProviderServer(latency) as server:
+        provider = server.provider(model)
+        await provider.startup()
+        try:
+            await provider.complete("Warm up the connection pool.", 16)
+            results = [await measure(provider, concurrency, rounds) for concurrency in levels]
+        finally:
+            await provider.shutdown()
+    base = results[0]["per_sec"] / results[0]["concurrency"]
+    for result in results:
+        result["efficiency"] = result["per_sec"] / (base * result["concurrency"])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test LLM providers against a local fake")
+    parser.add_argument("--provider", choices=[OpenAIProvider.name, GeminiProvider.name], default=OpenAIProvider.name)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fake takes per completion")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--rounds", type=int, default=5, help="Batches per concurrency level")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.provider, args.latency, args.concurrency, args.rounds))
+    print(f"{args.provider} against a fake answering in {args.latency}s")
+    print(f"{'concurrent':>10} {'req/sec':>9} {'efficiency':>11} {'client CPU/req':>15}")
+    for result in results:
+        print(f"{result['concurrency']:>10} {result['per_sec']:>9.1f} {result['efficiency']:>10.0%} "
+              f"{result['cpu_ms_per_request']:>12.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare serial and process-pool PDF text extraction.
+
+    python benchmark_pdf_extraction.py [--pages 25 50 100 200 500] [--lines 40] [--workers N]
+                                       [--repeat 3]
+
+For each document size, times serial extraction and pooled extraction on a warmed-up pool,
+and once the first pooled call on a cold pool, which pays for spawning the workers. Use the
+smallest size where the pool wins as PDF_EXTRACT_PARALLEL_MIN_PAGES.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from benchmark_batch_ingest import make_pdf
+from services.pdf_extractor import PDFExtractor
+
+def best_of(repeat: int, run) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF text extraction")
+    parser.add_argument("--pages", type=int, nargs="+", default=[25, 50, 100, 200, 500], help="Document sizes")
+    parser.add_argument("--lines", type=int, default=40, help="Lines of text per page")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest counts")
+    args = parser.parse_args()
+
+    extractor = PDFExtractor()
+    extractor.max_workers = max(args.workers, 2)
+    extractor.parallel_min_pages = 0  # Always use the pool, to measure it
+    documents = {pages: make_pdf("Benchmark", pages, args.lines) for pages in args.pages}
+
+    largest = max(args.pages)
+    started = time.perf_counter()
+    await extractor.extract_pages(documents[largest])
+    cold = time.perf_counter() - started
+    await extractor.warm_up()
+
+    print(f"{extractor.max_workers} workers, {args.lines} lines per page, {os.cpu_count()} CPUs")
+    print(f"First pooled call on a cold pool ({largest} pages): {cold:.3f}s")
+    print(f"{'pages':>6} {'serial':>9} {'pooled':>9} {'speedup':>8}")
+    faster = {}
+    for pages, pdf_bytes in documents.items():
+        serial = best_of(args.repeat, lambda: extractor.extract_pages_serial(pdf_bytes))
+        pooled_runs = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            await extractor.extract_pages(pdf_bytes)
+            pooled_runs.append(time.perf_counter() - started)
+        pooled = min(pooled_runs)
+        print(f"{pages:>6} {serial:>8.3f}s {pooled:>8.3f}s {serial / pooled:>7.2f}x"
+              f"  (pooled median {statistics.median(pooled_runs):.3f}s)")
+        faster[pages] = pooled < serial
+    extractor.shutdown()
+
+    # The smallest size from which the pool won at every larger size tried
+    break_even = None
+    for pages in sorted(faster, reverse=True):
+        if not faster[pages]:
+            break
+        break_even = pages
+
+    if break_even is None:
+        print("The pool was never faster; leave PDF_EXTRACT_PARALLEL_MIN_PAGES above the largest size tried")
+    else:
+        print(f"The pool is faster from {break_even} pages: PDF_EXTRACT_PARALLEL_MIN_PAGES={break_even}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
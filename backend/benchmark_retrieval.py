@@ -0,0 +1,128 @@
+"""Measure how often question retrieval finds the chunk holding the answer.
+
+    python benchmark_retrieval.py [--documents 5] [--pages 40] [--top-k 8] [--retrieval bm25|semantic]
+                                  [--seed 7]
+
+Generates a fixture set of PDFs, each with facts planted among filler text that shares
+their vocabulary, and one question per fact. Every PDF goes through the ingest path
+(page extraction, chunking, index build). Reports recall@k (the share of questions whose
+answer is in one of the top k chunks), the rank of the answer and the context size
+compared with sending the whole document.
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+from benchmark_batch_ingest import pdf_from_lines
+from services.bm25_index import BM25Index
+from services.chunker import chunk_spans, chunk_texts, page_starts
+from services.pdf_extractor import pdf_extractor
+from services.token_counter import approx_tokens
+from services.vector_index import DocumentVectors, HashingEmbedder
+
+NAMES = ["Halvorsen", "Marchetti", "Okonkwo", "Lindqvist", "Tanaka", "Delacroix", "Brannigan", "Szabo",
+         "Quintero", "Abernathy", "Nakamura", "Volkov", "Esterhazy", "Oyelaran", "Thorsby", "Castellanos"]
+PLACES = ["Tromso", "Valparaiso", "Kisumu", "Aberdeen", "Hobart", "Tartu", "Cusco", "Nagano"]
+MONTHS = ["January", "March", "May", "July", "September", "November"]
+
+# (fact, question) templates; {n} is the answer
+FACTS = [
+    ("{name} Station near {place} logged {n} millimetres of rain in {month}.",
+     "How much rain did {name} Station log in {month}?"),
+    ("The {name} bridge over the river at {place} is {n} metres long.",
+     "How long is the {name} bridge?"),
+    ("The {name} reactor in {place} runs at a core temperature of {n} degrees.",
+     "What core temperature does the {name} reactor run at?"),
+    ("Ticket sales at the {name} museum in {place} reached {n} during {month}.",
+     "How many tickets did the {name} museum sell in {month}?"),
+    ("The {name} warehouse at {place} stores {n} pallets of spare parts.",
+     "How many pallets does the {name} warehouse store?"),
+]
+
+# Filler reusing the facts' vocabulary, so retrieval has to rank rather than just match
+FILLER = [
+    "The quarterly review for {place} covered rain, bridges, reactors, museums and warehouses in general terms.",
+    "{name} is mentioned again in the appendix on maintenance schedules for {place}.",
+    "Inspectors visited {place} in {month} and filed routine notes on staffing and budgets.",
+    "Regional planners compared storage, ticket sales and rainfall across several sites without firm figures.",
+    "The committee asked for updated temperature and length measurements from every site in {place}.",
+    "Spare parts, pallets and transport were discussed, but no totals were agreed in {month}.",
+]
+
+def make_document(rng: random.Random, pages: int, lines_per_page: int, facts_per_document: int):
+    """Generate one document's pages and its (question, answer) pairs."""
+    def fill(template: str) -> str:
+        return template.format(name=rng.choice(NAMES), place=rng.choice(PLACES), month=rng.choice(MONTHS))
+
+    document = [[fill(rng.choice(FILLER)) for _ in range(lines_per_page)] for _ in range(pages)]
+    questions = []
+    names = rng.sample(NAMES, facts_per_document)
+    for name in names:
+        fact, question = rng.choice(FACTS)
+        values = {"name": name, "place": rng.choice(PLACES), "month": rng.choice(MONTHS),
+                  "n": str(rng.randint(1000, 99999))}
+        page = rng.randrange(pages)
+        document[page][rng.randrange(lines_per_page)] = fact.format(**values)
+        questions.append({"question": question.format(**values), "answer": values["n"]})
+    return document, questions
+
+def evaluate(documents: int = 5, pages: int = 40, lines_per_page: int = 30, facts_per_document: int = 10,
+             top_k: int = 8, retrieval: str = "bm25", seed: int = 7) -> Dict[str, Any]:
+    """Run the benchmark and return its measurements."""
+    rng = random.Random(seed)
+    embedder = HashingEmbedder() if retrieval == "semantic" else None
+    ranks: List[int] = []
+    context_ratio = []
+    index_seconds = 0.0
+    for _ in range(documents):
+        lines, questions = make_document(rng, pages, lines_per_page, facts_per_document)
+        extracted = pdf_extractor.extract_pages_serial(pdf_from_lines(lines))
+        content = "".join(page + "\n" for page in extracted)
+        chunks = chunk_texts(content, chunk_spans(content, starts=page_starts(extracted)))
+
+        started = time.perf_counter()
+        index = DocumentVectors(embedder.embed(chunks), embedder) if embedder else BM25Index.build(chunks)
+        index_seconds += time.perf_counter() - started
+
+        document_tokens = approx_tokens(content)
+        for question in questions:
+            ranked = [chunk_index for chunk_index, _ in index.search(question["question"])]
+            rank = next((position for position, chunk_index in enumerate(ranked, 1)
+                         if question["answer"] in chunks[chunk_index]), None)
+            ranks.append(rank or 0)
+            context = sum(approx_tokens(chunks[chunk_index]) for chunk_index in ranked[:top_k])
+            context_ratio.append(document_tokens / max(context, 1))
+
+    found = [rank for rank in ranks if rank]
+    return {
+        "questions": len(ranks),
+        "retrieval": retrieval,
+        "top_k": top_k,
+        f"recall@{top_k}": sum(1 for rank in found if rank <= top_k) / len(ranks),
+        "recall@1": sum(1 for rank in found if rank == 1) / len(ranks),
+        "median_rank": statistics.median(found) if found else None,
+        "context_reduction": statistics.median(context_ratio),
+        "index_ms_per_document": 1000 * index_seconds / documents
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark question retrieval recall")
+    parser.add_argument("--documents", type=int, default=5, help="PDFs in the fixture set")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per PDF")
+    parser.add_argument("--lines", type=int, default=30, help="Lines of text per page")
+    parser.add_argument("--facts", type=int, default=10, help="Planted facts (and questions) per PDF")
+    parser.add_argument("--top-k", type=int, default=8, help="Chunks placed in the prompt")
+    parser.add_argument("--retrieval", choices=["bm25", "semantic"], default="bm25")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    result = evaluate(args.documents, args.pages, args.lines, args.facts, args.top_k, args.retrieval, args.seed)
+    print(f"{result['questions']} questions, {args.retrieval} retrieval")
+    print(f"recall@{args.top_k}: {result[f'recall@{args.top_k}']:.1%}   recall@1: {result['recall@1']:.1%}   "
+          f"median rank of the answer: {result['median_rank']}")
+    print(f"Context is {result['context_reduction']:.0f}x smaller than the whole document (median)")
+    print(f"Index build: {result['index_ms_per_document']:.1f} ms per document")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Dict, Optional, Union, Any
+from typing import Dict, List, Optional, Union, Any
 from functools import lru_cache
 from dotenv import load_dotenv
 import os
@@ -35,6 +35,9 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: Optional[str] = None
     REDIS_SSL: bool = False
     REDIS_TIMEOUT: int = 30
+    REDIS_MAX_CONNECTIONS: int = 50  # Per pool (sync, async and binary async clients each have one)
+    REDIS_POOL_TIMEOUT: int = 20  # seconds to wait for a free pooled connection
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # seconds; idle connections are pinged before reuse
 
     # Application Settings
     PDF_UPLOAD_DIR: str = "uploads"
@@ -43,6 +46,107 @@ class Settings(BaseSettings):
     BACKEND_URL: str = "http://localhost:8000"
     DEBUG: bool = False
 
+    # Extraction Cache Configuration
+    EXTRACTOR_VERSION: str = "pypdf2-3.0.1:1"  # Bump to invalidate cached extractions
+    EXTRACTION_CACHE_TTL: int = 30 * 24 * 3600  # 30 days
+    DOC_COMPRESSION: str = "zlib"  # "zlib" or "zstd" (needs the zstandard package)
+    DOC_FRAME_SIZE: int = 64 * 1024  # Bytes of text per independently compressed frame
+
+    # PDF Extraction Configuration
+    PDF_EXTRACT_WORKERS: Optional[int] = None  # Defaults to the number of CPUs; 1 disables the process pool
+    PDF_EXTRACT_MIN_PAGES_PER_TASK: int = 25
+    PDF_EXTRACT_PARALLEL_MIN_PAGES: int = 300  # Shorter documents are extracted in one thread (see benchmark_pdf_extraction.py)
+
+    # Chunking Configuration
+    CHUNK_MAX_TOKENS: int = 250  # Tokens per chunk, about 1000 characters
+    CHUNK_OVERLAP_TOKENS: int = 50  # Trailing tokens of a chunk repeated at the start of the next
+    CHUNK_TOKENIZER: str = "approx"  # "approx" (4 characters per token) or "tiktoken" (needs the tiktoken package)
+    TIKTOKEN_ENCODING: str = "cl100k_base"
+    # Models counted exactly with a tiktoken encoding; others are estimated at 4 characters per token
+    TOKENIZER_ENCODINGS: Dict[str, str] = {"gpt-3.5-turbo": "cl100k_base"}
+
+    # Upload Configuration
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB read from the request per iteration
+    S3_MULTIPART_PART_SIZE: int = 8 * 1024 * 1024  # 8MB parts (S3 minimum is 5MB)
+
+    # Signed URL Configuration
+    S3_PRESIGNED_URL_EXPIRY: int = 3600  # seconds a download URL stays valid
+    SIGNED_URL_REFRESH_MARGIN: int = 300  # Cached URLs are re-signed this many seconds before they expire
+    SIGNED_URL_CACHE_SIZE: int = 10_000  # Signed URLs kept per process
+
+    # PDF Catalog Configuration
+    CATALOG_RECONCILE_INTERVAL: int = 15 * 60  # seconds between reconciles with the S3 bucket
+    CATALOG_PAGE_SIZE: int = 50  # Default PDFs per catalog page
+    CATALOG_PAGE_SIZE_MAX: int = 1000
+
+    # Stream Consumer Configuration
+    STREAM_BATCH_SIZE: int = 100  # Events read, stored and acknowledged per round trip
+    STREAM_BLOCK_MS: int = 5000  # How long a read waits for new events; keep below REDIS_TIMEOUT
+    STREAM_MAX_PENDING_BATCHES: int = 4  # Batches read ahead of processing before reads pause
+    STREAM_CLAIM_MIN_IDLE_MS: int = 60_000  # Unacknowledged events idle this long are reclaimed
+    STREAM_CLAIM_INTERVAL: int = 30  # seconds between checks for stuck events
+    STREAM_CONSUMER_NAME: Optional[str] = None  # Defaults to a name unique to this process
+    STREAM_HEARTBEAT_INTERVAL: int = 10  # seconds between consumer heartbeats
+    STREAM_CONSUMER_TIMEOUT: int = 60  # seconds without a heartbeat before a consumer's work is taken over
+
+    # Event Publishing Configuration
+    EVENT_QUEUE_SIZE: int = 10_000  # Usage events held in memory; more are dropped
+    EVENT_BATCH_SIZE: int = 100  # Events written per round trip
+    EVENT_FLUSH_INTERVAL: float = 0.5  # seconds a partial batch waits for more events
+    EVENT_FLUSH_TIMEOUT: float = 1.0  # seconds before a slow write is abandoned and its events dropped
+    EVENT_STREAM_MAXLEN: int = 100_000  # Approximate number of events kept in the stream
+
+    # Analytics Rollup Configuration
+    ANALYTICS_MINUTE_RETENTION: int = 2 * 24 * 3600  # 2 days of per-minute buckets
+    ANALYTICS_HOUR_RETENTION: int = 35 * 24 * 3600  # 35 days of per-hour buckets
+    ANALYTICS_DAY_RETENTION: int = 400 * 24 * 3600  # 400 days of per-day buckets
+    ANALYTICS_LATENCY_BUCKETS: List[float] = [0.5, 1, 2, 5, 10, 30, 60]  # Histogram upper bounds in seconds
+    ANALYTICS_MAX_BUCKETS: int = 1500  # Most buckets one query may read
+
+    # Ingestion Job Configuration
+    INGEST_WORKERS: int = 2  # Ingestion workers run inside the API process; 0 when ingest_worker.py runs them
+    INGEST_JOB_TTL: int = 7 * 24 * 3600  # How long job status is kept
+    INGEST_MAX_ATTEMPTS: int = 3  # Deliveries of a job before it is marked failed
+    INGEST_CLAIM_MIN_IDLE_MS: int = 15 * 60 * 1000  # Jobs unacknowledged this long are taken over
+    INGEST_STREAM_MAXLEN: int = 10_000  # Approximate number of job messages kept in the stream
+
+    # Batch Ingestion Configuration
+    BATCH_INGEST_CONCURRENCY: int = 4  # Files of one batch processed at a time
+    BATCH_INGEST_MAX_FILES: int = 10_000  # Most PDFs accepted in one batch
+
+    # Batch Summarization Configuration
+    BATCH_SUMMARY_CONCURRENCY: int = 8  # Documents of one batch summarized at a time
+    BATCH_SUMMARY_MAX_REQUESTS: int = 1000  # Most requests accepted in one batch
+    BATCH_SUMMARY_TTL: int = 7 * 24 * 3600  # How long batch results are kept
+    BATCH_PROVIDER_CONCURRENCY: Dict[str, int] = {"gpt-3.5-turbo": 8, "gemini-pro": 4}  # Concurrent batch calls per model
+    BATCH_PROVIDER_RPM: Dict[str, int] = {"gpt-3.5-turbo": 500, "gemini-pro": 60}  # Batch requests per minute per model
+    BATCH_DEFAULT_CONCURRENCY: int = 4  # For models missing from BATCH_PROVIDER_CONCURRENCY
+    BATCH_RATE_LIMIT_BACKOFF: float = 10.0  # seconds, doubled per retry when the provider sends no Retry-After
+    BATCH_RATE_LIMIT_RETRIES: int = 3  # Retries of a rate-limited call before falling back to another model
+
+    # Question Answering Retrieval Configuration
+    QA_TOP_K: int = 8  # Maximum number of chunks placed in a question prompt
+    QA_CONTEXT_TOKEN_BUDGET: int = 3000  # Maximum estimated tokens of context per question
+    QA_RETRIEVAL_MODE: str = "bm25"  # "bm25" or "semantic"
+
+    # Embedding Configuration
+    EMBEDDER: str = "hashing"  # "hashing" or "sentence-transformers"
+    EMBEDDING_DIM: int = 512  # Used by the hashing embedder
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"  # Used by the sentence-transformers embedder
+    VECTOR_INDEX_DIR: str = "indexes"
+
+    # Map-Reduce Summarization Configuration
+    SUMMARY_MAP_REDUCE_THRESHOLD: int = 12000  # Estimated document tokens above which map-reduce is used
+    SUMMARY_MAP_INPUT_TOKENS: int = 3000  # Estimated tokens of document text per map call
+    SUMMARY_PARTIAL_TOKENS: int = 300  # Output tokens per partial summary
+    SUMMARY_REDUCE_FANOUT: int = 6  # Partial summaries merged per reduce call
+    SUMMARY_MAX_CONCURRENCY: int = 4  # Concurrent completions per summarization
+    SUMMARY_CACHE_TTL: int = 7 * 24 * 3600  # 7 days
+
+    # LLM Response Cache Configuration
+    RESPONSE_CACHE_TTL: int = 24 * 3600  # 1 day
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10_000  # Least recently used entries are evicted beyond this
+
     # Model Configuration
     DEFAULT_MODEL: str = "gemini-pro"
     AVAILABLE_MODELS: Dict[str, str] = {
@@ -55,6 +159,26 @@ class Settings(BaseSettings):
 
     GEMINI_API_KEY: str = ""
 
+    # LLM Provider Configuration
+    OPENAI_TIMEOUT: float = 60.0  # seconds
+    GEMINI_TIMEOUT: float = 60.0  # seconds
+    OPENAI_BASE_URL: Optional[str] = None  # Defaults to the OpenAI API; set for a compatible proxy
+    GEMINI_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta"
+    LLM_MAX_CONNECTIONS: int = 100  # Pooled HTTP connections per provider
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_FAKE_BACKEND: bool = False  # Answer every completion offline with canned text, for tests and benchmarks
+    LLM_FAKE_LATENCY: float = 0.2  # seconds per fake completion
+    LLM_FAKE_RPM: int = 0  # Fake requests per minute per model before rate limiting; 0 for no limit
+
+    # Model Router Configuration
+    ROUTER_WINDOW: int = 50  # Recent calls per model used for latency and error rates
+    ROUTER_MIN_CALLS: int = 5  # Calls needed before error rates and p95 are trusted
+    ROUTER_FAILURE_THRESHOLD: int = 3  # Consecutive failures that open a model's circuit
+    ROUTER_ERROR_RATE_THRESHOLD: float = 0.5  # Windowed error rate that opens a model's circuit
+    ROUTER_OPEN_SECONDS: float = 30.0  # How long an open circuit skips the model
+    ROUTER_HEDGE_DEFAULT_DELAY: float = 2.0  # seconds, used until a model has enough latency samples
+    ROUTER_HEDGE_MIN_DELAY: float = 0.25  # seconds
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # If GEMINI_API_KEY is not set but GOOGLE_API_KEY is, use GOOGLE_API_KEY for GEMINI_API_KEY
@@ -0,0 +1,37 @@
+"""Run PDF ingestion workers outside the API process.
+
+    python ingest_worker.py [--workers N]
+
+Set INGEST_WORKERS=0 on the API instances when ingestion runs here instead.
+"""
+import argparse
+import asyncio
+import logging
+from config import get_settings
+from services.ingest_queue import ingest_queue
+from services.pdf_extractor import pdf_extractor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+async def run(workers: int):
+    # Spawn the PDF extraction workers before the first job needs them
+    await pdf_extractor.warm_up()
+    await ingest_queue.start(workers)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run PDF ingestion workers")
+    parser.add_argument("--workers", type=int, default=max(get_settings().INGEST_WORKERS, 1),
+                        help="Number of concurrent ingestion jobs")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pdf_extractor.shutdown()
+
+if __name__ == "__main__":
+    main()
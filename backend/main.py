@@ -1,11 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import logging
 import uvicorn
-from routes import pdf_routes, llm_routes
+from routes import pdf_routes, llm_routes, analytics_routes
 from services.stream_consumer import stream_consumer
 from services.pdf_service import pdf_service
+from services.pdf_extractor import pdf_extractor
+from services.llm_providers import llm_providers
+from services.pdf_catalog import pdf_catalog
+from services.extraction_cache import extraction_cache
+from services.event_publisher import event_publisher
+from services.ingest_queue import ingest_queue
+from services.batch_summarizer import batch_summarizer
+from services.metrics import MetricsMiddleware, render as render_metrics
 import os
 
 # Configure logging
@@ -33,23 +41,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Record per-route latency and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(pdf_routes.router, prefix="/api/pdf", tags=["PDF Operations"])
 app.include_router(llm_routes.router, prefix="/api/llm", tags=["LLM Operations"])
+app.include_router(analytics_routes.router, prefix="/api/analytics", tags=["Analytics"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the PDF Summarization API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics: request latency, stage timings and Redis/S3 call counts."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.on_event("startup")
 async def startup_event():
+    # Create the pooled LLM provider clients once for the whole process
+    await llm_providers.startup()
+    # Spawn the PDF extraction workers now rather than on the first large upload
+    asyncio.create_task(pdf_extractor.warm_up())
     # Start the stream consumer as a background task
     asyncio.create_task(stream_consumer.start())
+    # Publish usage events to the stream in the background
+    asyncio.create_task(event_publisher.start())
+    # Keep the PDF catalog in line with the S3 bucket
+    asyncio.create_task(pdf_catalog.start())
+    # Ingest uploaded PDFs in the background (INGEST_WORKERS=0 leaves it to ingest_worker.py)
+    asyncio.create_task(ingest_queue.start())
+    # Convert extractions cached in the old JSON format
+    asyncio.create_task(extraction_cache.migrate_legacy())
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     # Stop the stream consumer
     stream_consumer.stop()
+    # Flush the usage events still queued
+    await event_publisher.stop()
+    # Stop taking ingestion jobs; unfinished ones are reclaimed by another worker
+    ingest_queue.stop()
+    # Cancel summary batches still running; their finished results stay in Redis
+    batch_summarizer.stop()
+    # Stop the PDF catalog reconcile job
+    pdf_catalog.stop()
+    # Stop the PDF extraction worker processes
+    pdf_extractor.shutdown()
+    # Close the LLM provider connection pools
+    await llm_providers.shutdown()
 
 @app.get("/s3-test")
 async def test_s3_retrieval(filename: str):
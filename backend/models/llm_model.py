@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class SummaryResponse(BaseModel):
     """Model for summarization response."""
@@ -9,6 +9,7 @@ class SummaryResponse(BaseModel):
     input_tokens: int
     output_tokens: int
     cost: float
+    cached: bool = False
 
 class QuestionResponse(BaseModel):
     """Model for question answering response."""
@@ -18,4 +19,40 @@ class QuestionResponse(BaseModel):
     model: str
     input_tokens: int
     output_tokens: int
-    cost: float 
\ No newline at end of file
+    cost: float
+    cached: bool = False
+
+
+class BatchSummaryStatus(BaseModel):
+    """Model for the progress and totals of a summary batch."""
+    batch_id: str
+    status: str  # running, done, failed or cancelled
+    total: int
+    completed: int
+    failed: int
+    cached: int  # Completed from the response cache
+    input_tokens: int
+    output_tokens: int
+    cost: float
+    created_at: float
+    updated_at: float
+    results: Optional[List[Dict[str, Any]]] = None  # Finished so far, by request index
+
+class CostEstimate(BaseModel):
+    """Model for the estimated tokens and cost of a request on one model."""
+    model: str
+    calls: int
+    input_tokens: int
+    output_tokens: int  # Every call's output limit, so an upper bound
+    cost: float
+
+class EstimateResponse(BaseModel):
+    """Model for a pre-flight estimate of a summary or question."""
+    filename: str
+    task: str
+    strategy: str  # "single" or "map_reduce"
+    document_tokens: int
+    tokenizer: str  # "approx" when counted with the four-characters-per-token heuristic
+    cached: bool  # The response cache already holds the answer, so running it costs nothing
+    estimate: CostEstimate  # For the model that will answer: the requested one if it is available
+    alternatives: List[CostEstimate]  # For the other available models, cheapest first
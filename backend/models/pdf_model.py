@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 class PDFContent(BaseModel):
@@ -11,6 +11,7 @@ class PDFContent(BaseModel):
     file_path: Optional[str] = None
     s3_url: Optional[str] = None
     chunks: Optional[List[str]] = None
+    content_hash: Optional[str] = None
 
     model_config = {
         "arbitrary_types_allowed": True
@@ -23,6 +24,24 @@ class PDFResponse(BaseModel):
     success: bool
     error: Optional[str] = None
     s3_url: Optional[str] = None
+    job_id: Optional[str] = None  # Ingestion job to poll at /api/pdf/jobs/{job_id}
+
+class IngestJobStatus(BaseModel):
+    """Model for the progress of a PDF ingestion job."""
+    job_id: str
+    filename: str
+    status: str  # queued, running, retrying, done or failed
+    stage: str
+    stages: Dict[str, Dict[str, Any]]
+    attempts: int
+    created_at: float
+    updated_at: float
+    content_hash: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchS3Request(BaseModel):
+    """Model for ingesting PDFs already in S3."""
+    keys: List[str]  # Keys under pdfs/
 
 class QuestionRequest(BaseModel):
     """Model for question answering request."""
@@ -30,6 +49,7 @@ class QuestionRequest(BaseModel):
     question: str
     model: str = "gpt-4"
     s3_url: Optional[str] = None
+    retrieval: Optional[str] = None  # "bm25" or "semantic"; defaults to QA_RETRIEVAL_MODE
 
 class SummaryRequest(BaseModel):
     """Model for summarization request."""
@@ -38,7 +58,36 @@ class SummaryRequest(BaseModel):
     max_length: int = 1000
     s3_url: Optional[str] = None
 
+class EstimateRequest(BaseModel):
+    """Model for estimating the tokens and cost of a summary or question before running it."""
+    filename: str
+    task: str = "summarize"  # "summarize" or "ask"
+    model: str = "gpt-4"
+    max_length: int = 1000  # For task "summarize"
+    question: Optional[str] = None  # Required for task "ask"
+    retrieval: Optional[str] = None  # For task "ask"
+    s3_url: Optional[str] = None
+
+class BatchSummaryRequest(BaseModel):
+    """Model for summarizing many PDFs in one batch."""
+    requests: List[SummaryRequest]
+
 class PDFListItem(BaseModel):
     filename: str
     url: Optional[str] = None
-    max_length: Optional[int] = 1000 
\ No newline at end of file
+    max_length: Optional[int] = 1000
+    size: Optional[int] = None
+    uploaded_at: Optional[float] = None
+    content_hash: Optional[str] = None
+    url_expires_at: Optional[float] = None
+
+class PDFURLResponse(BaseModel):
+    """Model for a signed PDF download URL."""
+    filename: str
+    url: str
+    expires_at: float
+
+class PDFCatalogPage(BaseModel):
+    """Model for one page of the PDF catalog."""
+    items: List[PDFListItem]
+    next_cursor: Optional[str] = None 
\ No newline at end of file
@@ -3,12 +3,51 @@ import redis.asyncio
 import json
 from config import get_settings
 import logging
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List, Tuple
 import ssl
+from services.metrics import REDIS_COMMANDS, REDIS_ROUND_TRIPS
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+def _count_command(args):
+    name = args[0]
+    REDIS_COMMANDS.labels(command=(name.decode() if isinstance(name, bytes) else str(name)).upper()).inc()
+
+class _InstrumentedConnectionMixin:
+    """Counts commands (each pipelined one too) and round trips on a sync connection."""
+
+    def pack_command(self, *args):
+        _count_command(args)
+        return super().pack_command(*args)
+
+    def send_packed_command(self, command, check_health=True):
+        REDIS_ROUND_TRIPS.inc()
+        return super().send_packed_command(command, check_health)
+
+class _InstrumentedAsyncConnectionMixin:
+    """Counts commands (each pipelined one too) and round trips on an async connection."""
+
+    def pack_command(self, *args):
+        _count_command(args)
+        return super().pack_command(*args)
+
+    async def send_packed_command(self, command, check_health=True):
+        REDIS_ROUND_TRIPS.inc()
+        return await super().send_packed_command(command, check_health)
+
+class InstrumentedConnection(_InstrumentedConnectionMixin, redis.Connection):
+    pass
+
+class InstrumentedSSLConnection(_InstrumentedConnectionMixin, redis.SSLConnection):
+    pass
+
+class InstrumentedAsyncConnection(_InstrumentedAsyncConnectionMixin, redis.asyncio.Connection):
+    pass
+
+class InstrumentedAsyncSSLConnection(_InstrumentedAsyncConnectionMixin, redis.asyncio.SSLConnection):
+    pass
+
 class RedisClient:
     def __init__(self, host=None, port=None, db=0):
         self.host = host or settings.REDIS_HOST
@@ -18,129 +57,107 @@ class RedisClient:
         self.ssl = getattr(settings, 'REDIS_SSL', False)
         self.timeout = getattr(settings, 'REDIS_TIMEOUT', None)
         
+        # Connection settings that worked; every client below gets its own sized pool built from them
+        self._config: Dict[str, Any] = {}
+        
         # For Redis Cloud, we'll try both with and without SSL
         self.redis = None
         self._connect_sync()
             
         # Async client for async operations
         self.async_redis = None
+        # Async client that returns raw bytes, for binary values and byte-range reads
+        self.async_redis_binary = None
+
+    def _candidate_configs(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Connection settings to try, in order."""
+        base = {"host": self.host, "port": self.port, "password": self.password}
+        return [
+            # First try: Use settings as provided
+            (f"SSL={self.ssl}", {**base, "db": self.db, "ssl": self.ssl, "socket_timeout": self.timeout}),
+            # Second try: Try with opposite SSL setting
+            (f"SSL={not self.ssl}", {**base, "db": self.db, "ssl": not self.ssl, "socket_timeout": self.timeout}),
+            # Third try: For Redis Cloud, try with specific SSL configuration
+            ("Redis Cloud SSL configuration", {**base, "db": self.db, "ssl": True, "socket_connect_timeout": self.timeout}),
+            # Last resort: Try without SSL and with minimal configuration
+            ("minimal configuration", {**base, "ssl": False})
+        ]
+
+    def _pool(self, pool_class, connection_class, ssl_connection_class, decode_responses: bool = True):
+        """Build a bounded connection pool from the working connection settings.
+        Callers wait up to REDIS_POOL_TIMEOUT for a free connection instead of opening more."""
+        config = dict(self._config)
+        use_ssl = config.pop("ssl", False)
+        if use_ssl:
+            config["ssl_cert_reqs"] = ssl.CERT_NONE
+        return pool_class(
+            connection_class=ssl_connection_class if use_ssl else connection_class,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            decode_responses=decode_responses,
+            **config
+        )
+
+    def _async_pool(self, decode_responses: bool = True) -> redis.asyncio.BlockingConnectionPool:
+        return self._pool(redis.asyncio.BlockingConnectionPool, InstrumentedAsyncConnection,
+                          InstrumentedAsyncSSLConnection, decode_responses)
 
     def _connect_sync(self):
         """Connect to Redis with sync client, trying different configurations."""
-        # First try: Use settings as provided
-        try:
-            logger.info(f"Attempting to connect to Redis at {self.host}:{self.port} with SSL={self.ssl}")
-            self.redis = redis.Redis(
-                host=self.host, 
-                port=self.port, 
-                db=self.db,
-                password=self.password,
-                ssl=self.ssl,
-                ssl_cert_reqs=ssl.CERT_NONE if self.ssl else None,
-                socket_timeout=self.timeout,
-                decode_responses=True
-            )
-            self.redis.ping()
-            logger.info("Successfully connected to Redis")
-            return
-        except Exception as e:
-            logger.error(f"Error connecting to Redis with SSL={self.ssl}: {str(e)}")
-        
-        # Second try: Try with opposite SSL setting
-        try:
-            opposite_ssl = not self.ssl
-            logger.info(f"Attempting to connect to Redis with SSL={opposite_ssl}")
-            self.redis = redis.Redis(
-                host=self.host, 
-                port=self.port, 
-                db=self.db,
-                password=self.password,
-                ssl=opposite_ssl,
-                ssl_cert_reqs=ssl.CERT_NONE if opposite_ssl else None,
-                socket_timeout=self.timeout,
-                decode_responses=True
-            )
-            self.redis.ping()
-            logger.info(f"Successfully connected to Redis with SSL={opposite_ssl}")
-            self.ssl = opposite_ssl
-            return
-        except Exception as e:
-            logger.error(f"Error connecting to Redis with SSL={opposite_ssl}: {str(e)}")
+        candidates = self._candidate_configs()
+        for description, config in candidates:
+            try:
+                logger.info(f"Attempting to connect to Redis at {self.host}:{self.port} with {description}")
+                self._config = config
+                self.redis = redis.Redis(
+                    connection_pool=self._pool(redis.BlockingConnectionPool, InstrumentedConnection, InstrumentedSSLConnection)
+                )
+                self.redis.ping()
+                logger.info(f"Successfully connected to Redis with {description}")
+                self.ssl = config["ssl"]
+                return
+            except Exception as e:
+                logger.error(f"Error connecting to Redis with {description}: {str(e)}")
         
-        # Third try: For Redis Cloud, try with specific SSL configuration
-        try:
-            logger.info("Attempting to connect to Redis Cloud with specific SSL configuration")
-            self.redis = redis.Redis(
-                host=self.host, 
-                port=self.port, 
-                db=self.db,
-                password=self.password,
-                ssl=True,
-                ssl_cert_reqs=ssl.CERT_NONE,
-                socket_connect_timeout=self.timeout,
-                socket_keepalive=True,
-                decode_responses=True
-            )
-            self.redis.ping()
-            logger.info("Successfully connected to Redis Cloud")
-            self.ssl = True
-            return
-        except Exception as e:
-            logger.error(f"Error connecting to Redis Cloud: {str(e)}")
-            
-        # Last resort: Try without SSL and with minimal configuration
-        try:
-            logger.info("Last attempt: connecting with minimal configuration")
-            self.redis = redis.Redis(
-                host=self.host, 
-                port=self.port, 
-                password=self.password,
-                decode_responses=True
-            )
-            self.redis.ping()
-            logger.info("Successfully connected to Redis with minimal configuration")
-            self.ssl = False
-            return
-        except Exception as e:
-            logger.error(f"All Redis connection attempts failed. Last error: {str(e)}")
-            # Create a dummy client that will raise exceptions when used
-            self.redis = redis.Redis(host='localhost')
+        logger.error("All Redis connection attempts failed")
+        # Keep a client on the configured settings; it raises when used and recovers once Redis is reachable
+        self._config = candidates[0][1]
+        self.redis = redis.Redis(
+            connection_pool=self._pool(redis.BlockingConnectionPool, InstrumentedConnection, InstrumentedSSLConnection)
+        )
 
     async def initialize(self):
         """Initialize the async Redis connection."""
         if self.async_redis is not None:
             return
             
+        # Use the same configuration that worked for sync client
+        self.async_redis = redis.asyncio.Redis(connection_pool=self._async_pool())
         try:
-            # Use the same configuration that worked for sync client
-            self.async_redis = redis.asyncio.Redis(
-                host=self.host, 
-                port=self.port, 
-                db=self.db,
-                password=self.password,
-                ssl=self.ssl,
-                ssl_cert_reqs=ssl.CERT_NONE if self.ssl else None,
-                socket_timeout=self.timeout,
-                decode_responses=True
-            )
             await self.async_redis.ping()
             logger.info("Successfully connected to Redis (async)")
         except Exception as e:
             logger.error(f"Error connecting to Redis (async): {str(e)}")
-            # Try with minimal configuration
-            try:
-                self.async_redis = redis.asyncio.Redis(
-                    host=self.host, 
-                    port=self.port, 
-                    password=self.password,
-                    decode_responses=True
-                )
-                await self.async_redis.ping()
-                logger.info("Successfully connected to Redis (async) with minimal configuration")
-            except Exception as e2:
-                logger.error(f"All async Redis connection attempts failed: {str(e2)}")
-                # Create a dummy client that will raise exceptions when used
-                self.async_redis = redis.asyncio.Redis(host='localhost')
+
+    async def _binary_client(self) -> redis.asyncio.Redis:
+        """Get an async client that doesn't decode responses, using the connection settings that worked."""
+        if self.async_redis_binary is None:
+            self.async_redis_binary = redis.asyncio.Redis(connection_pool=self._async_pool(decode_responses=False))
+        return self.async_redis_binary
+
+    async def pipeline(self, binary: bool = False, transaction: bool = False):
+        """Get a pipeline: queue commands, then send them in one round trip with
+        `await pipe.execute()`. With transaction=True they are wrapped in MULTI/EXEC, so
+        they are applied all together or not at all."""
+        if binary:
+            client = await self._binary_client()
+        else:
+            if self.async_redis is None:
+                await self.initialize()
+            client = self.async_redis
+        return client.pipeline(transaction=transaction)
 
     async def get(self, key: str) -> Optional[str]:
         """Get a value from Redis asynchronously."""
@@ -152,10 +169,132 @@ class RedisClient:
         """Set a value in Redis asynchronously."""
         if self.async_redis is None:
             await self.initialize()
-        result = await self.async_redis.set(key, value)
+        return await self.async_redis.set(key, value, ex=expire)
+
+    async def mget(self, keys: list) -> list:
+        """Get several values in one round trip asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        if not keys:
+            return []
+        return await self.async_redis.mget(keys)
+
+    async def mset(self, mapping: dict, expire: int = None) -> list:
+        """Set several values in one round trip asynchronously, each with the same expiry."""
+        pipe = await self.pipeline()
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=expire)
+        return await pipe.execute()
+
+    async def delete(self, *keys: str) -> int:
+        """Delete keys from Redis asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.delete(*keys)
+
+    async def set_bytes(self, key: str, value: bytes, expire: int = None) -> bool:
+        """Set a binary value in Redis asynchronously."""
+        client = await self._binary_client()
+        return await client.set(key, value, ex=expire)
+
+    async def getrange(self, key: str, start: int, end: int) -> bytes:
+        """Get bytes start..end (inclusive) of a string value asynchronously."""
+        client = await self._binary_client()
+        return await client.getrange(key, start, end)
+
+    async def hset_bytes(self, key: str, mapping: dict, expire: int = None) -> int:
+        """Set binary hash fields asynchronously."""
+        pipe = await self.pipeline(binary=True)
+        pipe.hset(key, mapping=mapping)
         if expire:
-            await self.async_redis.expire(key, expire)
-        return result
+            pipe.expire(key, expire)
+        return (await pipe.execute())[0]
+
+    async def hmget_bytes(self, key: str, fields: list) -> list:
+        """Get several binary hash fields asynchronously."""
+        client = await self._binary_client()
+        return await client.hmget(key, fields)
+
+    async def exists(self, *keys: str) -> int:
+        """Count how many of the keys exist asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.exists(*keys)
+
+    async def scan_iter(self, match: str, count: int = 500):
+        """Iterate over keys matching a pattern without blocking Redis."""
+        if self.async_redis is None:
+            await self.initialize()
+        async for key in self.async_redis.scan_iter(match=match, count=count):
+            yield key
+
+    async def zadd(self, key: str, mapping: dict) -> int:
+        """Add members with scores to a sorted set asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.zadd(key, mapping)
+
+    async def zcard(self, key: str) -> int:
+        """Get the number of members in a sorted set asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.zcard(key)
+
+    async def zpopmin(self, key: str, count: int = 1) -> list:
+        """Remove and return the lowest-scored members of a sorted set asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.zpopmin(key, count)
+
+    async def zrem(self, key: str, *members: str) -> int:
+        """Remove members from a sorted set asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.zrem(key, *members)
+
+    async def zrevrangebyscore(self, key: str, max_score, min_score, start: int = None, num: int = None,
+                               withscores: bool = False) -> list:
+        """Get sorted set members between two scores, highest first, asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.zrevrangebyscore(key, max_score, min_score, start=start, num=num,
+                                                       withscores=withscores)
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        """Get a hash field asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.hget(key, field)
+
+    async def hmget(self, key: str, fields: list) -> list:
+        """Get several hash fields asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.hmget(key, fields)
+
+    async def hset(self, key: str, mapping: dict) -> int:
+        """Set hash fields asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.hset(key, mapping=mapping)
+
+    async def hgetall(self, key: str) -> dict:
+        """Get every field of a hash asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.hgetall(key)
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        """Increment an integer hash field asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.hincrby(key, field, amount)
+
+    async def hdel(self, key: str, *fields: str) -> int:
+        """Delete hash fields asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.hdel(key, *fields)
 
     def add_to_stream(self, stream_name: str, data: dict) -> str:
         """Add data to a Redis stream."""
@@ -165,10 +304,12 @@ class RedisClient:
         """Read data from a Redis stream."""
         return self.redis.xread({stream_name: '0'}, count=count, block=block)
 
-    def create_consumer_group(self, stream_name: str, group_name: str):
-        """Create a consumer group for a stream."""
+    async def create_consumer_group(self, stream_name: str, group_name: str):
+        """Create a consumer group for a stream asynchronously."""
+        if self.async_redis is None:
+            await self.initialize()
         try:
-            self.redis.xgroup_create(stream_name, group_name, mkstream=True)
+            await self.async_redis.xgroup_create(stream_name, group_name, mkstream=True)
             logger.info(f"Created consumer group {group_name} for stream {stream_name}")
         except redis.exceptions.ResponseError as e:
             if 'BUSYGROUP' not in str(e):
@@ -177,18 +318,88 @@ class RedisClient:
             else:
                 logger.info(f"Consumer group {group_name} already exists for stream {stream_name}")
 
-    def read_as_consumer(self, stream_name: str, group_name: str, consumer_name: str):
-        """Read from stream as a consumer in a group."""
-        return self.redis.xreadgroup(
+    async def read_as_consumer(self, stream_name: str, group_name: str, consumer_name: str, count: int = 1,
+                               block: int = None) -> list:
+        """Read new messages from a stream as a consumer in a group, waiting up to block
+        milliseconds for them to arrive."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xreadgroup(
             group_name,
             consumer_name,
             {stream_name: '>'},
-            count=1
+            count=count,
+            block=block
         )
-        
-    def acknowledge_message(self, stream_name: str, group_name: str, message_id: str):
+
+    async def claim_pending(self, stream_name: str, group_name: str, consumer_name: str, min_idle_ms: int,
+                            start_id: str = '0-0', count: int = 100) -> Tuple[str, list]:
+        """Take over messages another consumer read but hasn't acknowledged for min_idle_ms.
+        Returns the id to continue scanning from ('0-0' once the whole list was scanned) and the messages."""
+        if self.async_redis is None:
+            await self.initialize()
+        response = await self.async_redis.xautoclaim(
+            stream_name, group_name, consumer_name, min_idle_ms, start_id=start_id, count=count
+        )
+        return response[0], response[1]
+
+    async def pending_for_consumer(self, stream_name: str, group_name: str, consumer_name: str,
+                                   count: int = 100) -> list:
+        """List the oldest messages a consumer has read but not acknowledged."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xpending_range(
+            stream_name, group_name, min='-', max='+', count=count, consumername=consumer_name
+        )
+
+    async def claim_messages(self, stream_name: str, group_name: str, consumer_name: str, min_idle_ms: int,
+                             message_ids: list) -> list:
+        """Take over specific pending messages that have been idle for at least min_idle_ms."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xclaim(stream_name, group_name, consumer_name, min_idle_ms, message_ids)
+
+    async def delete_consumer(self, stream_name: str, group_name: str, consumer_name: str) -> int:
+        """Remove a consumer from a group. Its pending messages are dropped, so claim them first."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xgroup_delconsumer(stream_name, group_name, consumer_name)
+
+    async def consumer_info(self, stream_name: str, group_name: str) -> list:
+        """Get the name, pending count and idle time of each consumer in a group."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xinfo_consumers(stream_name, group_name)
+
+    async def group_info(self, stream_name: str) -> list:
+        """Get the pending count, last delivered id and (Redis 7+) lag of each group on a stream."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xinfo_groups(stream_name)
+
+    async def stream_length(self, stream_name: str) -> int:
+        """Get the number of entries in a stream."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xlen(stream_name)
+
+    async def run_script(self, script: str, keys: list, args: list):
+        """Run a Lua script atomically (EVALSHA, loading the script the first time)."""
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.register_script(script)(keys=keys, args=args)
+
+    async def acknowledge_message(self, stream_name: str, group_name: str, message_id: str) -> int:
         """Acknowledge a message has been processed."""
-        return self.redis.xack(stream_name, group_name, message_id)
+        return await self.acknowledge_messages(stream_name, group_name, [message_id])
+
+    async def acknowledge_messages(self, stream_name: str, group_name: str, message_ids: list) -> int:
+        """Acknowledge a batch of messages with one XACK."""
+        if not message_ids:
+            return 0
+        if self.async_redis is None:
+            await self.initialize()
+        return await self.async_redis.xack(stream_name, group_name, *message_ids)
 
 # Create a singleton instance
 redis_client = RedisClient() 
\ No newline at end of file
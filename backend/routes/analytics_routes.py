@@ -0,0 +1,78 @@
+from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Optional
+import logging
+import time
+from services.stream_consumer import stream_consumer
+from services.analytics_rollup import GRANULARITIES, analytics_rollup
+from services.event_publisher import event_publisher
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Buckets returned when no start time is given
+DEFAULT_BUCKETS = 60
+
+# Query parameter -> scope prefix used in the rollups
+DIMENSIONS = {"model": "model", "filename": "doc", "event_type": "type"}
+
+def _time_range(granularity: str, start: Optional[datetime], end: Optional[datetime]):
+    """Resolve a query's granularity and time range to epoch seconds."""
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    end_ts = end.timestamp() if end else time.time()
+    start_ts = start.timestamp() if start else end_ts - GRANULARITIES[granularity] * (DEFAULT_BUCKETS - 1)
+    if start_ts > end_ts:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start_ts, end_ts
+
+@router.get("/consumers")
+async def get_consumers():
+    """Lag and pending count of the analytics consumer group, and per-consumer throughput."""
+    try:
+        return await stream_consumer.get_group_status()
+    except Exception as e:
+        logger.error(f"Error reading consumer group status: {str(e)}")
+        raise HTTPException(status_code=503, detail="Consumer group status unavailable")
+
+@router.get("/stats")
+async def get_consumer_stats():
+    """Event counters of the consumer running in this instance."""
+    return await stream_consumer.get_stats()
+
+@router.get("/publisher")
+async def get_publisher_stats():
+    """Usage events published, dropped and still queued by this instance."""
+    return {**event_publisher.stats, "queued": event_publisher.queue.qsize()}
+
+@router.get("/usage")
+async def get_usage(granularity: str = "hour", start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    model: Optional[str] = None, filename: Optional[str] = None, event_type: Optional[str] = None):
+    """Request count, tokens, cost and latency per time bucket, for everything or for one
+    model, document or event type."""
+    filters = {name: value for name, value in
+               (("model", model), ("filename", filename), ("event_type", event_type)) if value}
+    if len(filters) > 1:
+        raise HTTPException(status_code=400, detail="Filter by at most one of model, filename and event_type")
+    scope = "all"
+    if filters:
+        name, value = next(iter(filters.items()))
+        scope = f"{DIMENSIONS[name]}:{value}"
+
+    start_ts, end_ts = _time_range(granularity, start, end)
+    try:
+        return await analytics_rollup.query(granularity, start_ts, end_ts, scope)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/usage/breakdown")
+async def get_usage_breakdown(dimension: str = "model", granularity: str = "hour",
+                              start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Usage totals over a time range for each model, document or event type."""
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {', '.join(DIMENSIONS)}")
+    start_ts, end_ts = _time_range(granularity, start, end)
+    try:
+        return await analytics_rollup.breakdown(granularity, start_ts, end_ts, DIMENSIONS[dimension])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,15 +1,23 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import AsyncIterator, Callable, Dict, Optional
+import asyncio
 import logging
-from models.pdf_model import QuestionRequest, SummaryRequest
-from models.llm_model import QuestionResponse, SummaryResponse
+import time
+from models.pdf_model import QuestionRequest, SummaryRequest, BatchSummaryRequest, EstimateRequest
+from models.llm_model import QuestionResponse, SummaryResponse, BatchSummaryStatus, CostEstimate, EstimateResponse
 from services.pdf_service import pdf_service
 from services.llm_service import llm_service
-from redis_client import redis_client
+from services.batch_summarizer import batch_summarizer
+from services.summarizer import CompletionFn, map_reduce_summarizer
+from services.token_counter import calculate_cost, token_counter
+from services.response_cache import response_cache
+from services.llm_providers import ProviderError
+from services.model_router import model_router
+from services.event_publisher import event_publisher
+from services.metrics import stage
 import json
-import litellm
-import openai
-import requests
 from config import get_settings
 
 router = APIRouter()
@@ -17,205 +25,318 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate the cost of API usage based on token counts."""
-    # Define pricing for different models (per 1000 tokens)
-    pricing = {
-        "gpt-4": {"input": 0.03, "output": 0.06},
-        "gpt-3.5-turbo": {"input": 0.0015, "output": 0.002},
-        "gemini-pro": {"input": 0.00125, "output": 0.00375},
-        "claude-3": {"input": 0.015, "output": 0.075},
-        "deepseek-chat": {"input": 0.0005, "output": 0.0015},
-        "grok-1": {"input": 0.0005, "output": 0.0015},
-    }
+# How often a pending LLM call checks whether the client is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+# Output token limit for answers
+ANSWER_MAX_TOKENS = 500
+
+def _summary_prompt(content_text: str, max_length: int) -> str:
+    """Create the prompt for summarizing a whole document."""
+    return f"""Please summarize the following text in a concise manner, 
+        not exceeding {max_length} characters:
+        
+        {content_text}
+        
+        Summary:"""
+
+def _question_prompt(context_text: str, question: str) -> str:
+    """Create the prompt for answering a question from document context."""
+    return f"""Please answer the following question based only on the provided content.
+        If the answer cannot be found in the content, state that clearly.
+        
+        Content:
+        {context_text}
+        
+        Question: {question}
+        
+        Answer:"""
+
+async def _complete_with_fallback(prompt: str, model: str, max_tokens: int, hedge: bool = False) -> Dict:
+    """Run a completion on the requested model, falling back to the other available models."""
+    try:
+        with stage("llm_call"):
+            return await model_router.complete(prompt, model, max_tokens, hedge=hedge)
+    except ProviderError:
+        raise HTTPException(
+            status_code=503, 
+            detail="All available language models failed. Please try again later."
+        )
+
+async def _run_until_disconnected(http_request: Request, coro):
+    """Await a coroutine, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info(f"Client disconnected from {http_request.url.path}; cancelling LLM call")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _first_choice(model: str) -> str:
+    """The model the router tries first for a request: the requested one, unless no provider
+    serves it or its circuit is open. Responses are cached under this model."""
+    return model_router.order(model)[0]
+
+async def _cache_response(cache_key: str, response, model: str):
+    """Store a fresh LLM response in the response cache. The key names the first-choice
+    model, so an answer from a fallback or hedged call to another model is not stored under it."""
+    if cache_key and response.model == model:
+        await response_cache.put(cache_key, response.model_dump(exclude={"filename", "cached"}))
+
+def _publish_usage(response: BaseModel, latency: float):
+    """Publish a usage event for a fresh LLM response to the analytics stream."""
+    event_type = "summarize" if isinstance(response, SummaryResponse) else "question"
+    # Usage only: summaries, questions and answers stay out of the stream
+    event_publisher.publish(event_type, filename=response.filename, model=response.model,
+                            tokens=response.input_tokens + response.output_tokens, cost=response.cost,
+                            latency=round(latency, 3))
+
+async def _stream_with_fallback(prompt: str, model: str, max_tokens: int) -> AsyncIterator[Dict]:
+    """Stream a completion, falling back to other models only if nothing was streamed yet."""
+    try:
+        with stage("llm_call"):
+            async for item in model_router.stream(prompt, model, max_tokens):
+                yield item
+    except ProviderError:
+        raise HTTPException(
+            status_code=503, 
+            detail="All available language models failed. Please try again later."
+        )
+
+def _sse(data: Dict, event: str = None) -> str:
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _sse_stream(events: AsyncIterator[Dict], build_response: Callable[[str, Dict], BaseModel],
+                      cache_key: Optional[str], model: str) -> AsyncIterator[str]:
+    """Relay streamed tokens as SSE, then send the full response with its token usage and cost
+    as a final "done" event."""
+    text = []
+    started = time.monotonic()
+    try:
+        async for item in events:
+            if "token" in item:
+                text.append(item["token"])
+                yield _sse({"token": item["token"]})
+            else:
+                response = build_response("".join(text), item)
+                await _cache_response(cache_key, response, model)
+                _publish_usage(response, time.monotonic() - started)
+                yield _sse(response.model_dump(), event="done")
+    except HTTPException as e:
+        yield _sse({"detail": e.detail}, event="error")
+    except Exception as e:
+        logger.error(f"Error streaming LLM response: {str(e)}")
+        yield _sse({"detail": str(e)}, event="error")
+
+def _sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _replay_cached(text: str, response: BaseModel) -> AsyncIterator[str]:
+    """Send a cached response through the same event sequence as a live one."""
+    yield _sse({"token": text})
+    yield _sse(response.model_dump(), event="done")
+
+async def _load_pdf_text(filename: str, s3_url: Optional[str]):
+    """Get a PDF's content, raising 404/400 before any response is streamed."""
+    pdf_content = await pdf_service.get_pdf_content(filename, s3_url=s3_url)
+    if not pdf_content:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    content_text = pdf_content.get("content", "")
+    if not content_text:
+        raise HTTPException(status_code=400, detail="PDF content is empty")
+    return pdf_content, content_text
+
+@router.get("/models")
+async def get_model_health():
+    """Rolling latency, error rate and circuit state of each model."""
+    return model_router.snapshot()
+
+async def _summarize(request: SummaryRequest, complete: CompletionFn) -> SummaryResponse:
+    """Summarize a PDF, from the response cache when possible. complete(prompt, max_tokens)
+    runs each LLM call, so callers decide on fallback, hedging and limits."""
+    pdf_content, content_text = await _load_pdf_text(request.filename, request.s3_url)
+    
+    # Serve repeated requests for the same document and parameters from the response cache
+    model = _first_choice(request.model)
+    cache_key = None
+    if pdf_content.get("content_hash"):
+        cache_key = response_cache.summary_key(pdf_content["content_hash"], model, request.max_length)
+        cached = await response_cache.get(cache_key)
+        if cached:
+            return SummaryResponse(**{**cached, "filename": request.filename, "cost": 0.0, "cached": True})
+    
+    started = time.monotonic()
+    # Documents too long for one prompt are summarized section by section
+    if await pdf_service.get_token_count(pdf_content, request.model) > settings.SUMMARY_MAP_REDUCE_THRESHOLD:
+        result = await llm_service.summarize_map_reduce(pdf_content, request.max_length, request.model, complete)
+        response = SummaryResponse(
+            filename=request.filename,
+            summary=result["summary"],
+            model=result["model"],
+            input_tokens=result["input_tokens"],
+            output_tokens=result["output_tokens"],
+            cost=result["cost"]
+        )
+        await _cache_response(cache_key, response, model)
+        _publish_usage(response, time.monotonic() - started)
+        return response
+    
+    # Generate summary using the selected model
+    with stage("prompt_build"):
+        prompt = _summary_prompt(content_text, request.max_length)
     
-    # Get pricing for the model or use default pricing
-    model_pricing = pricing.get(model, {"input": 0.01, "output": 0.02})
+    result = await complete(prompt, request.max_length // 4)
+    summary = result["text"]
+    used_model = result["model"]
+    input_tokens = result["input_tokens"]
+    output_tokens = result["output_tokens"]
     
-    # Calculate cost
-    input_cost = (input_tokens / 1000) * model_pricing["input"]
-    output_cost = (output_tokens / 1000) * model_pricing["output"]
+    # Calculate cost based on model
+    cost = calculate_cost(used_model, input_tokens, output_tokens)
     
-    return input_cost + output_cost
+    # Return response
+    response = SummaryResponse(
+        filename=request.filename,
+        summary=summary,
+        model=used_model,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cost=cost
+    )
+    await _cache_response(cache_key, response, model)
+    _publish_usage(response, time.monotonic() - started)
+    return response
 
 @router.post("/summarize", response_model=SummaryResponse)
-async def summarize_pdf(request: SummaryRequest):
+async def summarize_pdf(request: SummaryRequest, http_request: Request):
     """Generate a summary of a PDF."""
     try:
-        # Get PDF content
-        pdf_content = await pdf_service.get_pdf_content(request.filename, s3_url=request.s3_url if hasattr(request, 's3_url') else None)
-        if not pdf_content:
-            raise HTTPException(status_code=404, detail="PDF not found")
-        
-        # Extract the content string from the dictionary
-        content_text = pdf_content.get("content", "")
-        if not content_text:
-            raise HTTPException(status_code=400, detail="PDF content is empty")
+        # Try the selected model first, then fall back to other available models
+        async def complete(prompt: str, max_tokens: int) -> Dict:
+            return await _complete_with_fallback(prompt, request.model, max_tokens)
         
-        # Generate summary using the selected model
-        prompt = f"""Please summarize the following text in a concise manner, 
-        not exceeding {request.max_length} characters:
-        
-        {content_text}
-        
-        Summary:"""
-        
-        # Use the appropriate model
-        model = request.model
-        available_models = ["gpt-3.5-turbo", "gemini-pro"]  # Currently available models
-        
-        # Try the selected model first, then fall back to other available models if needed
-        summary = None
-        input_tokens = 0
-        output_tokens = 0
-        used_model = None
+        return await _run_until_disconnected(http_request, _summarize(request, complete))
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        logger.error(f"Error summarizing PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/summarize/batch", response_model=BatchSummaryStatus, status_code=202)
+async def summarize_batch(request: BatchSummaryRequest):
+    """Summarize many PDFs in the background.
+
+    Requests run concurrently within per-provider concurrency and rate limits, and each
+    result is stored as it finishes. Poll /summarize/batch/{batch_id} for progress,
+    results and the batch's total tokens and cost.
+    """
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="No requests given")
+    if len(request.requests) > settings.BATCH_SUMMARY_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_SUMMARY_MAX_REQUESTS} requests per batch")
+    batch_id = await batch_summarizer.submit(request.requests, _summarize)
+    return BatchSummaryStatus(**await batch_summarizer.get_batch(batch_id))
+
+@router.get("/summarize/batch/{batch_id}", response_model=BatchSummaryStatus)
+async def get_summary_batch(batch_id: str, results: bool = True):
+    """Get a summary batch's progress and totals, with the results finished so far."""
+    batch = await batch_summarizer.get_batch(batch_id, with_results=results)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return BatchSummaryStatus(**batch)
+
+async def _estimate_usage(request: EstimateRequest, pdf_content: Dict, model: str,
+                          context_text: Optional[str]) -> CostEstimate:
+    """Estimate the calls and tokens of a request on one model, the way the live path would run it."""
+    if request.task == "ask":
+        usage = {
+            "calls": 1,
+            "input_tokens": token_counter.count(_question_prompt(context_text, request.question), model),
+            "output_tokens": ANSWER_MAX_TOKENS
+        }
+    elif await pdf_service.get_token_count(pdf_content, model) > settings.SUMMARY_MAP_REDUCE_THRESHOLD:
+        chunks = llm_service._summary_chunks(pdf_content)
+        usage = map_reduce_summarizer.estimate(chunks, request.max_length, model)
+    else:
+        usage = {
+            "calls": 1,
+            "input_tokens": await pdf_service.get_token_count(pdf_content, model)
+                            + token_counter.count(_summary_prompt("", request.max_length), model),
+            "output_tokens": request.max_length // 4
+        }
+    return CostEstimate(model=model, cost=calculate_cost(model, usage["input_tokens"], usage["output_tokens"]), **usage)
+
+@router.post("/estimate", response_model=EstimateResponse)
+async def estimate_cost(request: EstimateRequest):
+    """Estimate the tokens and cost of a summary or question without calling a model.
+
+    Uses the document's stored token counts and the same prompts, chunking and strategy
+    as /summarize and /ask, for the model the router would answer with and every other
+    available model, so clients can reject or reroute an expensive request before running it.
+    """
+    if request.task not in ("summarize", "ask"):
+        raise HTTPException(status_code=400, detail="task must be \"summarize\" or \"ask\"")
+    if request.task == "ask" and not request.question:
+        raise HTTPException(status_code=400, detail="question is required for task \"ask\"")
+    try:
+        pdf_content, _ = await _load_pdf_text(request.filename, request.s3_url)
         
-        # If the selected model is not available, try to use an available one
-        if model not in available_models:
-            logger.warning(f"Model {model} not available. Will try available models.")
-            models_to_try = available_models
-        else:
-            models_to_try = [model] + [m for m in available_models if m != model]
+        # The router's first choice, then its fallbacks, then any models whose circuit is open
+        models = model_router.order(request.model)
+        models += [model for model in model_router.providers.available_models if model not in models]
         
-        # Try each model in order until one works
-        for try_model in models_to_try:
-            try:
-                logger.info(f"Attempting to use model: {try_model}")
-                
-                if try_model == "gpt-3.5-turbo":
-                    # Use OpenAI
-                    client = openai.OpenAI()
-                    response = client.chat.completions.create(
-                        model=try_model,
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=request.max_length // 4
-                    )
-                    summary = response.choices[0].message.content
-                    input_tokens = response.usage.prompt_tokens
-                    output_tokens = response.usage.completion_tokens
-                    used_model = try_model
-                    break
-                    
-                elif try_model == "gemini-pro":
-                    try:
-                        # First try the Python client
-                        import google.generativeai as genai
-                        
-                        logger.info(f"Using API key from settings: {settings.GOOGLE_API_KEY[:5]}...{settings.GOOGLE_API_KEY[-5:] if len(settings.GOOGLE_API_KEY) > 10 else ''}")
-                        
-                        # Configure the Gemini API
-                        genai.configure(api_key=settings.GOOGLE_API_KEY)
-                        logger.info("Successfully configured Google Generative AI API")
-                        
-                        # Try different model names
-                        model_names = ["gemini-pro", "gemini-1.0-pro", "gemini-2.0-flash"]
-                        gemini_success = False
-                        
-                        for model_name in model_names:
-                            try:
-                                logger.info(f"Trying Gemini model name: {model_name}")
-                                model = genai.GenerativeModel(model_name=model_name)
-                                response = model.generate_content(prompt)
-                                summary = response.text
-                                logger.info(f"Successfully generated content with Gemini model: {model_name}")
-                                input_tokens = len(prompt) // 4  # Rough estimate
-                                output_tokens = len(summary) // 4  # Rough estimate
-                                used_model = try_model
-                                gemini_success = True
-                                break
-                            except Exception as model_name_error:
-                                logger.error(f"Error with Gemini model name {model_name}: {str(model_name_error)}")
-                        
-                        if gemini_success:
-                            break
-                            
-                        # If Python client fails, try REST API directly
-                        if not gemini_success:
-                            logger.info("Trying Gemini REST API directly")
-                            import requests
-                            import json
-                            
-                            api_key = settings.GOOGLE_API_KEY
-                            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-                            
-                            headers = {
-                                "Content-Type": "application/json"
-                            }
-                            
-                            data = {
-                                "contents": [
-                                    {
-                                        "parts": [
-                                            {
-                                                "text": prompt
-                                            }
-                                        ]
-                                    }
-                                ],
-                                "generationConfig": {
-                                    "temperature": 0.7,
-                                    "topP": 0.95,
-                                    "topK": 40,
-                                    "maxOutputTokens": request.max_length // 4
-                                }
-                            }
-                            
-                            response = requests.post(url, headers=headers, data=json.dumps(data))
-                            logger.info(f"Gemini REST API response status: {response.status_code}")
-                            
-                            if response.status_code == 200:
-                                result = response.json()
-                                logger.info("Successfully parsed Gemini REST API response")
-                                summary = result["candidates"][0]["content"]["parts"][0]["text"]
-                                # Estimate tokens
-                                input_tokens = len(prompt) // 4
-                                output_tokens = len(summary) // 4
-                                used_model = try_model
-                                break
-                            else:
-                                logger.error(f"Gemini REST API error: {response.status_code} - {response.text}")
-                                continue
-                            
-                    except ImportError:
-                        logger.error("Google Generative AI package not installed. Run: pip install google-generativeai")
-                        continue
-                    except Exception as gemini_error:
-                        logger.error(f"Error using Gemini model: {str(gemini_error)}")
-                        logger.exception(gemini_error)  # Log the full traceback
-                        continue
-            
-            except Exception as model_error:
-                logger.warning(f"Error using model {try_model}: {str(model_error)}")
-                continue
+        cached = False
+        if pdf_content.get("content_hash"):
+            if request.task == "ask":
+                cache_key = response_cache.question_key(
+                    pdf_content["content_hash"], models[0], request.question, request.retrieval
+                )
+            else:
+                cache_key = response_cache.summary_key(pdf_content["content_hash"], models[0], request.max_length)
+            cached = await response_cache.get(cache_key) is not None
         
-        # If no model worked, raise an error
-        if summary is None:
-            raise HTTPException(
-                status_code=503, 
-                detail="All available language models failed. Please try again later."
-            )
+        context_text = None
+        if request.task == "ask":
+            context_text = await llm_service.build_qa_context(pdf_content, request.question, request.retrieval)
         
-        # Calculate cost based on model
-        cost = calculate_cost(used_model, input_tokens, output_tokens)
+        estimates = [await _estimate_usage(request, pdf_content, model, context_text) for model in models]
+        estimate = estimates[0]
+        if cached:
+            estimate.cost = 0.0
         
-        # Return response
-        return SummaryResponse(
+        document_tokens = await pdf_service.get_token_count(pdf_content, estimate.model)
+        map_reduce = request.task == "summarize" and document_tokens > settings.SUMMARY_MAP_REDUCE_THRESHOLD
+        return EstimateResponse(
             filename=request.filename,
-            summary=summary,
-            model=used_model,
-            input_tokens=input_tokens,
-            output_tokens=output_tokens,
-            cost=cost
+            task=request.task,
+            strategy="map_reduce" if map_reduce else "single",
+            document_tokens=document_tokens,
+            tokenizer=token_counter.tokenizer_name(estimate.model),
+            cached=cached,
+            estimate=estimate,
+            alternatives=sorted(estimates[1:], key=lambda alternative: alternative.cost)
         )
     except HTTPException:
-        # Re-raise HTTP exceptions
         raise
     except Exception as e:
-        logger.error(f"Error summarizing PDF: {str(e)}")
+        logger.error(f"Error estimating cost: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/ask", response_model=QuestionResponse)
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
     """Answer a question about a PDF."""
     try:
         # Get PDF content
@@ -228,157 +349,46 @@ async def ask_question(request: QuestionRequest):
         if not content_text:
             raise HTTPException(status_code=400, detail="PDF content is empty")
         
-        # Create prompt for question answering
-        prompt = f"""Please answer the following question based only on the provided content.
-        If the answer cannot be found in the content, state that clearly.
-        
-        Content:
-        {content_text}
-        
-        Question: {request.question}
-        
-        Answer:"""
-        
-        # Use the appropriate model
-        model = request.model
-        available_models = ["gpt-3.5-turbo", "gemini-pro"]  # Currently available models
-        
-        # Try the selected model first, then fall back to other available models if needed
-        answer = None
-        input_tokens = 0
-        output_tokens = 0
-        used_model = None
-        
-        # If the selected model is not available, try to use an available one
-        if model not in available_models:
-            logger.warning(f"Model {model} not available. Will try available models.")
-            models_to_try = available_models
-        else:
-            models_to_try = [model] + [m for m in available_models if m != model]
+        # Serve repeated questions about the same document from the response cache
+        model = _first_choice(request.model)
+        cache_key = None
+        if pdf_content.get("content_hash"):
+            cache_key = response_cache.question_key(
+                pdf_content["content_hash"], model, request.question, request.retrieval
+            )
+            cached = await response_cache.get(cache_key)
+            if cached:
+                return QuestionResponse(**{
+                    **cached,
+                    "filename": request.filename,
+                    "question": request.question,
+                    "cost": 0.0,
+                    "cached": True
+                })
         
-        # Try each model in order until one works
-        for try_model in models_to_try:
-            try:
-                logger.info(f"Attempting to use model: {try_model}")
-                
-                if try_model == "gpt-3.5-turbo":
-                    # Use OpenAI
-                    client = openai.OpenAI()
-                    response = client.chat.completions.create(
-                        model=try_model,
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=500  # Reasonable limit for answers
-                    )
-                    answer = response.choices[0].message.content
-                    input_tokens = response.usage.prompt_tokens
-                    output_tokens = response.usage.completion_tokens
-                    used_model = try_model
-                    break
-                    
-                elif try_model == "gemini-pro":
-                    try:
-                        # First try the Python client
-                        import google.generativeai as genai
-                        
-                        logger.info(f"Using API key from settings: {settings.GOOGLE_API_KEY[:5]}...{settings.GOOGLE_API_KEY[-5:] if len(settings.GOOGLE_API_KEY) > 10 else ''}")
-                        
-                        # Configure the Gemini API
-                        genai.configure(api_key=settings.GOOGLE_API_KEY)
-                        logger.info("Successfully configured Google Generative AI API")
-                        
-                        # Try different model names
-                        model_names = ["gemini-pro", "gemini-1.0-pro", "gemini-2.0-flash"]
-                        gemini_success = False
-                        
-                        for model_name in model_names:
-                            try:
-                                logger.info(f"Trying Gemini model name: {model_name}")
-                                model = genai.GenerativeModel(model_name=model_name)
-                                response = model.generate_content(prompt)
-                                answer = response.text
-                                logger.info(f"Successfully generated content with Gemini model: {model_name}")
-                                input_tokens = len(prompt) // 4  # Rough estimate
-                                output_tokens = len(answer) // 4  # Rough estimate
-                                used_model = try_model
-                                gemini_success = True
-                                break
-                            except Exception as model_name_error:
-                                logger.error(f"Error with Gemini model name {model_name}: {str(model_name_error)}")
-                        
-                        if gemini_success:
-                            break
-                            
-                        # If Python client fails, try REST API directly
-                        if not gemini_success:
-                            logger.info("Trying Gemini REST API directly")
-                            import requests
-                            import json
-                            
-                            api_key = settings.GOOGLE_API_KEY
-                            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-                            
-                            headers = {
-                                "Content-Type": "application/json"
-                            }
-                            
-                            data = {
-                                "contents": [
-                                    {
-                                        "parts": [
-                                            {
-                                                "text": prompt
-                                            }
-                                        ]
-                                    }
-                                ],
-                                "generationConfig": {
-                                    "temperature": 0.7,
-                                    "topP": 0.95,
-                                    "topK": 40,
-                                    "maxOutputTokens": 500
-                                }
-                            }
-                            
-                            response = requests.post(url, headers=headers, data=json.dumps(data))
-                            logger.info(f"Gemini REST API response status: {response.status_code}")
-                            
-                            if response.status_code == 200:
-                                result = response.json()
-                                logger.info("Successfully parsed Gemini REST API response")
-                                answer = result["candidates"][0]["content"]["parts"][0]["text"]
-                                # Estimate tokens
-                                input_tokens = len(prompt) // 4
-                                output_tokens = len(answer) // 4
-                                used_model = try_model
-                                break
-                            else:
-                                logger.error(f"Gemini REST API error: {response.status_code} - {response.text}")
-                                continue
-                            
-                    except ImportError:
-                        logger.error("Google Generative AI package not installed. Run: pip install google-generativeai")
-                        continue
-                    except Exception as gemini_error:
-                        logger.error(f"Error using Gemini model: {str(gemini_error)}")
-                        logger.exception(gemini_error)  # Log the full traceback
-                        continue
+        with stage("prompt_build"):
+            # Keep only the chunks most relevant to the question
+            context_text = await llm_service.build_qa_context(pdf_content, request.question, request.retrieval)
             
-            except Exception as model_error:
-                logger.warning(f"Error using model {try_model}: {str(model_error)}")
-                continue
+            # Create prompt for question answering
+            prompt = _question_prompt(context_text, request.question)
+        started = time.monotonic()
         
-        # If no model worked, raise an error
-        if answer is None:
-            raise HTTPException(
-                status_code=503, 
-                detail="All available language models failed. Please try again later."
-            )
+        # Try the selected model first, then fall back to other available models
+        result = await _run_until_disconnected(
+            http_request,
+            _complete_with_fallback(prompt, request.model, ANSWER_MAX_TOKENS, hedge=True)
+        )
+        answer = result["text"]
+        used_model = result["model"]
+        input_tokens = result["input_tokens"]
+        output_tokens = result["output_tokens"]
         
         # Calculate cost based on model
         cost = calculate_cost(used_model, input_tokens, output_tokens)
         
         # Return response
-        return QuestionResponse(
+        response = QuestionResponse(
             filename=request.filename,
             question=request.question,
             answer=answer,
@@ -387,9 +397,105 @@ async def ask_question(request: QuestionRequest):
             output_tokens=output_tokens,
             cost=cost
         )
+        await _cache_response(cache_key, response, model)
+        _publish_usage(response, time.monotonic() - started)
+        return response
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
         logger.error(f"Error answering question: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/summarize/stream")
+async def summarize_pdf_stream(request: SummaryRequest):
+    """Stream a summary of a PDF as Server-Sent Events."""
+    pdf_content, content_text = await _load_pdf_text(request.filename, request.s3_url)
+    
+    model = _first_choice(request.model)
+    cache_key = None
+    if pdf_content.get("content_hash"):
+        cache_key = response_cache.summary_key(pdf_content["content_hash"], model, request.max_length)
+        cached = await response_cache.get(cache_key)
+        if cached:
+            response = SummaryResponse(**{**cached, "filename": request.filename, "cost": 0.0, "cached": True})
+            return _sse_response(_replay_cached(response.summary, response))
+    
+    # Token usage and cost spent before the streamed completion (map-reduce steps)
+    prior_usage = {"input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+    
+    map_reduce = await pdf_service.get_token_count(pdf_content, request.model) > settings.SUMMARY_MAP_REDUCE_THRESHOLD
+    
+    async def events() -> AsyncIterator[Dict]:
+        if map_reduce:
+            async def complete(prompt: str, max_tokens: int) -> Dict:
+                return await _complete_with_fallback(prompt, request.model, max_tokens)
+            
+            # Summarize the sections first, then stream only the final summary
+            prompt, usage = await llm_service.prepare_map_reduce_prompt(
+                pdf_content, request.max_length, request.model, complete
+            )
+            prior_usage["input_tokens"] = usage["input_tokens"]
+            prior_usage["output_tokens"] = usage["output_tokens"]
+            prior_usage["cost"] = usage["cost"]
+        else:
+            with stage("prompt_build"):
+                prompt = _summary_prompt(content_text, request.max_length)
+        async for item in _stream_with_fallback(prompt, request.model, request.max_length // 4):
+            yield item
+    
+    def build_response(summary: str, usage: Dict) -> SummaryResponse:
+        input_tokens = prior_usage["input_tokens"] + usage["input_tokens"]
+        output_tokens = prior_usage["output_tokens"] + usage["output_tokens"]
+        return SummaryResponse(
+            filename=request.filename,
+            summary=summary,
+            model=usage["model"],
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            # The earlier steps may have run on other models; only the streamed call is priced here
+            cost=prior_usage["cost"] + calculate_cost(usage["model"], usage["input_tokens"], usage["output_tokens"])
+        )
+    
+    return _sse_response(_sse_stream(events(), build_response, cache_key, model))
+
+@router.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """Stream an answer to a question about a PDF as Server-Sent Events."""
+    pdf_content, _ = await _load_pdf_text(request.filename, request.s3_url)
+    
+    model = _first_choice(request.model)
+    cache_key = None
+    if pdf_content.get("content_hash"):
+        cache_key = response_cache.question_key(
+            pdf_content["content_hash"], model, request.question, request.retrieval
+        )
+        cached = await response_cache.get(cache_key)
+        if cached:
+            response = QuestionResponse(**{
+                **cached,
+                "filename": request.filename,
+                "question": request.question,
+                "cost": 0.0,
+                "cached": True
+            })
+            return _sse_response(_replay_cached(response.answer, response))
+    
+    with stage("prompt_build"):
+        context_text = await llm_service.build_qa_context(pdf_content, request.question, request.retrieval)
+        prompt = _question_prompt(context_text, request.question)
+    
+    def build_response(answer: str, usage: Dict) -> QuestionResponse:
+        return QuestionResponse(
+            filename=request.filename,
+            question=request.question,
+            answer=answer,
+            model=usage["model"],
+            input_tokens=usage["input_tokens"],
+            output_tokens=usage["output_tokens"],
+            cost=calculate_cost(usage["model"], usage["input_tokens"], usage["output_tokens"])
+        )
+    
+    return _sse_response(_sse_stream(
+        _stream_with_fallback(prompt, request.model, ANSWER_MAX_TOKENS), build_response, cache_key, model
+    ))
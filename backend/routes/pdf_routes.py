@@ -1,9 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List, Dict
-from services.pdf_service import pdf_service
-from models.pdf_model import PDFResponse, PDFContent, PDFListItem
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Optional, Tuple
+from services.pdf_service import pdf_service, FileTooLarge
+from services.extraction_cache import extraction_cache
+from services.ingest_queue import ingest_queue
+from services.batch_ingest import archive_kind, batch_ingestor
+from models.pdf_model import PDFResponse, PDFContent, PDFListItem, PDFCatalogPage, PDFURLResponse, IngestJobStatus, BatchS3Request
+import json
 import logging
 import os
+import tempfile
 import requests
 import boto3
 from config import get_settings
@@ -15,45 +21,41 @@ settings = get_settings()
 
 @router.post("/upload", response_model=PDFResponse)
 async def upload_pdf(file: UploadFile = File(...)):
-    """Upload and process a PDF file."""
+    """Upload a PDF and queue it for ingestion. Poll /jobs/{job_id} for progress."""
     try:
-        # Save file temporarily
-        temp_path = f"temp/{file.filename}"
-        os.makedirs("temp", exist_ok=True)
+        # Stream the upload straight into S3 without buffering the whole file
+        try:
+            upload = await pdf_service.upload_stream(file, file.filename)
+        except FileTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Upload to S3
-        s3_client = boto3.client('s3',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION')
-        )
-        
-        bucket_name = os.getenv('S3_BUCKET_NAME')
-        s3_path = f"pdfs/{file.filename}"
-        
-        # Upload file to S3
-        s3_client.upload_file(temp_path, bucket_name, s3_path)
-        
-        # Generate presigned URL
-        s3_url = s3_client.generate_presigned_url('get_object',
-            Params={'Bucket': bucket_name, 'Key': s3_path},
-            ExpiresIn=3600  # URL valid for 1 hour
-        )
-        
-        # Clean up temp file
-        os.remove(temp_path)
+        # Extraction, chunking, indexing and the catalog update run in an ingestion worker
+        try:
+            job_id = await ingest_queue.enqueue(file.filename, upload["s3_key"], upload["content_hash"], upload["size"])
+        except Exception as queue_error:
+            logger.warning(f"Error queueing ingestion of {file.filename}, processing inline: {str(queue_error)}")
+            await pdf_service.add_to_catalog(upload["s3_key"], upload["size"], upload["content_hash"])
+            try:
+                await pdf_service.cache_upload_extraction(file, file.filename, upload["content_hash"])
+            except Exception as extraction_error:
+                logger.warning(f"Error caching extracted text for {file.filename}: {str(extraction_error)}")
+            return PDFResponse(
+                filename=file.filename,
+                message="PDF processed successfully",
+                success=True,
+                s3_url=upload["s3_url"]
+            )
         
         return PDFResponse(
             filename=file.filename,
-            message="PDF processed successfully",
+            message="PDF uploaded; processing queued",
             success=True,
-            s3_url=s3_url
+            s3_url=upload["s3_url"],
+            job_id=job_id
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF: {str(e)}")
         return PDFResponse(
@@ -63,42 +65,178 @@ async def upload_pdf(file: UploadFile = File(...)):
             error=str(e)
         )
 
+@router.get("/jobs/{job_id}", response_model=IngestJobStatus)
+async def get_ingest_job(job_id: str):
+    """Get the status of an ingestion job, with the progress of each stage."""
+    job = await ingest_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestJobStatus(**job)
+
+async def _ndjson(results, archive=None):
+    try:
+        async for result in results:
+            yield json.dumps(result) + "\n"
+    finally:
+        if archive is not None:
+            archive.close()
+
+@router.post("/batch")
+async def ingest_batch(request: Request):
+    """Ingest every PDF in a zip or tar archive sent as the request body.
+
+    Streams one JSON line per file as it finishes (status ingested, duplicate, skipped
+    or failed), then a line with the batch summary and throughput.
+    """
+    # Zip keeps its index at the end, so spool the body (to disk once it is large) before reading it
+    archive = tempfile.SpooledTemporaryFile(max_size=settings.S3_MULTIPART_PART_SIZE)
+    try:
+        async for chunk in request.stream():
+            archive.write(chunk)
+        kind = archive_kind(archive)
+    except Exception:
+        archive.close()
+        raise
+    if kind is None:
+        archive.close()
+        raise HTTPException(status_code=400, detail="Expected a zip or tar archive")
+    return StreamingResponse(
+        _ndjson(batch_ingestor.ingest_archive(archive, kind), archive),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/batch/s3")
+async def ingest_batch_s3(request: BatchS3Request):
+    """Extract and index PDFs already uploaded under pdfs/. Streams results like /batch."""
+    if not request.keys:
+        raise HTTPException(status_code=400, detail="No keys given")
+    if len(request.keys) > settings.BATCH_INGEST_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_INGEST_MAX_FILES} keys per batch")
+    return StreamingResponse(_ndjson(batch_ingestor.ingest_s3_keys(request.keys)), media_type="application/x-ndjson")
+
+def _expands_url(expand: Optional[str]) -> bool:
+    """Whether a comma-separated expand parameter asks for signed download URLs."""
+    return bool(expand) and "url" in expand.split(",")
+
 @router.get("/list", response_model=List[PDFListItem])
-async def list_pdfs():
-    """List all processed PDFs."""
+async def list_pdfs(expand: Optional[str] = None):
+    """List all processed PDFs. Pass expand=url to include signed download URLs."""
     try:
-        # Get list of PDFs from S3
-        pdf_files = await pdf_service.list_pdfs()
+        # Get list of PDFs from the catalog
+        pdf_files = await pdf_service.list_pdfs(with_urls=_expands_url(expand))
         return pdf_files
     except Exception as e:
         logger.error(f"Error listing PDFs: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/catalog", response_model=PDFCatalogPage)
+async def list_pdfs_page(
+    limit: int = Query(settings.CATALOG_PAGE_SIZE, ge=1, le=settings.CATALOG_PAGE_SIZE_MAX),
+    cursor: str = None,
+    expand: Optional[str] = None
+):
+    """List processed PDFs newest first, one page at a time."""
+    try:
+        items, next_cursor = await pdf_service.list_pdfs_page(limit, cursor, with_urls=_expands_url(expand))
+        return PDFCatalogPage(items=items, next_cursor=next_cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    except Exception as e:
+        logger.error(f"Error listing PDF catalog: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/url", response_model=PDFURLResponse)
+async def get_pdf_url(filename: str):
+    """Get a signed download URL for a PDF."""
+    try:
+        metadata = await pdf_service.get_pdf_metadata(filename, with_url=True)
+        if not metadata:
+            raise HTTPException(status_code=404, detail="PDF not found")
+        return PDFURLResponse(
+            filename=metadata['filename'],
+            url=metadata['url'],
+            expires_at=metadata['url_expires_at']
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error signing PDF URL: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _parse_range(value: str) -> Tuple[int, Optional[int]]:
+    """Parse "10-20", "10-" or "10" into (start, end or None)."""
+    start, sep, end = value.partition("-")
+    if not sep:
+        return int(start), int(start)
+    return int(start), int(end) if end else None
+
+async def _stream_text_range(filename: str, pages: Optional[Tuple[int, Optional[int]]],
+                             byte_range: Optional[Tuple[int, Optional[int]]]) -> StreamingResponse:
+    """Stream part of a PDF's text straight from the stored page text."""
+    try:
+        text_range = await pdf_service.get_text_range(filename, pages=pages, byte_range=byte_range)
+    except ValueError as e:
+        raise HTTPException(status_code=416, detail=str(e))
+    if not text_range:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    headers = {
+        "X-Total-Pages": str(text_range["total_pages"]),
+        "X-Total-Bytes": str(text_range["total_bytes"]),
+        "X-Byte-Range": f"{text_range['start']}-{text_range['end'] - 1}"
+    }
+    if pages:
+        headers["X-Page-Range"] = f"{text_range['first_page']}-{text_range['last_page']}"
+        if text_range["last_page"] < text_range["total_pages"]:
+            headers["X-Next-Page"] = str(text_range["last_page"] + 1)
+    elif text_range["end"] < text_range["total_bytes"]:
+        headers["X-Next-Byte"] = str(text_range["end"])
+
+    return StreamingResponse(
+        extraction_cache.iter_text(text_range["content_hash"], text_range["start"], text_range["end"]),
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
 @router.get("/r")
-async def get_pdf_content(filename: str):
-    """Get the content of a processed PDF."""
+async def get_pdf_content(
+    filename: str,
+    pages: Optional[str] = Query(None, description="1-based page range, e.g. 10-20 or 10-"),
+    byte_range: Optional[str] = Query(None, alias="bytes", description="Byte range of the text, e.g. 0-65535")
+):
+    """Get the content of a processed PDF. With pages or bytes, stream just that part as plain text."""
     try:
-        # First, try to get the PDF metadata to get the S3 URL
-        pdfs = await pdf_service.list_pdfs()
-        s3_url = None
-        
-        # Find the PDF in the list and get its S3 URL
-        for pdf in pdfs:
-            if pdf.get('filename') == f"pdfs/{filename}" or pdf.get('filename') == filename:
-                s3_url = pdf.get('url')
-                break
-        
-        if s3_url:
-            logger.info(f"Found S3 URL for {filename}: {s3_url}")
-        else:
-            logger.warning(f"No S3 URL found for {filename}")
+        if pages or byte_range:
+            try:
+                page_span = _parse_range(pages) if pages else None
+                byte_span = _parse_range(byte_range) if byte_range else None
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid range")
+            return await _stream_text_range(filename, page_span, byte_span)
         
-        # Get the PDF content using the S3 URL if available
-        pdf_content = await pdf_service.get_pdf_content(filename, s3_url=s3_url)
+        # A stored extraction answers without touching S3, so don't sign a URL for it
+        pdf_content = None
+        try:
+            pdf_content = await extraction_cache.get_by_filename(filename)
+        except Exception as redis_error:
+            logger.warning(f"Redis error: {str(redis_error)}")
+
         if not pdf_content:
-            # Try with 'pdfs/' prefix
-            pdf_content = await pdf_service.get_pdf_content(f"pdfs/{filename}", s3_url=s3_url)
-            
+            # Look up the PDF in the catalog to get the S3 URL to download it from
+            metadata = await pdf_service.get_pdf_metadata(filename, with_url=True)
+            s3_url = metadata.get('url') if metadata else None
+
+            if s3_url:
+                logger.info(f"Found S3 URL for {filename}: {s3_url}")
+            else:
+                logger.warning(f"No S3 URL found for {filename}")
+
+            # Get the PDF content using the S3 URL if available
+            pdf_content = await pdf_service.get_pdf_content(filename, s3_url=s3_url)
+            if not pdf_content:
+                # Try with 'pdfs/' prefix
+                pdf_content = await pdf_service.get_pdf_content(f"pdfs/{filename}", s3_url=s3_url)
+
         if not pdf_content:
             raise HTTPException(status_code=404, detail="PDF not found")
         
@@ -114,16 +252,10 @@ async def get_pdf_content(filename: str):
 async def check_pdf_exists(filename: str):
     """Check if a PDF exists."""
     try:
-        # First, check if the PDF is in the list
-        pdfs = await pdf_service.list_pdfs()
-        found = False
-        s3_url = None
-        
-        for pdf in pdfs:
-            if pdf.get('filename') == filename or pdf.get('filename').endswith(f"/{filename}"):
-                found = True
-                s3_url = pdf.get('url')
-                break
+        # First, check if the PDF is in the catalog
+        metadata = await pdf_service.get_pdf_metadata(filename, with_url=True)
+        found = metadata is not None
+        s3_url = metadata.get('url') if metadata else None
         
         # Then, check if the file exists locally
         local_exists = False
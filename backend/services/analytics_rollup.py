@@ -0,0 +1,165 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from config import get_settings
+from redis_client import redis_client
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Bucket width in seconds of each granularity
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+COUNTERS = ("count", "tokens")  # Integer metrics, added with HINCRBY
+FLOAT_COUNTERS = ("cost", "latency_sum")  # Float metrics, added with HINCRBYFLOAT
+
+class AnalyticsRollup:
+    """Per-minute, per-hour and per-day usage rollups.
+
+    Each bucket is one hash, rollup:<granularity>:<bucket start>, that expires after the
+    granularity's retention window. Its fields are "<scope>|<metric>", where the scope is
+    "all", "model:<model>", "doc:<filename>" or "type:<event type>" and the metrics are
+    count, tokens, cost, latency_sum and a latency histogram (latency_le_<bound> counts
+    the events slower than the previous bound and no slower than this one). Every key a
+    query needs follows from its time range, so reads never scan the keyspace.
+    """
+
+    def __init__(self):
+        self.retention = {
+            "minute": settings.ANALYTICS_MINUTE_RETENTION,
+            "hour": settings.ANALYTICS_HOUR_RETENTION,
+            "day": settings.ANALYTICS_DAY_RETENTION
+        }
+        self.latency_bounds = sorted(settings.ANALYTICS_LATENCY_BUCKETS)
+
+    @staticmethod
+    def bucket_start(granularity: str, timestamp: float) -> int:
+        width = GRANULARITIES[granularity]
+        return int(timestamp // width * width)
+
+    @staticmethod
+    def _key(granularity: str, bucket: int) -> str:
+        return f"rollup:{granularity}:{bucket}"
+
+    def _latency_field(self, latency: float) -> str:
+        for bound in self.latency_bounds:
+            if latency <= bound:
+                return f"latency_le_{bound:g}"
+        return "latency_le_inf"
+
+    def histogram_fields(self) -> List[str]:
+        return [f"latency_le_{bound:g}" for bound in self.latency_bounds] + ["latency_le_inf"]
+
+    def increments(self, event: Dict[str, str], timestamp: float) -> Dict[Tuple[str, str], float]:
+        """Compute the (key, field) increments one event contributes to every rollup."""
+        metrics = {
+            "count": 1,
+            "tokens": int(float(event.get("tokens") or 0)),
+            "cost": float(event.get("cost") or 0)
+        }
+        if event.get("latency"):
+            latency = float(event["latency"])
+            metrics["latency_sum"] = latency
+            metrics[self._latency_field(latency)] = 1
+
+        scopes = ["all", f"type:{event.get('event_type')}"]
+        if event.get("model"):
+            scopes.append(f"model:{event['model']}")
+        if event.get("filename"):
+            scopes.append(f"doc:{event['filename']}")
+
+        result = {}
+        for granularity in GRANULARITIES:
+            key = self._key(granularity, self.bucket_start(granularity, timestamp))
+            for scope in scopes:
+                for metric, value in metrics.items():
+                    result[(key, f"{scope}|{metric}")] = value
+        return result
+
+    def script_args(self, increments: Dict[Tuple[str, str], float]) -> Tuple[List[str], List[Any]]:
+        """Encode summed increments for a Lua script: the touched bucket keys, and the args
+        for each bucket in turn: its retention, its number of fields, then an op ("f" for
+        HINCRBYFLOAT, "i" for HINCRBY), field and value per field."""
+        buckets = defaultdict(list)
+        for (key, field), value in increments.items():
+            if field.rpartition("|")[2] in FLOAT_COUNTERS:
+                buckets[key].extend(("f", field, value))
+            else:
+                buckets[key].extend(("i", field, int(value)))
+        args = []
+        for key, fields in buckets.items():
+            args.extend((self.retention[key.split(":")[1]], len(fields) // 3, *fields))
+        return list(buckets), args
+
+    def _bucket_range(self, granularity: str, start: float, end: float) -> List[int]:
+        width = GRANULARITIES[granularity]
+        first, last = self.bucket_start(granularity, start), self.bucket_start(granularity, end)
+        count = (last - first) // width + 1
+        if count > settings.ANALYTICS_MAX_BUCKETS:
+            raise ValueError(
+                f"Range covers {count} {granularity} buckets; the maximum is {settings.ANALYTICS_MAX_BUCKETS}"
+            )
+        return list(range(first, last + 1, width))
+
+    def _summarize(self, values: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        """Turn raw metric values into a result row."""
+        count = int(values.get("count") or 0)
+        latency_sum = float(values.get("latency_sum") or 0)
+        histogram = {
+            field[len("latency_le_"):]: int(values.get(field) or 0) for field in self.histogram_fields()
+        }
+        timed = sum(histogram.values())
+        return {
+            "count": count,
+            "tokens": int(values.get("tokens") or 0),
+            "cost": round(float(values.get("cost") or 0), 6),
+            "avg_latency": round(latency_sum / timed, 3) if timed else None,
+            "latency_histogram": histogram
+        }
+
+    async def query(self, granularity: str, start: float, end: float, scope: str = "all") -> Dict[str, Any]:
+        """Get one scope's metrics for every bucket in [start, end], plus their totals."""
+        buckets = self._bucket_range(granularity, start, end)
+        metrics = list(COUNTERS + FLOAT_COUNTERS) + self.histogram_fields()
+        fields = [f"{scope}|{metric}" for metric in metrics]
+
+        pipe = await redis_client.pipeline()
+        for bucket in buckets:
+            pipe.hmget(self._key(granularity, bucket), fields)
+        rows = await pipe.execute()
+
+        totals = defaultdict(float)
+        series = []
+        for bucket, row in zip(buckets, rows):
+            values = dict(zip(metrics, row))
+            for metric, value in values.items():
+                totals[metric] += float(value or 0)
+            series.append({"bucket_start": bucket, **self._summarize(values)})
+        return {
+            "granularity": granularity,
+            "scope": scope,
+            "buckets": series,
+            "totals": self._summarize(totals)
+        }
+
+    async def breakdown(self, granularity: str, start: float, end: float, dimension: str) -> Dict[str, Any]:
+        """Get totals over [start, end] for every model, document or event type seen in it."""
+        buckets = self._bucket_range(granularity, start, end)
+        pipe = await redis_client.pipeline()
+        for bucket in buckets:
+            pipe.hgetall(self._key(granularity, bucket))
+
+        prefix = f"{dimension}:"
+        totals = defaultdict(lambda: defaultdict(float))
+        for fields in await pipe.execute():
+            for field, value in fields.items():
+                scope, _, metric = field.rpartition("|")
+                if scope.startswith(prefix):
+                    totals[scope[len(prefix):]][metric] += float(value)
+        return {
+            "granularity": granularity,
+            "dimension": dimension,
+            "items": {name: self._summarize(values) for name, values in totals.items()}
+        }
+
+# Create a singleton instance
+analytics_rollup = AnalyticsRollup()
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import logging
+import posixpath
+import tarfile
+import time
+import zipfile
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from config import get_settings
+from services.extraction_cache import extraction_cache
+from services.pdf_catalog import pdf_catalog
+from services.pdf_service import pdf_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# A file to ingest: its name and a coroutine function that fetches its bytes
+Item = Tuple[str, Callable[[], Awaitable[bytes]]]
+# Stores fetched bytes: (name, data, content_hash)
+StoreFn = Callable[[str, bytes, str], Awaitable[Any]]
+
+class SkipFile(Exception):
+    """A file in a batch that is deliberately not ingested."""
+
+def archive_kind(fileobj: BinaryIO) -> Optional[str]:
+    """Tell whether a seekable file is a zip or a tar archive (optionally compressed)."""
+    try:
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            return "zip"
+        fileobj.seek(0)
+        with tarfile.open(fileobj=fileobj, mode="r:*"):
+            return "tar"
+    except tarfile.TarError:
+        return None
+    finally:
+        fileobj.seek(0)
+
+def _archive_members(fileobj: BinaryIO, kind: str) -> Iterator[Tuple[str, int, Callable[[], bytes]]]:
+    """Yield (path, size, read) for each regular file in an archive, in archive order."""
+    if kind == "zip":
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, functools.partial(archive.read, info)
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, member.size, lambda member=member: archive.extractfile(member).read()
+
+def _pdf_name(path: str) -> Optional[str]:
+    """Map an archive path to the filename it is stored under, or None if it isn't a PDF to ingest."""
+    name = posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+    if name.startswith("pdfs/"):
+        name = name[len("pdfs/"):]
+    basename = posixpath.basename(name)
+    # Skip paths escaping the archive root and the resource forks macOS adds to zips
+    if name.startswith("..") or name.startswith("__MACOSX/") or basename.startswith("._"):
+        return None
+    return name if basename.lower().endswith(".pdf") else None
+
+class BatchIngestor:
+    """Ingests many PDFs at once with a bounded pool of workers.
+
+    Files are fed through a queue of at most `concurrency` entries, so only a few are held
+    in memory at a time. Files whose content already appeared earlier in the batch are
+    reported as duplicates and not stored again; content extracted by an earlier upload
+    reuses the stored extraction. Results are yielded per file as they finish, followed by
+    a summary with the batch throughput.
+    """
+
+    def __init__(self):
+        self.concurrency = settings.BATCH_INGEST_CONCURRENCY
+        self.max_files = settings.BATCH_INGEST_MAX_FILES
+
+    async def _ingest_one(self, name: str, fetch: Callable[[], Awaitable[bytes]], seen: Dict[str, str],
+                          store: StoreFn) -> Dict[str, Any]:
+        started = time.monotonic()
+        result: Dict[str, Any] = {"filename": name}
+        try:
+            data = await fetch()
+            if len(data) > settings.MAX_FILE_SIZE:
+                raise SkipFile(f"File is larger than {settings.MAX_FILE_SIZE} bytes")
+            content_hash = extraction_cache.content_hash(data)
+            result["content_hash"] = content_hash
+            if content_hash in seen:
+                result.update(status="duplicate", duplicate_of=seen[content_hash])
+            else:
+                seen[content_hash] = name
+                result["cached"] = await extraction_cache.get_page_count(content_hash) is not None
+                await store(name, data, content_hash)
+                result["status"] = "ingested"
+        except SkipFile as e:
+            result.update(status="skipped", error=str(e))
+        except Exception as e:
+            logger.error(f"Error ingesting {name}: {str(e)}")
+            result.update(status="failed", error=str(e))
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    async def _run(self, items: AsyncIterator[Item], store: StoreFn) -> AsyncIterator[Dict[str, Any]]:
+        """Ingest items with `concurrency` workers, yielding each result as it finishes."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        seen: Dict[str, str] = {}
+        counts = Counter()
+        started = time.monotonic()
+
+        async def produce():
+            try:
+                async for item in items:
+                    await queue.put(item)
+            except Exception as e:
+                logger.error(f"Error reading batch: {str(e)}")
+                await results.put({"filename": None, "status": "failed", "error": f"Error reading batch: {str(e)}"})
+            finally:
+                for _ in range(self.concurrency):
+                    await queue.put(None)
+
+        async def work():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await results.put(await self._ingest_one(*item, seen, store))
+
+        tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        finished = asyncio.gather(*tasks)
+        finished.add_done_callback(lambda _: results.put_nowait(None))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                counts[result["status"]] += 1
+                yield result
+        finally:
+            # Stops the pool if the client goes away mid-batch
+            for task in tasks:
+                task.cancel()
+
+        seconds = time.monotonic() - started
+        files = sum(counts.values())
+        yield {"summary": {
+            "files": files,
+            **{status: counts[status] for status in ("ingested", "duplicate", "skipped", "failed")},
+            "seconds": round(seconds, 3),
+            "files_per_sec": round(files / seconds, 2) if seconds else None
+        }}
+
+    async def _archive_items(self, fileobj: BinaryIO, kind: str) -> AsyncIterator[Item]:
+        """Read the PDFs of an archive one at a time, off the event loop."""
+        loop = asyncio.get_running_loop()
+        members = _archive_members(fileobj, kind)
+        count = 0
+        while True:
+            member = await loop.run_in_executor(None, next, members, None)
+            if member is None:
+                return
+            path, size, read = member
+            name = _pdf_name(path)
+            if name is None:
+                continue
+            count += 1
+            if count > self.max_files:
+                raise ValueError(f"Archive has more than {self.max_files} PDFs")
+            if size > settings.MAX_FILE_SIZE:
+                yield name, functools.partial(_raise, SkipFile(f"File is larger than {settings.MAX_FILE_SIZE} bytes"))
+                continue
+            data = await loop.run_in_executor(None, read)
+            yield name, functools.partial(_value, data)
+
+    async def ingest_archive(self, fileobj: BinaryIO, kind: str) -> AsyncIterator[Dict[str, Any]]:
+        """Upload, extract and index every PDF in a zip or tar archive."""
+        async def store(name: str, data: bytes, content_hash: str):
+            await pdf_service.process_pdf(data, name, content_hash=content_hash)
+
+        async for result in self._run(self._archive_items(fileobj, kind), store):
+            yield result
+
+    async def ingest_s3_keys(self, keys: List[str]) -> AsyncIterator[Dict[str, Any]]:
+        """Extract and index PDFs that are already in S3 under pdfs/."""
+        async def items() -> AsyncIterator[Item]:
+            for key in keys:
+                if not key.startswith(pdf_catalog.PREFIX) or not key.lower().endswith(".pdf"):
+                    yield key, functools.partial(_raise, SkipFile(f"Not a PDF under {pdf_catalog.PREFIX}"))
+                else:
+                    yield key[len(pdf_catalog.PREFIX):], functools.partial(_download, key)
+
+        async def store(name: str, data: bytes, content_hash: str):
+            await pdf_service.extract_and_cache(data, name, content_hash=content_hash)
+            await pdf_catalog.add(pdf_catalog.s3_key(name), len(data), content_hash)
+
+        async for result in self._run(items(), store):
+            yield result
+
+async def _value(data: bytes) -> bytes:
+    return data
+
+async def _raise(error: Exception) -> bytes:
+    raise error
+
+async def _download(s3_key: str) -> bytes:
+    data = await pdf_service.download_from_s3(s3_key)
+    if data is None:
+        raise RuntimeError(f"{s3_key} could not be downloaded from S3")
+    return data
+
+# Create a singleton instance
+batch_ingestor = BatchIngestor()
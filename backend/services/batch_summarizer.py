@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import get_settings
+from models.llm_model import SummaryResponse
+from models.pdf_model import SummaryRequest
+from redis_client import redis_client
+from services.llm_providers import RateLimitError
+from services.model_router import model_router
+from services.summarizer import CompletionFn
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# summarize(request, complete) -> SummaryResponse, the same path /summarize takes
+SummarizeFn = Callable[[SummaryRequest, CompletionFn], Awaitable[SummaryResponse]]
+
+class ProviderLimits:
+    """Per-provider concurrency and request pacing for batch work.
+
+    Each model gets its own semaphore and a minimum spacing between request starts from
+    its requests-per-minute budget, so a batch stays under the provider's rate limit
+    instead of bursting into it. If the provider rate-limits anyway, every call to it
+    waits out the Retry-After time (or an exponential backoff) and the call is retried.
+    """
+
+    def __init__(self, concurrency: Dict[str, int], rpm: Dict[str, int]):
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = defaultdict(float)
+        self._paused_until: Dict[str, float] = defaultdict(float)
+        self.rate_limited: Dict[str, int] = defaultdict(int)
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(
+                self.concurrency.get(model, settings.BATCH_DEFAULT_CONCURRENCY)
+            )
+        return self._semaphores[model]
+
+    async def _pace(self, model: str):
+        """Wait for this call's start slot, and for any rate-limit pause to end."""
+        rpm = self.rpm.get(model)
+        now = time.monotonic()
+        start = max(now, self._next_start[model])
+        self._next_start[model] = start + (60 / rpm if rpm else 0)
+        if start > now:
+            await asyncio.sleep(start - now)
+        while self._paused_until[model] > time.monotonic():
+            await asyncio.sleep(self._paused_until[model] - time.monotonic())
+
+    async def run(self, model: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run one call to a model within its limits."""
+        attempts = 0
+        async with self._semaphore(model):
+            while True:
+                await self._pace(model)
+                try:
+                    return await call()
+                except RateLimitError as e:
+                    attempts += 1
+                    self.rate_limited[model] += 1
+                    if attempts > settings.BATCH_RATE_LIMIT_RETRIES:
+                        raise
+                    backoff = e.retry_after or settings.BATCH_RATE_LIMIT_BACKOFF * 2 ** (attempts - 1)
+                    self._paused_until[model] = max(self._paused_until[model], time.monotonic() + backoff)
+                    logger.warning(f"Model {model} rate limited the batch; pausing it for {backoff:.1f}s")
+
+class BatchSummarizer:
+    """Runs batches of summary requests in the background.
+
+    A batch is summarized by BATCH_SUMMARY_CONCURRENCY workers, with every LLM call gated
+    by the shared ProviderLimits. Each result is written to Redis as soon as it finishes,
+    along with running totals of the tokens and cost spent, so progress can be polled from
+    any instance. Identical requests in a batch are summarized once; their tokens and cost
+    count once. Batches run in the process that accepted them and don't survive a restart.
+    """
+
+    def __init__(self):
+        self.limits = ProviderLimits(settings.BATCH_PROVIDER_CONCURRENCY, settings.BATCH_PROVIDER_RPM)
+        self.ttl = settings.BATCH_SUMMARY_TTL
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _batch_key(batch_id: str) -> str:
+        return f"sumbatch:{batch_id}"
+
+    @staticmethod
+    def _results_key(batch_id: str) -> str:
+        return f"sumbatch:{batch_id}:results"
+
+    async def submit(self, requests: List[SummaryRequest], summarize: SummarizeFn) -> str:
+        """Store a new batch and start summarizing it. Returns the batch id."""
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        pipe = await redis_client.pipeline()
+        pipe.hset(self._batch_key(batch_id), mapping={
+            "batch_id": batch_id,
+            "status": "running",
+            "total": len(requests),
+            "completed": 0,
+            "failed": 0,
+            "cached": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cost": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        pipe.expire(self._batch_key(batch_id), self.ttl)
+        await pipe.execute()
+
+        task = asyncio.create_task(self._run(batch_id, requests, summarize))
+        self._tasks[batch_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(batch_id, None))
+        logger.info(f"Started summary batch {batch_id} with {len(requests)} requests")
+        return batch_id
+
+    async def _summarize_one(self, request: SummaryRequest, summarize: SummarizeFn) -> Dict[str, Any]:
+        async def complete(prompt: str, max_tokens: int) -> Dict:
+            return await model_router.complete(prompt, request.model, max_tokens, limits=self.limits)
+
+        try:
+            response = await summarize(request, complete)
+            return {"status": "done", **response.model_dump()}
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            logger.error(f"Error summarizing {request.filename} in batch: {error}")
+            return {"status": "failed", "filename": request.filename, "error": error}
+
+    async def _record(self, batch_id: str, indexes: List[int], result: Dict[str, Any]):
+        """Store one result under every index it answers and add it to the batch totals."""
+        key = self._batch_key(batch_id)
+        pipe = await redis_client.pipeline()
+        pipe.hset(self._results_key(batch_id), mapping={
+            str(index): json.dumps({"index": index, **result}) for index in indexes
+        })
+        pipe.expire(self._results_key(batch_id), self.ttl)
+        if result["status"] == "done":
+            pipe.hincrby(key, "completed", len(indexes))
+            if result["cached"]:
+                pipe.hincrby(key, "cached", len(indexes))
+            else:
+                pipe.hincrby(key, "input_tokens", result["input_tokens"])
+                pipe.hincrby(key, "output_tokens", result["output_tokens"])
+                pipe.hincrbyfloat(key, "cost", result["cost"])
+        else:
+            pipe.hincrby(key, "failed", len(indexes))
+        pipe.hset(key, "updated_at", time.time())
+        await pipe.execute()
+
+    async def _run(self, batch_id: str, requests: List[SummaryRequest], summarize: SummarizeFn):
+        groups: Dict[Tuple, List[int]] = defaultdict(list)
+        for index, request in enumerate(requests):
+            groups[(request.filename, request.model, request.max_length, request.s3_url)].append(index)
+        pending = list(groups.values())
+
+        async def work():
+            while pending:
+                indexes = pending.pop(0)
+                result = await self._summarize_one(requests[indexes[0]], summarize)
+                await self._record(batch_id, indexes, result)
+
+        started = time.monotonic()
+        status = "done"
+        try:
+            await asyncio.gather(*[work() for _ in range(min(settings.BATCH_SUMMARY_CONCURRENCY, len(pending)))])
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "failed"
+            logger.error(f"Error running summary batch {batch_id}: {str(e)}")
+        finally:
+            try:
+                await redis_client.hset(self._batch_key(batch_id), {"status": status, "updated_at": time.time()})
+            except Exception as e:
+                logger.error(f"Error updating summary batch {batch_id}: {str(e)}")
+            logger.info(f"Summary batch {batch_id} {status} after {time.monotonic() - started:.1f}s")
+
+    async def get_batch(self, batch_id: str, with_results: bool = True) -> Optional[Dict[str, Any]]:
+        """Get a batch's progress and totals, with the results finished so far."""
+        batch = await redis_client.hgetall(self._batch_key(batch_id))
+        if not batch:
+            return None
+        for field in ("total", "completed", "failed", "cached", "input_tokens", "output_tokens"):
+            batch[field] = int(batch[field])
+        for field in ("cost", "created_at", "updated_at"):
+            batch[field] = float(batch[field])
+        if with_results:
+            results = await redis_client.hgetall(self._results_key(batch_id))
+            batch["results"] = sorted((json.loads(result) for result in results.values()), key=lambda r: r["index"])
+        return batch
+
+    def stop(self):
+        """Cancel the batches running in this process."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+# Create a singleton instance
+batch_summarizer = BatchSummarizer()
@@ -0,0 +1,80 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Very common English words carry no ranking signal and only bloat the postings
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its
+of on or she so that the their them then there these they this to was we were what
+when where which who why will with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """Inverted index over a document's chunks with Okapi BM25 scoring."""
+
+    def __init__(self, postings: Dict[str, List[int]], doc_lengths: List[int], k1: float = 1.5, b: float = 0.75):
+        # postings maps term -> flat [chunk_index, term_frequency, chunk_index, term_frequency, ...]
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, chunks: List[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Build an index over a list of chunks."""
+        postings: Dict[str, List[int]] = {}
+        doc_lengths = []
+        for chunk_index, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                postings.setdefault(term, []).extend((chunk_index, frequency))
+        return cls(postings, doc_lengths, k1, b)
+
+    def _idf(self, term: str) -> float:
+        document_frequency = len(self.postings.get(term, ())) // 2
+        num_docs = len(self.doc_lengths)
+        return math.log(1 + (num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query: str, top_k: int = None) -> List[Tuple[int, float]]:
+        """Score chunks against a query. Returns (chunk_index, score) pairs, best first."""
+        scores: Dict[int, float] = {}
+        avg_doc_length = self.avg_doc_length or 1.0
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for i in range(0, len(postings), 2):
+                chunk_index, frequency = postings[i], postings[i + 1]
+                length_norm = 1 - self.b + self.b * self.doc_lengths[chunk_index] / avg_doc_length
+                scores[chunk_index] = scores.get(chunk_index, 0.0) + idf * (
+                    frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                )
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k] if top_k else ranked
+
+    def to_json(self) -> str:
+        """Serialize the index for storage."""
+        return json.dumps({
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "BM25Index":
+        """Load an index serialized with to_json."""
+        payload = json.loads(data)
+        return cls(payload["postings"], payload["doc_lengths"], payload["k1"], payload["b"])
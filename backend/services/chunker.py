@@ -0,0 +1,138 @@
+import re
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Tuple
+from config import get_settings
+from services.token_counter import CountFn, approx_tokens, token_counter
+
+settings = get_settings()
+
+WORD_RE = re.compile(r"\S+")
+# Where a sentence ends: terminal punctuation (with any closing quotes or brackets) before
+# whitespace, or a blank line
+SENTENCE_END_RE = re.compile(r"[.!?][\"'”’)\]]*(?=\s)|\n[ \t]*\n")
+
+def get_tokenizer(name: str = None) -> CountFn:
+    """Get a token counter by name: "approx" or "tiktoken" (TIKTOKEN_ENCODING, needs the tiktoken package)."""
+    name = name or settings.CHUNK_TOKENIZER
+    if name == "approx":
+        return approx_tokens
+    if name == "tiktoken":
+        return token_counter.counter(settings.TIKTOKEN_ENCODING)
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+def page_starts(pages: List[str]) -> List[int]:
+    """Character offsets of each page in the text PDFService._join_pages builds from them."""
+    starts = []
+    offset = 0
+    for page in pages:
+        starts.append(offset)
+        offset += len(page) + 1  # Each page is followed by a newline
+    return starts
+
+def _sentences(content: str, starts: List[int]) -> Iterator[Tuple[int, int]]:
+    """Yield the (start, end) of each sentence without surrounding whitespace. Page starts
+    are always sentence boundaries, so no sentence crosses a page."""
+    bounds = [start for start in starts if 0 < start < len(content)] + [len(content)]
+    page_start = 0
+    for page_end in bounds:
+        position = page_start
+        ends = [match.end() for match in SENTENCE_END_RE.finditer(content, page_start, page_end)]
+        for end in ends + [page_end]:
+            segment = content[position:end]
+            stripped = segment.strip()
+            if stripped:
+                start = position + len(segment) - len(segment.lstrip())
+                yield start, start + len(stripped)
+            position = end
+        page_start = page_end
+
+def _pieces(content: str, starts: List[int], max_tokens: int,
+            count_tokens: CountFn) -> Iterator[Tuple[int, int, int]]:
+    """Yield (start, end, tokens) of each sentence, splitting sentences over max_tokens on
+    word boundaries. A single word over max_tokens is still yielded whole."""
+    for start, end in _sentences(content, starts):
+        tokens = count_tokens(content[start:end])
+        if tokens <= max_tokens:
+            yield start, end, tokens
+            continue
+        piece_start = piece_end = None
+        piece_tokens = 0
+        for match in WORD_RE.finditer(content, start, end):
+            if piece_start is None:
+                piece_start, piece_end, piece_tokens = match.start(), match.end(), count_tokens(match.group())
+                continue
+            # Counting a word with the space before it errs high, so only when the sum goes
+            # over budget is the whole piece counted, and closed if it really doesn't fit
+            piece_tokens += count_tokens(content[piece_end:match.end()])
+            if piece_tokens > max_tokens:
+                piece_tokens = count_tokens(content[piece_start:match.end()])
+                if piece_tokens > max_tokens:
+                    yield piece_start, piece_end, count_tokens(content[piece_start:piece_end])
+                    piece_start, piece_tokens = match.start(), count_tokens(match.group())
+            piece_end = match.end()
+        if piece_start is not None:
+            yield piece_start, piece_end, piece_tokens
+
+def chunk_spans(content: str, max_tokens: int = None, overlap_tokens: int = None,
+                starts: Optional[List[int]] = None, count_tokens: CountFn = None) -> List[Tuple[int, int]]:
+    """Split content into chunks of at most max_tokens, ending on sentence boundaries.
+
+    Sentences are packed into a chunk until the next one doesn't fit. Each chunk then starts
+    with the last sentences of the previous one, up to overlap_tokens, so text near a
+    boundary is seen whole by at least one chunk. starts are the page offsets from
+    page_starts(); sentences never cross them. Defaults come from the CHUNK_* settings.
+
+    Returns (start, end) character offsets into content, in one pass over the sentences. A
+    chunk's text is the words in its span joined by single spaces, so storing the spans is
+    enough to rebuild the chunks.
+    """
+    max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    count_tokens = count_tokens or get_tokenizer()
+
+    spans = []
+    current: List[Tuple[int, int, int]] = []  # (start, end, tokens) of the sentences in the open chunk
+    current_tokens = 0
+    for piece in _pieces(content, starts or [0], max_tokens, count_tokens):
+        tokens = piece[2]
+        if current and current_tokens + tokens > max_tokens:
+            spans.append((current[0][0], current[-1][1]))
+            # Carry trailing sentences over, as long as the new one still fits after them
+            carried = 0
+            keep = len(current)
+            while keep > 0:
+                sentence_tokens = current[keep - 1][2]
+                if carried + sentence_tokens > overlap_tokens or carried + sentence_tokens + tokens > max_tokens:
+                    break
+                carried += sentence_tokens
+                keep -= 1
+            current = current[keep:]
+            current_tokens = carried
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        spans.append((current[0][0], current[-1][1]))
+    return spans
+
+def chunk_texts(content: str, spans: List[Tuple[int, int]]) -> List[str]:
+    """Rebuild chunk texts from their spans."""
+    return [" ".join(content[start:end].split()) for start, end in spans]
+
+def chunk_pages(spans: List[Tuple[int, int]], starts: List[int]) -> List[Tuple[int, int]]:
+    """The first and last page (1-based) each chunk's span covers."""
+    if not starts:
+        return [(1, 1) for _ in spans]
+    return [(bisect_right(starts, start), bisect_right(starts, max(start, end - 1))) for start, end in spans]
+
+def without_overlap(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Trim each span to start where the previous one ended, for callers that read the
+    chunks in order and shouldn't see overlapping text twice. Chunks entirely inside the
+    previous one are dropped."""
+    trimmed = []
+    previous_end = 0
+    for start, end in spans:
+        if end > previous_end:
+            trimmed.append((max(start, previous_end), end))
+            previous_end = end
+    return trimmed
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+from config import get_settings
+from redis_client import redis_client
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class EventPublisher:
+    """Fire-and-forget publishing of usage events to the llm_events stream.
+
+    Request handlers only put events on a bounded in-process queue; a background task
+    writes them in batches with one pipelined XADD per event, trimming the stream with
+    MAXLEN ~. When the queue is full or Redis is slow, events are dropped instead of
+    delaying requests.
+    """
+
+    STREAM_NAME = "llm_events"
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENT_QUEUE_SIZE)
+        self.batch_size = settings.EVENT_BATCH_SIZE
+        self.running = False
+        self.stats = {"published": 0, "dropped": 0, "flush_errors": 0}
+        # The batch start() is still collecting; stop() flushes it
+        self._collecting: List[Dict[str, str]] = []
+
+    def publish(self, event_type: str, **fields: Any):
+        """Queue an event without waiting. Fields with a None value are left out."""
+        event = {"event_type": event_type}
+        event.update({key: str(value) for key, value in fields.items() if value is not None})
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    async def _next_batch(self) -> List[Dict[str, str]]:
+        """Wait for an event, then collect more until the batch is full or the flush interval passes."""
+        self._collecting = batch = [await self.queue.get()]
+        deadline = time.monotonic() + settings.EVENT_FLUSH_INTERVAL
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        self._collecting = []
+        return batch
+
+    async def _flush(self, batch: List[Dict[str, str]]):
+        """Write a batch in one round trip, giving up after EVENT_FLUSH_TIMEOUT."""
+        try:
+            pipe = await redis_client.pipeline()
+            for event in batch:
+                pipe.xadd(self.STREAM_NAME, event, maxlen=settings.EVENT_STREAM_MAXLEN, approximate=True)
+            await asyncio.wait_for(pipe.execute(), settings.EVENT_FLUSH_TIMEOUT)
+            self.stats["published"] += len(batch)
+        except Exception as e:
+            self.stats["dropped"] += len(batch)
+            self.stats["flush_errors"] += 1
+            logger.warning(f"Dropped {len(batch)} usage events: {str(e) or type(e).__name__}")
+
+    async def start(self):
+        """Flush queued events until stopped."""
+        self.running = True
+        while self.running:
+            batch = await self._next_batch()
+            # Once stopped, stop() has flushed this batch already
+            if self.running:
+                await self._flush(batch)
+
+    async def stop(self):
+        """Stop publishing, flushing whatever is still queued."""
+        self.running = False
+        batch, self._collecting = list(self._collecting), []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+# Create a singleton instance
+event_publisher = EventPublisher()
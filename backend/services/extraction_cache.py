@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import struct
+import zlib
+import redis.exceptions
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
+from config import get_settings
+from redis_client import redis_client
+from services.chunker import chunk_pages, chunk_spans, chunk_texts, page_starts
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard package not installed. Run: pip install zstandard")
+    return zstandard
+
+# codec name -> (compress, decompress); the codec is recorded per document so either can be read back
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "zstd": (lambda data: _zstd().ZstdCompressor().compress(data),
+             lambda data: _zstd().ZstdDecompressor().decompress(data))
+}
+
+def _pack(values: List[int]) -> bytes:
+    """Pack integers as a little-endian uint64 array."""
+    return struct.pack(f"<{len(values)}Q", *values)
+
+def _unpack(data: bytes) -> Tuple[int, ...]:
+    return struct.unpack(f"<{len(data) // 8}Q", data)
+
+class ExtractionCache:
+    """Content-addressed cache of extracted PDF text, keyed by the SHA-256 of the PDF bytes.
+
+    Each document is stored once, compressed: its UTF-8 text is cut into fixed-size frames
+    that are compressed independently and concatenated under docframes:<version>:<hash>.
+    A hash at doc:<version>:<hash> holds small metadata and offset tables (page starts in
+    the text, frame starts in the compressed blob, chunk spans). Pages and chunks are rebuilt
+    from the text, and a page or byte range only fetches and inflates the frames it covers.
+    """
+
+    def __init__(self):
+        self.version = settings.EXTRACTOR_VERSION
+        self.ttl = settings.EXTRACTION_CACHE_TTL
+        self.codec = settings.DOC_COMPRESSION
+        self.frame_size = settings.DOC_FRAME_SIZE
+
+    @staticmethod
+    def content_hash(pdf_bytes: bytes) -> str:
+        """Compute the cache key for a PDF."""
+        return hashlib.sha256(pdf_bytes).hexdigest()
+
+    @staticmethod
+    def normalize_filename(filename: str) -> str:
+        """Strip the S3 'pdfs/' prefix so both spellings share one entry."""
+        return filename[len("pdfs/"):] if filename.startswith("pdfs/") else filename
+
+    def _doc_key(self, content_hash: str) -> str:
+        # The extractor version is part of the key, so bumping it invalidates every entry
+        return f"doc:{self.version}:{content_hash}"
+
+    def _frames_key(self, content_hash: str) -> str:
+        return f"docframes:{self.version}:{content_hash}"
+
+    def _index_key(self, content_hash: str) -> str:
+        return f"bm25:{self.version}:{content_hash}"
+
+    def _filename_key(self, filename: str) -> str:
+        return f"pdfhash:{self.normalize_filename(filename)}"
+
+    def _legacy_keys(self, content_hash: str) -> List[str]:
+        # JSON entry with content, pages and chunks, plus the uncompressed page text store
+        return [
+            f"extract:{self.version}:{content_hash}",
+            f"pagetext:{self.version}:{content_hash}",
+            f"pageoffsets:{self.version}:{content_hash}"
+        ]
+
+    async def put(self, content_hash: str, content: str, pages: List[str], spans: List[Tuple[int, int]],
+                  token_counts: Optional[Dict[str, int]] = None):
+        """Store an extraction: its text, page boundaries, chunk spans (from services.chunker)
+        and token counts by tokenizer name (from services.token_counter)."""
+        text = content.encode("utf-8")
+        encoded_pages = [(page + "\n").encode("utf-8") for page in pages]
+        page_separator = 1  # Each page is followed by a newline in the text
+        if b"".join(encoded_pages) != text:
+            # The pages don't tile the text (only possible for old entries): keep it as one page
+            encoded_pages = [text]
+            page_separator = 0
+        page_offsets = [0]
+        for page in encoded_pages:
+            page_offsets.append(page_offsets[-1] + len(page))
+
+        compress = CODECS[self.codec][0]
+        frames = [compress(text[i:i + self.frame_size]) for i in range(0, len(text), self.frame_size)]
+        frame_offsets = [0]
+        for frame in frames:
+            frame_offsets.append(frame_offsets[-1] + len(frame))
+
+        meta = {
+            "codec": self.codec,
+            "frame_size": self.frame_size,
+            "text_size": len(text),
+            "page_count": len(encoded_pages),
+            "page_separator": page_separator,
+            "chunk_count": len(spans),
+            "token_counts": token_counts or {}
+        }
+        pipe = await redis_client.pipeline(binary=True)
+        pipe.set(self._frames_key(content_hash), b"".join(frames), ex=self.ttl)
+        # Queued last, so a present doc hash means the frames are there too
+        pipe.hset(self._doc_key(content_hash), mapping={
+            "meta": json.dumps(meta),
+            "pages": _pack(page_offsets),
+            "frames": _pack(frame_offsets),
+            "chunks": _pack([offset for span in spans for offset in span])
+        })
+        pipe.expire(self._doc_key(content_hash), self.ttl)
+        await pipe.execute()
+
+    async def _read_fields(self, content_hash: str, *fields: str) -> Optional[Dict[str, Any]]:
+        """Read some fields of a document's hash; meta is always included and decoded."""
+        values = await redis_client.hmget_bytes(self._doc_key(content_hash), ["meta", *fields])
+        if values[0] is None:
+            return None
+        result = dict(zip(fields, values[1:]))
+        result["meta"] = json.loads(values[0])
+        return result
+
+    async def _read_text(self, content_hash: str, meta: Dict[str, Any], frame_offsets: Tuple[int, ...],
+                         start: int, end: int) -> bytes:
+        """Fetch and inflate the frames covering text bytes [start, end) and slice them."""
+        frame_size = meta["frame_size"]
+        first, last = start // frame_size, (end - 1) // frame_size
+        blob = await redis_client.getrange(
+            self._frames_key(content_hash), frame_offsets[first], frame_offsets[last + 1] - 1
+        )
+        decompress = CODECS[meta["codec"]][1]
+        base = frame_offsets[first]
+        text = b"".join(
+            decompress(blob[frame_offsets[i] - base:frame_offsets[i + 1] - base]) for i in range(first, last + 1)
+        )
+        offset = first * frame_size
+        return text[start - offset:end - offset]
+
+    async def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the cached extraction for a content hash."""
+        doc = await self._read_fields(content_hash, "pages", "frames", "chunks")
+        if doc is None:
+            return await self._migrate_entry(content_hash)
+
+        meta = doc["meta"]
+        text = b""
+        if meta["text_size"]:
+            text = await self._read_text(content_hash, meta, _unpack(doc["frames"]), 0, meta["text_size"])
+        page_offsets = _unpack(doc["pages"])
+        separator = meta["page_separator"]
+        pages = [
+            text[page_offsets[i]:page_offsets[i + 1] - separator].decode("utf-8") for i in range(meta["page_count"])
+        ]
+        content = text.decode("utf-8")
+        flat = _unpack(doc["chunks"])
+        spans = list(zip(flat[::2], flat[1::2]))
+        return {
+            "version": self.version,
+            "content": content,
+            "pages": pages,
+            "chunks": chunk_texts(content, spans),
+            "chunk_spans": spans,
+            "chunk_pages": chunk_pages(spans, page_starts(pages)),
+            "token_counts": meta.get("token_counts", {}),
+            "content_hash": content_hash
+        }
+
+    async def get_page_count(self, content_hash: str) -> Optional[int]:
+        """Get the number of stored pages, or None if the document isn't stored."""
+        doc = await self._read_fields(content_hash)
+        if doc is None and await self._migrate_entry(content_hash):
+            doc = await self._read_fields(content_hash)
+        return doc["meta"]["page_count"] if doc else None
+
+    async def get_text_size(self, content_hash: str) -> Optional[int]:
+        """Get the size in bytes of the stored text, or None if the document isn't stored."""
+        doc = await self._read_fields(content_hash)
+        return doc["meta"]["text_size"] if doc else None
+
+    async def set_token_count(self, content_hash: str, tokenizer: str, count: int):
+        """Record a document's token count for a tokenizer it wasn't counted with when stored.
+
+        The metadata is rewritten under WATCH, so a document that expires or is rewritten in
+        between is left alone rather than recreated as a metadata-only hash without a TTL.
+        """
+        key = self._doc_key(content_hash)
+        async with await redis_client.pipeline(binary=True, transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                meta = await pipe.hget(key, "meta")
+                if meta is None:
+                    return
+                meta = json.loads(meta)
+                meta.setdefault("token_counts", {})[tokenizer] = count
+                pipe.multi()
+                # HSET on an existing hash keeps its TTL
+                pipe.hset(key, "meta", json.dumps(meta))
+                await pipe.execute()
+            except redis.exceptions.WatchError:
+                # The caller keeps the count in memory; it is stored the next time it is counted
+                logger.info(f"Extraction {content_hash[:12]} changed while storing its token count; skipped")
+
+    async def get_page_span(self, content_hash: str, first: int, last: int) -> Optional[Tuple[int, int]]:
+        """Get the byte span [start, end) of pages first..last (0-based, inclusive), or None
+        if the document isn't stored (e.g. it expired since its page count was read)."""
+        doc = await self._read_fields(content_hash, "pages")
+        if doc is None:
+            return None
+        page_offsets = _unpack(doc["pages"])
+        return page_offsets[first], page_offsets[last + 1]
+
+    async def iter_text(self, content_hash: str, start: int, end: int,
+                        block_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Yield bytes [start, end) of the stored text, one GETRANGE per block. Yields nothing
+        if the document isn't stored."""
+        doc = await self._read_fields(content_hash, "frames")
+        if doc is None:
+            return
+        frame_offsets = _unpack(doc["frames"])
+        for block_start in range(start, end, block_size):
+            yield await self._read_text(
+                content_hash, doc["meta"], frame_offsets, block_start, min(block_start + block_size, end)
+            )
+
+    async def get_index(self, content_hash: str) -> Optional[str]:
+        """Get the serialized chunk index stored next to an extraction."""
+        return await redis_client.get(self._index_key(content_hash))
+
+    async def put_index(self, content_hash: str, index_data: str):
+        """Store a serialized chunk index next to its extraction."""
+        await redis_client.set(self._index_key(content_hash), index_data, expire=self.ttl)
+
+    async def link_filename(self, filename: str, content_hash: str):
+        """Record which content hash a filename currently points to. The pointer expires with
+        the extraction it points to."""
+        await redis_client.set(self._filename_key(filename), content_hash, expire=self.ttl)
+
+    async def unlink_filename(self, filename: str):
+        """Forget which content hash a filename points to, e.g. once the PDF is deleted."""
+        await redis_client.delete(self._filename_key(filename))
+
+    async def get_hash_for_filename(self, filename: str) -> Optional[str]:
+        """Get the content hash recorded for a filename."""
+        return await redis_client.get(self._filename_key(filename))
+
+    async def get_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Get the cached extraction for a filename, if its content has been seen before."""
+        content_hash = await self.get_hash_for_filename(filename)
+        if not content_hash:
+            return await self._migrate_filename(filename)
+        return await self.get(content_hash)
+
+    async def _store_legacy(self, content_hash: str, entry: Dict[str, Any]):
+        """Store a JSON-format entry in the compact format."""
+        content = entry.get("content") or ""
+        pages = entry.get("pages") or []
+        # Page boundaries are only usable if the pages tile the text
+        starts = page_starts(pages) if "".join(page + "\n" for page in pages) == content else None
+        spans = chunk_spans(content, starts=starts)
+        await self.put(content_hash, content, pages, spans)
+        if entry.get("chunks") is not None and chunk_texts(content, spans) != entry["chunks"]:
+            # The stored index refers to the old chunking; let it be rebuilt
+            await redis_client.delete(self._index_key(content_hash))
+
+    async def _migrate_entry(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Convert a JSON extraction entry to the compact format, if one exists."""
+        legacy_keys = self._legacy_keys(content_hash)
+        cached = await redis_client.get(legacy_keys[0])
+        if not cached:
+            return None
+        await self._store_legacy(content_hash, json.loads(cached))
+        await redis_client.delete(*legacy_keys)
+        logger.info(f"Migrated extraction {content_hash[:12]} to the compact format")
+        return await self.get(content_hash)
+
+    async def _migrate_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Convert a per-filename pdf:<filename> entry to the compact format, if one exists.
+        Those entries have no PDF hash, so they are keyed by the hash of their text."""
+        legacy_key = f"pdf:{filename}"
+        cached = await redis_client.get(legacy_key)
+        if not cached:
+            return None
+        entry = json.loads(cached)
+        if "content" not in entry:
+            return None
+        content_hash = entry.get("content_hash") or self.content_hash(entry["content"].encode("utf-8"))
+        await self._store_legacy(content_hash, entry)
+        await self.link_filename(filename, content_hash)
+        await redis_client.delete(legacy_key)
+        logger.info(f"Migrated {legacy_key} to the compact format")
+        return await self.get(content_hash)
+
+    async def migrate_legacy(self) -> Dict[str, int]:
+        """Convert every JSON-format entry in Redis to the compact format."""
+        migrated = {"extractions": 0, "filenames": 0}
+        try:
+            async for key in redis_client.scan_iter(f"extract:{self.version}:*"):
+                if await self._migrate_entry(key.rsplit(":", 1)[1]):
+                    migrated["extractions"] += 1
+            async for key in redis_client.scan_iter("pdf:*"):
+                if await self._migrate_filename(key[len("pdf:"):]):
+                    migrated["filenames"] += 1
+        except Exception as e:
+            logger.error(f"Error migrating extraction cache: {str(e)}")
+        logger.info(f"Migrated {migrated['extractions']} extractions and {migrated['filenames']} "
+                    f"per-filename entries to the compact format")
+        return migrated
+
+# Create a singleton instance
+extraction_cache = ExtractionCache()
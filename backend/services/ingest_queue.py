@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, Optional
+import redis.exceptions
+from config import get_settings
+from redis_client import redis_client
+from services.pdf_catalog import pdf_catalog
+from services.pdf_service import pdf_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Stages a job goes through; "upload" is finished by the time the job is queued
+STAGES = ("upload", "download", "extraction", "chunking", "indexing", "catalog")
+
+class IngestQueue:
+    """Redis Streams job queue that ingests uploaded PDFs in the background.
+
+    The upload request streams the file to S3 and queues a job; workers (tasks in the API
+    process, or ingest_worker.py on its own) download it, extract, chunk and index it, and
+    record it in the catalog. Job state lives in a hash at ingestjob:<id> so any instance
+    can report progress. Jobs left unacknowledged by a crashed worker or a failed attempt are
+    reclaimed, up to INGEST_MAX_ATTEMPTS deliveries.
+    """
+
+    STREAM_NAME = "ingest:jobs"
+    GROUP_NAME = "ingest_workers"
+
+    def __init__(self):
+        self.consumer_name = settings.STREAM_CONSUMER_NAME or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.ttl = settings.INGEST_JOB_TTL
+        self.running = False
+        self._group_ready = False
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"ingestjob:{job_id}"
+
+    async def enqueue(self, filename: str, s3_key: str, content_hash: str, size: int) -> str:
+        """Queue an uploaded PDF for ingestion and return the job id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        stages = {name: {"status": "pending"} for name in STAGES}
+        stages["upload"] = {"status": "done"}
+        pipe = await redis_client.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={
+            "job_id": job_id,
+            "filename": filename,
+            "s3_key": s3_key,
+            "content_hash": content_hash,
+            "size": size,
+            "status": "queued",
+            "stage": "upload",
+            "stages": json.dumps(stages),
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        pipe.expire(self._job_key(job_id), self.ttl)
+        pipe.xadd(self.STREAM_NAME, {"job_id": job_id}, maxlen=settings.INGEST_STREAM_MAXLEN, approximate=True)
+        await pipe.execute()
+        return job_id
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status and per-stage progress."""
+        job = await redis_client.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+        job["stages"] = json.loads(job["stages"])
+        job["size"] = int(job["size"])
+        job["attempts"] = int(job["attempts"])
+        for field in ("created_at", "updated_at"):
+            job[field] = float(job[field])
+        return job
+
+    async def _update(self, job_id: str, job: Dict[str, Any], **fields: Any):
+        """Write a job's changed fields and its stages back to Redis."""
+        job.update(fields)
+        job["updated_at"] = time.time()
+        await redis_client.hset(self._job_key(job_id), {
+            **fields,
+            "stages": json.dumps(job["stages"]),
+            "updated_at": job["updated_at"]
+        })
+
+    @staticmethod
+    def _finish_stage(job: Dict[str, Any]):
+        """Mark the running stage done, with how long it took."""
+        current = job["stages"].get(job["stage"])
+        if current and current["status"] == "running":
+            current.update(status="done", seconds=round(time.time() - current["started_at"], 3))
+
+    async def _start_stage(self, job_id: str, job: Dict[str, Any], stage: str):
+        """Mark the current stage done and start the next one."""
+        self._finish_stage(job)
+        job["stages"][stage] = {"status": "running", "started_at": time.time()}
+        await self._update(job_id, job, stage=stage)
+
+    async def process(self, job_id: str):
+        """Run one ingestion job through every stage. A failure is re-raised while the job
+        has attempts left, so its message stays unacknowledged and is retried once it is
+        reclaimed; the last attempt marks the job failed instead."""
+        job = await self.get_job(job_id)
+        if job is None:
+            logger.warning(f"Ingestion job {job_id} expired before it was processed")
+            return
+        if job["status"] == "done":
+            return
+        attempts = await redis_client.hincrby(self._job_key(job_id), "attempts")
+        if attempts > settings.INGEST_MAX_ATTEMPTS:
+            await self._update(job_id, job, status="failed", error="Too many attempts")
+            return
+
+        async def progress(stage: str):
+            await self._start_stage(job_id, job, stage)
+
+        try:
+            await self._update(job_id, job, status="running")
+            await progress("download")
+            pdf_bytes = await pdf_service.download_from_s3(job["s3_key"])
+            if pdf_bytes is None:
+                raise RuntimeError(f"{job['s3_key']} could not be downloaded from S3")
+
+            # Skipped stages stay "pending" when the same content was already extracted
+            await pdf_service.extract_and_cache(pdf_bytes, job["filename"], job["content_hash"], progress=progress)
+
+            await progress("catalog")
+            await pdf_catalog.add(job["s3_key"], job["size"], job["content_hash"])
+            self._finish_stage(job)
+            await self._update(job_id, job, status="done")
+            logger.info(f"Ingested {job['filename']} (job {job_id})")
+        except Exception as e:
+            logger.error(f"Error ingesting {job['filename']} (job {job_id}, attempt {attempts}): {str(e)}")
+            job["stages"][job["stage"]]["status"] = "failed"
+            if attempts < settings.INGEST_MAX_ATTEMPTS:
+                await self._update(job_id, job, status="retrying", error=str(e))
+                raise
+            await self._update(job_id, job, status="failed", error=str(e))
+
+    async def _ensure_group(self):
+        if not self._group_ready:
+            await redis_client.create_consumer_group(self.STREAM_NAME, self.GROUP_NAME)
+            self._group_ready = True
+
+    async def _handle(self, message_id: str, data: Optional[Dict[str, str]]):
+        """Process a job message and acknowledge it, unless the job is to be retried."""
+        # Messages deleted from the stream come back from XAUTOCLAIM without data
+        if data:
+            try:
+                await self.process(data["job_id"])
+            except Exception:
+                # Left pending; reclaimed after INGEST_CLAIM_MIN_IDLE_MS
+                return
+        await redis_client.acknowledge_message(self.STREAM_NAME, self.GROUP_NAME, message_id)
+
+    async def _claim_stuck_jobs(self):
+        """Take over and run every job left unacknowledged for INGEST_CLAIM_MIN_IDLE_MS, by a
+        crashed worker or by a failed attempt, following the XAUTOCLAIM cursor to the end."""
+        start_id = "0-0"
+        while True:
+            start_id, claimed = await redis_client.claim_pending(
+                self.STREAM_NAME, self.GROUP_NAME, self.consumer_name,
+                settings.INGEST_CLAIM_MIN_IDLE_MS, start_id=start_id, count=10
+            )
+            for message_id, data in claimed:
+                await self._handle(message_id, data)
+            if start_id == "0-0":
+                return
+
+    async def _worker(self, index: int):
+        """Take jobs one at a time; a job left pending by a crashed worker or a failed attempt
+        is reclaimed once idle."""
+        next_claim = 0.0
+        while self.running:
+            try:
+                await self._ensure_group()
+                if index == 0 and time.monotonic() >= next_claim:
+                    await self._claim_stuck_jobs()
+                    next_claim = time.monotonic() + settings.STREAM_CLAIM_INTERVAL
+
+                messages = await redis_client.read_as_consumer(
+                    self.STREAM_NAME, self.GROUP_NAME, self.consumer_name, count=1, block=settings.STREAM_BLOCK_MS
+                )
+                for _, stream_messages in messages or []:
+                    for message_id, data in stream_messages:
+                        await self._handle(message_id, data)
+            except redis.exceptions.ConnectionError as e:
+                logger.error(f"Redis connection error in ingestion worker: {str(e)}")
+                await asyncio.sleep(5)
+            except Exception as e:
+                logger.error(f"Error in ingestion worker: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def start(self, workers: int = None):
+        """Run ingestion workers until stopped."""
+        workers = settings.INGEST_WORKERS if workers is None else workers
+        if workers <= 0:
+            return
+        self.running = True
+        logger.info(f"Starting {workers} ingestion workers as {self.consumer_name}")
+        await asyncio.gather(*[self._worker(i) for i in range(workers)])
+
+    def stop(self):
+        """Stop taking new jobs."""
+        self.running = False
+
+# Create a singleton instance
+ingest_queue = IngestQueue()
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+import openai
+from config import get_settings
+from services.token_counter import token_counter
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class ProviderError(Exception):
+    """Raised when a provider fails to produce a completion."""
+
+class RateLimitError(ProviderError):
+    """Raised when a provider rejects a request for exceeding its rate limit."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _retry_after(headers) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, if it has one in seconds."""
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class LLMProvider:
+    """Async completion provider. Clients are created once in startup() and reused."""
+    name = "base"
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS
+        )
+
+    async def startup(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def complete(self, prompt: str, max_tokens: int) -> Dict:
+        """Returns {"text", "input_tokens", "output_tokens", "model"}."""
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[Dict]:
+        """Yields {"token": text} as the model produces it, then one
+        {"input_tokens", "output_tokens", "model"} usage item."""
+        raise NotImplementedError
+        yield
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions through the async client."""
+    name = "gpt-3.5-turbo"
+
+    def __init__(self):
+        super().__init__(settings.OPENAI_TIMEOUT)
+        self.api_key = settings.OPENAI_API_KEY
+        self.base_url = settings.OPENAI_BASE_URL
+        self.client: Optional[openai.AsyncOpenAI] = None
+
+    async def startup(self):
+        if not self.api_key:
+            raise ProviderError("OPENAI_API_KEY is not set")
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,  # Fallback to other models is handled by the caller
+            http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+        )
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def complete(self, prompt: str, max_tokens: int) -> Dict:
+        if self.client is None:
+            await self.startup()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.name,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens
+            )
+        except openai.RateLimitError as e:
+            raise RateLimitError(str(e), _retry_after(e.response.headers))
+        return {
+            "text": response.choices[0].message.content,
+            "input_tokens": response.usage.prompt_tokens,
+            "output_tokens": response.usage.completion_tokens,
+            "model": self.name
+        }
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[Dict]:
+        if self.client is None:
+            await self.startup()
+        response = await self.client.chat.completions.create(
+            model=self.name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            stream=True
+        )
+        text = []
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                token = chunk.choices[0].delta.content
+                text.append(token)
+                yield {"token": token}
+        # Streamed responses carry no usage, so count it
+        yield {
+            "input_tokens": token_counter.count(prompt, self.name),
+            "output_tokens": token_counter.count("".join(text), self.name),
+            "model": self.name
+        }
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through the generateContent REST API on a pooled HTTP client."""
+    name = "gemini-pro"
+    MODEL_NAMES = ["gemini-pro", "gemini-1.0-pro", "gemini-2.0-flash"]
+
+    def __init__(self):
+        super().__init__(settings.GEMINI_TIMEOUT)
+        self.api_key = settings.GOOGLE_API_KEY
+        self.base_url = settings.GEMINI_BASE_URL
+        self.client: Optional[httpx.AsyncClient] = None
+        # Once a model name works, try it first so dead names stop costing a round trip
+        self._working_model: Optional[str] = None
+        # Names the API reported as not found are skipped from then on
+        self._missing_models = set()
+
+    async def startup(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=self._limits()
+        )
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _model_names(self) -> List[str]:
+        names = [m for m in self.MODEL_NAMES if m not in self._missing_models] or self.MODEL_NAMES
+        if self._working_model in names:
+            return [self._working_model] + [m for m in names if m != self._working_model]
+        return names
+
+    async def complete(self, prompt: str, max_tokens: int) -> Dict:
+        if self.client is None:
+            await self.startup()
+
+        data = self._request_body(prompt, max_tokens)
+        last_error = None
+        for model_name in self._model_names():
+            response = await self.client.post(
+                f"/models/{model_name}:generateContent",
+                params={"key": self.api_key},
+                json=data
+            )
+            if response.status_code == 429:
+                # The quota is per key, so another model name won't help
+                raise RateLimitError(f"{model_name}: {response.text}", _retry_after(response.headers))
+            if response.status_code != 200:
+                if response.status_code == 404:
+                    self._missing_models.add(model_name)
+                last_error = f"{model_name}: {response.status_code} - {response.text}"
+                logger.error(f"Gemini REST API error: {last_error}")
+                continue
+
+            result = response.json()
+            text = self._candidate_text(result)
+            usage = result.get("usageMetadata", {})
+            self._working_model = model_name
+            return {
+                "text": text,
+                "input_tokens": usage.get("promptTokenCount") or token_counter.count(prompt, self.name),
+                "output_tokens": usage.get("candidatesTokenCount") or token_counter.count(text, self.name),
+                "model": self.name
+            }
+
+        raise ProviderError(f"All Gemini model names failed. Last error: {last_error}")
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[Dict]:
+        if self.client is None:
+            await self.startup()
+
+        data = self._request_body(prompt, max_tokens)
+        last_error = None
+        for model_name in self._model_names():
+            async with self.client.stream(
+                "POST",
+                f"/models/{model_name}:streamGenerateContent",
+                params={"key": self.api_key, "alt": "sse"},
+                json=data
+            ) as response:
+                if response.status_code == 429:
+                    body = await response.aread()
+                    raise RateLimitError(f"{model_name}: {body.decode(errors='replace')}", _retry_after(response.headers))
+                if response.status_code != 200:
+                    if response.status_code == 404:
+                        self._missing_models.add(model_name)
+                    body = await response.aread()
+                    last_error = f"{model_name}: {response.status_code} - {body.decode(errors='replace')}"
+                    logger.error(f"Gemini REST API error: {last_error}")
+                    continue
+
+                self._working_model = model_name
+                text = []
+                usage = {}
+                event = {}
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    usage = event.get("usageMetadata", usage)
+                    for candidate in event.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                text.append(part["text"])
+                                yield {"token": part["text"]}
+                if not text:
+                    # Nothing was sent yet, so the router can still fall back to another model
+                    raise ProviderError(f"Gemini returned no text: {self._finish_reason(event)}")
+                yield {
+                    "input_tokens": usage.get("promptTokenCount") or token_counter.count(prompt, self.name),
+                    "output_tokens": usage.get("candidatesTokenCount") or token_counter.count("".join(text), self.name),
+                    "model": self.name
+                }
+                return
+
+        raise ProviderError(f"All Gemini model names failed. Last error: {last_error}")
+
+    @staticmethod
+    def _finish_reason(result: Dict) -> str:
+        """Why a response has no text, e.g. SAFETY when the prompt or answer was blocked."""
+        block_reason = result.get("promptFeedback", {}).get("blockReason")
+        if block_reason:
+            return f"prompt blocked ({block_reason})"
+        candidates = result.get("candidates") or [{}]
+        return candidates[0].get("finishReason") or "empty response"
+
+    def _candidate_text(self, result: Dict) -> str:
+        """Text of the first candidate; blocked and empty responses have none."""
+        candidates = result.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        text = "".join(part.get("text", "") for part in parts)
+        if not text:
+            raise ProviderError(f"Gemini returned no text: {self._finish_reason(result)}")
+        return text
+
+    def _request_body(self, prompt: str, max_tokens: int) -> Dict:
+        return {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": 0.7,
+                "topP": 0.95,
+                "topK": 40,
+                "maxOutputTokens": max_tokens
+            }
+        }
+
+# Calls made to each model by fake_acompletion in the last minute, for its simulated rate limit
+_fake_calls: Dict[str, deque] = defaultdict(deque)
+
+async def fake_acompletion(model: str, messages: List[Dict], max_tokens: int = 256, **kwargs) -> SimpleNamespace:
+    """Offline stand-in for litellm.acompletion, returning a response of the same shape.
+
+    It waits LLM_FAKE_LATENCY seconds and answers with the start of the prompt's last
+    paragraph. With LLM_FAKE_RPM set, calls over that many per minute per model are
+    rejected with a RateLimitError, so pacing and backoff can be exercised too.
+    """
+    if settings.LLM_FAKE_RPM:
+        now = time.monotonic()
+        calls = _fake_calls[model]
+        while calls and calls[0] <= now - 60:
+            calls.popleft()
+        if len(calls) >= settings.LLM_FAKE_RPM:
+            raise RateLimitError(f"{model}: fake rate limit of {settings.LLM_FAKE_RPM} requests/min",
+                                 retry_after=60 - (now - calls[0]))
+        calls.append(now)
+    await asyncio.sleep(settings.LLM_FAKE_LATENCY)
+
+    prompt = messages[-1]["content"]
+    paragraphs = [p.strip() for p in prompt.split("\n\n") if p.strip()]
+    words = (paragraphs[-2] if len(paragraphs) > 1 else prompt).split()
+    text = " ".join(words[:max(1, min(max_tokens, 60))])
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=text))],
+        usage=SimpleNamespace(prompt_tokens=token_counter.count(prompt, model),
+                              completion_tokens=token_counter.count(text, model))
+    )
+
+class FakeProvider(LLMProvider):
+    """Answers through fake_acompletion under a real provider's name (LLM_FAKE_BACKEND)."""
+
+    def __init__(self, name: str):
+        super().__init__(settings.LLM_FAKE_LATENCY)
+        self.name = name
+
+    async def complete(self, prompt: str, max_tokens: int) -> Dict:
+        response = await fake_acompletion(self.name, [{"role": "user", "content": prompt}], max_tokens)
+        return {
+            "text": response.choices[0].message.content,
+            "input_tokens": response.usage.prompt_tokens,
+            "output_tokens": response.usage.completion_tokens,
+            "model": self.name
+        }
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[Dict]:
+        result = await self.complete(prompt, max_tokens)
+        for word in result["text"].split(" "):
+            yield {"token": word + " "}
+        yield {key: result[key] for key in ("input_tokens", "output_tokens", "model")}
+
+class ProviderRegistry:
+    """Holds one provider per available model."""
+
+    def __init__(self):
+        providers = [OpenAIProvider(), GeminiProvider()]
+        if settings.LLM_FAKE_BACKEND:
+            providers = [FakeProvider(provider.name) for provider in providers]
+        self.providers: Dict[str, LLMProvider] = {provider.name: provider for provider in providers}
+
+    @property
+    def available_models(self) -> List[str]:
+        return list(self.providers.keys())
+
+    def get(self, model: str) -> LLMProvider:
+        return self.providers[model]
+
+    async def startup(self):
+        """Create the pooled clients for every provider."""
+        for provider in self.providers.values():
+            try:
+                await provider.startup()
+            except Exception as e:
+                # A missing key only disables that provider; it is retried on first use
+                logger.error(f"Error starting provider {provider.name}: {str(e)}")
+        logger.info(f"Started LLM providers: {', '.join(self.providers)}")
+
+    async def shutdown(self):
+        """Close every provider's connection pool."""
+        for provider in self.providers.values():
+            try:
+                await provider.shutdown()
+            except Exception as e:
+                logger.error(f"Error closing provider {provider.name}: {str(e)}")
+
+# Create a singleton instance
+llm_providers = ProviderRegistry()
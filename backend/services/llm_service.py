@@ -1,8 +1,13 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 from litellm import completion
 from services.pdf_service import pdf_service
 from models.pdf_model import PDFContent
+from services.bm25_index import BM25Index
+from services.summarizer import map_reduce_summarizer, CompletionFn
+from services.chunker import chunk_spans, chunk_texts, without_overlap
+from services.token_counter import calculate_cost, token_counter
+from services.llm_providers import fake_acompletion
 from config import get_settings
 import litellm
 import os
@@ -60,7 +65,70 @@ class LLMService:
         self.models = settings.AVAILABLE_MODELS
         self.default_model = settings.DEFAULT_MODEL
         
-        self.chunk_overlap = 200  # characters of overlap between chunks
+        self.qa_top_k = settings.QA_TOP_K
+        self.qa_token_budget = settings.QA_CONTEXT_TOKEN_BUDGET
+        self.qa_retrieval_mode = settings.QA_RETRIEVAL_MODE
+        
+        # LiteLLM's async completion, or a fake one with the same interface for offline runs
+        self.completion_backend = fake_acompletion if settings.LLM_FAKE_BACKEND else litellm.acompletion
+
+    async def complete(self, prompt: str, max_tokens: int, model: str = None) -> Dict:
+        """Run a single completion through LiteLLM."""
+        model = model or self.default_model
+        model_config = MODEL_MAPPINGS.get(model, MODEL_MAPPINGS["gemini-pro"])
+        if not model_config["api_key"]:
+            logger.warning(f"No API key configured for model {model}, falling back to gemini-pro")
+            model = "gemini-pro"
+            model_config = MODEL_MAPPINGS["gemini-pro"]
+
+        response = await self.completion_backend(
+            model=model_config["model"],
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            api_key=model_config["api_key"]
+        )
+        return {
+            "text": response.choices[0].message.content,
+            "input_tokens": response.usage.prompt_tokens,
+            "output_tokens": response.usage.completion_tokens,
+            "model": model
+        }
+
+    def _summary_chunks(self, pdf_content: Dict) -> List[str]:
+        """A document's chunks for map-reduce, with the overlap between them removed so
+        no text is summarized twice."""
+        content = pdf_content.get("content", "")
+        spans = pdf_content.get("chunk_spans")
+        if spans is None:
+            if pdf_content.get("chunks") is not None:
+                return pdf_content["chunks"]
+            spans = chunk_spans(content)
+        return chunk_texts(content, without_overlap(spans))
+
+    async def prepare_map_reduce_prompt(self, pdf_content: Dict, max_length: int, model: str,
+                                        complete: CompletionFn) -> Tuple[str, Dict]:
+        """Run the map-reduce steps ahead of the final summary, for callers that stream it.
+        Returns the final prompt and the token usage and cost spent so far."""
+        chunks = self._summary_chunks(pdf_content)
+        summaries, usage = await map_reduce_summarizer.condense(chunks, complete, model or self.default_model)
+        return map_reduce_summarizer.final_prompt(summaries, max_length), usage
+
+    async def summarize_map_reduce(self, pdf_content: Dict, max_length: int = 1000, model: str = None,
+                                   complete: CompletionFn = None) -> Dict:
+        """Summarize a document too long for one prompt with map-reduce over its chunks.
+
+        complete defaults to a LiteLLM completion on the given model.
+        """
+        model = model or self.default_model
+        chunks = self._summary_chunks(pdf_content)
+
+        if complete is None:
+            async def complete(prompt: str, max_tokens: int) -> Dict:
+                return await self.complete(prompt, max_tokens, model)
+
+        result = await map_reduce_summarizer.summarize(chunks, complete, max_length, model)
+        logger.info(f"Map-reduce summary generated using {result['model']}. Input tokens: {result['input_tokens']}, Output tokens: {result['output_tokens']}, Cost: ${result['cost']:.6f}")
+        return result
 
     async def generate_summary(self, filename: str, model: str = None, max_length: int = 1000) -> Dict:
         """Generate a summary of the PDF content."""
@@ -95,7 +163,7 @@ class LLMService:
             # Log token usage
             input_tokens = response.usage.prompt_tokens
             output_tokens = response.usage.completion_tokens
-            total_cost = self._calculate_cost(model, input_tokens, output_tokens)
+            total_cost = calculate_cost(model, input_tokens, output_tokens)
             
             logger.info(f"Summary generated using {model}. Input tokens: {input_tokens}, Output tokens: {output_tokens}, Cost: ${total_cost:.6f}")
 
@@ -122,7 +190,8 @@ class LLMService:
                 raise ValueError(f"PDF {filename} not found")
 
             # Find relevant chunks for the question
-            relevant_chunks = self._find_relevant_chunks(pdf_content.chunks, question)
+            chunks, index = await pdf_service.get_chunks_and_index(pdf_content)
+            relevant_chunks = self._find_relevant_chunks(chunks, question, index)
             
             # Create prompt for question answering
             prompt = self._create_qa_prompt(question, relevant_chunks)
@@ -146,7 +215,7 @@ class LLMService:
             # Log token usage
             input_tokens = response.usage.prompt_tokens
             output_tokens = response.usage.completion_tokens
-            total_cost = self._calculate_cost(model, input_tokens, output_tokens)
+            total_cost = calculate_cost(model, input_tokens, output_tokens)
             
             logger.info(f"Answer generated using {model}. Input tokens: {input_tokens}, Output tokens: {output_tokens}, Cost: ${total_cost:.6f}")
 
@@ -184,31 +253,43 @@ Question: {question}
 
 Answer:"""
 
-    def _find_relevant_chunks(self, chunks: List[str], question: str) -> List[str]:
-        """Find chunks most relevant to the question."""
-        # For now, return all chunks. In a production system,
-        # you would implement semantic search or similarity matching here.
-        return chunks
-
-    def _calculate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
-        """Calculate the cost of API usage based on token counts."""
-        # Define pricing for different models (per 1000 tokens)
-        pricing = {
-            "gpt-4": {"input": 0.03, "output": 0.06},
-            "gemini-pro": {"input": 0.00125, "output": 0.00375},
-            "claude-3": {"input": 0.015, "output": 0.075},
-            "deepseek-chat": {"input": 0.0005, "output": 0.0015},
-            "grok-1": {"input": 0.0005, "output": 0.0015},
-        }
-        
-        # Get pricing for the model or use default pricing
-        model_pricing = pricing.get(model, {"input": 0.01, "output": 0.02})
-        
-        # Calculate cost
-        input_cost = (input_tokens / 1000) * model_pricing["input"]
-        output_cost = (output_tokens / 1000) * model_pricing["output"]
-        
-        return input_cost + output_cost
+    async def build_qa_context(self, pdf_content: Dict, question: str, retrieval: str = None) -> str:
+        """Build the context for a question from the document's most relevant chunks."""
+        retrieval = retrieval or self.qa_retrieval_mode
+        if retrieval == "semantic":
+            chunks, index = await pdf_service.get_chunks_and_vectors(pdf_content)
+        else:
+            chunks, index = await pdf_service.get_chunks_and_index(pdf_content)
+        return "\n\n".join(self._find_relevant_chunks(chunks, question, index))
+
+    def _find_relevant_chunks(self, chunks: List[str], question: str, index=None) -> List[str]:
+        """Find chunks most relevant to the question, within the context token budget.
+
+        index may be a BM25Index or DocumentVectors; both rank chunks through search().
+        """
+        if not chunks:
+            return []
+        index = index or BM25Index.build(chunks)
+
+        # Over-fetch so chunks skipped for the token budget can be replaced
+        ranked = [chunk_index for chunk_index, _ in index.search(question, top_k=self.qa_top_k * 4)]
+        if not ranked:
+            # Nothing matched; fall back to the start of the document
+            ranked = list(range(len(chunks)))
+
+        selected = []
+        used_tokens = 0
+        for chunk_index in ranked:
+            if len(selected) >= self.qa_top_k:
+                break
+            chunk_tokens = token_counter.count(chunks[chunk_index])
+            if selected and used_tokens + chunk_tokens > self.qa_token_budget:
+                continue
+            selected.append(chunk_index)
+            used_tokens += chunk_tokens
+
+        # Keep document order so the model reads the context as it was written
+        return [chunks[chunk_index] for chunk_index in sorted(selected)]
 
 # Create a singleton instance
 llm_service = LLMService() 
\ No newline at end of file
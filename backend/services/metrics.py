@@ -0,0 +1,74 @@
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+# Latency buckets in seconds, wide enough for LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time from request to the last byte of the response",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled", ["method", "route"])
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Time spent in one stage of handling a request", ["stage"], buckets=LATENCY_BUCKETS
+)
+REDIS_COMMANDS = Counter("redis_commands_total", "Redis commands sent, including pipelined ones", ["command"])
+REDIS_ROUND_TRIPS = Counter("redis_round_trips_total", "Redis round trips; a pipeline is one")
+S3_REQUESTS = Counter("s3_requests_total", "S3 API requests", ["operation"])
+
+def stage(name: str):
+    """Time a block of a request as one stage: `with stage("s3_download"): ...`.
+    Use it as a context manager, also in async code; as a decorator it can't time coroutines."""
+    return STAGE_LATENCY.labels(stage=name).time()
+
+def instrument_s3_client(client):
+    """Count every API request a boto3 S3 client makes."""
+    def count(model, **kwargs):
+        S3_REQUESTS.labels(operation=model.name).inc()
+    client.meta.events.register("before-call.s3", count)
+    return client
+
+def render():
+    """Current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def _route_template(scope) -> str:
+    """The path template of the route a request matches, so label values stay bounded."""
+    partial = None
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests. A request is
+    timed until its last body chunk is sent, so streamed responses are measured in full."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = {"method": scope["method"], "route": _route_template(scope)}
+        status = {"code": 500}
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(**labels)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(status=str(status["code"]), **labels).observe(time.perf_counter() - start)
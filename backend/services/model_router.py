@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+from config import get_settings
+from services.llm_providers import ProviderError, llm_providers
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class ModelHealth:
+    """Rolling latency and error stats for one model, with a circuit breaker.
+
+    The circuit opens after too many failures and skips the model for ROUTER_OPEN_SECONDS.
+    It is then half-open: one trial call is let through while other callers still skip the
+    model. The trial's success closes the circuit; its failure opens it again.
+    """
+
+    def __init__(self):
+        self.latencies = deque(maxlen=settings.ROUTER_WINDOW)
+        self.outcomes = deque(maxlen=settings.ROUTER_WINDOW)  # True for success
+        self.consecutive_failures = 0
+        self.open_until = 0.0  # 0 while the circuit is closed
+        self.trial_in_flight = False
+
+    def acquire(self) -> bool:
+        """Claim a call to the model: always while closed, never while open, and only
+        the one trial call while half-open. Every claimed call must end in
+        record_success, record_failure or release."""
+        if not self.open_until:
+            return True
+        if time.monotonic() < self.open_until or self.trial_in_flight:
+            return False
+        self.trial_in_flight = True
+        return True
+
+    def release(self):
+        """End the trial call without a verdict, e.g. when it was cancelled after losing a hedge."""
+        self.trial_in_flight = False
+
+    def record_success(self, latency: float = None):
+        if latency is not None:
+            self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def record_failure(self, trial: bool = False):
+        """Record a failed call; trial is set for the half-open trial call, whose failure reopens the circuit."""
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if (trial
+                or self.consecutive_failures >= settings.ROUTER_FAILURE_THRESHOLD
+                or (len(self.outcomes) >= settings.ROUTER_MIN_CALLS
+                    and self.error_rate >= settings.ROUTER_ERROR_RATE_THRESHOLD)):
+            self.open_until = time.monotonic() + settings.ROUTER_OPEN_SECONDS
+        if trial:
+            self.trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """Whether callers should skip the model: it is open, or half-open with its trial call in flight."""
+        return bool(self.open_until) and (time.monotonic() < self.open_until or self.trial_in_flight)
+
+    @property
+    def is_half_open(self) -> bool:
+        return bool(self.open_until) and time.monotonic() >= self.open_until
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def latency_quantile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict:
+        return {
+            "open": self.is_open,
+            "half_open": self.is_half_open,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "p50_latency": round(self.latency_quantile(0.5), 3),
+            "p95_latency": round(self.latency_quantile(0.95), 3),
+            "calls": len(self.outcomes)
+        }
+
+class ModelRouter:
+    """Routes completions across providers, skipping unhealthy models and
+    optionally hedging slow calls with a second model."""
+
+    def __init__(self, providers=llm_providers):
+        self.providers = providers
+        self.health: Dict[str, ModelHealth] = {model: ModelHealth() for model in providers.available_models}
+
+    def order(self, model: str) -> List[str]:
+        """Models to try: the requested one first, then the rest by median latency.
+        Models with an open circuit are skipped unless every model is open.
+        Callers still claim each model with ModelHealth.acquire() before calling it."""
+        others = sorted(
+            (m for m in self.providers.available_models if m != model),
+            key=lambda m: self.health[m].latency_quantile(0.5)
+        )
+        if model in self.health:
+            candidates = [model] + others
+        else:
+            logger.warning(f"Model {model} not available. Will try available models.")
+            candidates = others
+        healthy = [m for m in candidates if not self.health[m].is_open]
+        return healthy or candidates
+
+    def hedge_delay(self, model: str) -> float:
+        """How long to wait on a model before sending a hedged request: its p95 latency."""
+        health = self.health[model]
+        if len(health.latencies) < settings.ROUTER_MIN_CALLS:
+            return settings.ROUTER_HEDGE_DEFAULT_DELAY
+        return max(settings.ROUTER_HEDGE_MIN_DELAY, health.latency_quantile(0.95))
+
+    def _claim(self, model: str, last_resort: bool) -> Optional[bool]:
+        """Claim a call to a model. Returns None if the model should be skipped, otherwise
+        whether the call is the model's half-open trial. When every model is open the calls
+        go through anyway, since failing outright is no better than trying."""
+        health = self.health[model]
+        if health.acquire():
+            return health.trial_in_flight
+        return False if last_resort else None
+
+    def _all_open(self, candidates: List[str]) -> bool:
+        return all(self.health[m].is_open for m in candidates if m in self.health)
+
+    async def _call(self, model: str, prompt: str, max_tokens: int, limits=None, trial: bool = False) -> Dict:
+        provider = self.providers.get(model)
+
+        async def call():
+            start = time.monotonic()
+            result = await provider.complete(prompt, max_tokens)
+            return result, time.monotonic() - start
+
+        try:
+            # Time spent waiting on limits isn't the model's latency
+            result, latency = await (call() if limits is None else limits.run(model, call))
+        except asyncio.CancelledError:
+            # Lost a hedge race; neither a failure nor a usable latency sample
+            raise
+        except Exception as e:
+            self.health[model].record_failure(trial)
+            logger.warning(f"Error using model {model}: {str(e)}")
+            raise
+        self.health[model].record_success(latency)
+        return result
+
+    async def complete(self, prompt: str, model: str, max_tokens: int, hedge: bool = False, limits=None) -> Dict:
+        """Run a completion, falling back to the next model on failure. With hedge=True, a
+        second model is also started if the first hasn't answered within its p95 latency,
+        and whichever succeeds first wins. limits, if given, gates each call to a model
+        through `await limits.run(model, call)` (see ProviderLimits)."""
+        remaining = self.order(model)
+        last_resort = self._all_open(remaining)
+        pending = set()
+        tasks = {}
+        hedged = False
+
+        def launch():
+            # Circuits may have changed while waiting, e.g. another request took a half-open trial
+            while remaining:
+                try_model = remaining.pop(0)
+                trial = self._claim(try_model, last_resort)
+                if trial is None:
+                    continue
+                logger.info(f"Attempting to use model: {try_model}")
+                task = asyncio.ensure_future(self._call(try_model, prompt, max_tokens, limits, trial))
+                if trial:
+                    # A cancelled trial gave no verdict; let the next caller try instead
+                    health = self.health[try_model]
+                    task.add_done_callback(lambda t: t.cancelled() and health.release())
+                tasks[task] = try_model
+                pending.add(task)
+                return
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge and not hedged and remaining:
+                    timeout = self.hedge_delay(tasks[next(iter(pending))])
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    logger.info(f"Model {tasks[next(iter(pending))]} is slow; hedging with another model")
+                    hedged = True
+                    launch()
+                    continue
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                # Every finished call failed; fall back unless another is still in flight
+                if not pending and remaining:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise ProviderError("All available language models failed")
+
+    async def stream(self, prompt: str, model: str, max_tokens: int) -> AsyncIterator[Dict]:
+        """Stream a completion, falling back to other models only if nothing was streamed yet."""
+        candidates = self.order(model)
+        last_resort = self._all_open(candidates)
+        for try_model in candidates:
+            trial = self._claim(try_model, last_resort)
+            if trial is None:
+                continue
+            started = False
+            finished = False
+            try:
+                logger.info(f"Attempting to stream from model: {try_model}")
+                async for item in self.providers.get(try_model).stream(prompt, max_tokens):
+                    started = True
+                    yield item
+                finished = True
+                self.health[try_model].record_success()
+                return
+            except Exception as e:
+                finished = True
+                self.health[try_model].record_failure(trial)
+                # Tokens already sent can't be retracted, so only fail over before the first one
+                if started:
+                    raise
+                logger.warning(f"Error using model {try_model}: {str(e)}")
+            finally:
+                if trial and not finished:
+                    # The client went away mid-stream; that says nothing about the model
+                    self.health[try_model].release()
+
+        raise ProviderError("All available language models failed")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Current health of every model."""
+        return {model: health.snapshot() for model, health in self.health.items()}
+
+# Create a singleton instance
+model_router = ModelRouter()
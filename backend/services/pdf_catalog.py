@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from botocore.exceptions import ClientError
+from config import get_settings
+from redis_client import redis_client
+from services.s3_service import s3_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class PDFCatalog:
+    """Redis index of the PDFs in S3: a hash of metadata keyed by S3 key plus a
+    sorted set of the same keys scored by upload time.
+
+    Uploads and deletes update it directly; a background job reconciles it with a
+    paginated listing of the bucket to pick up changes made outside the API.
+    """
+
+    ENTRIES_KEY = "pdfcatalog:entries"
+    BY_TIME_KEY = "pdfcatalog:by_time"
+    PREFIX = "pdfs/"
+
+    def __init__(self):
+        self.reconcile_interval = settings.CATALOG_RECONCILE_INTERVAL
+        self.running = False
+
+    @classmethod
+    def s3_key(cls, filename: str) -> str:
+        """Map a filename with or without the 'pdfs/' prefix to its S3 key."""
+        return filename if filename.startswith(cls.PREFIX) else f"{cls.PREFIX}{filename}"
+
+    async def add(self, s3_key: str, size: int, content_hash: str = None, etag: str = None,
+                  uploaded_at: float = None):
+        """Record a PDF that was written to S3."""
+        uploaded_at = uploaded_at or time.time()
+        entry = {
+            "filename": s3_key,
+            "size": size,
+            "uploaded_at": uploaded_at,
+            "content_hash": content_hash,
+            "etag": etag
+        }
+        pipe = await redis_client.pipeline()
+        pipe.hset(self.ENTRIES_KEY, mapping={s3_key: json.dumps(entry)})
+        pipe.zadd(self.BY_TIME_KEY, {s3_key: uploaded_at})
+        await pipe.execute()
+
+    async def remove(self, s3_key: str):
+        """Forget a PDF that was deleted from S3."""
+        pipe = await redis_client.pipeline()
+        pipe.hdel(self.ENTRIES_KEY, s3_key)
+        pipe.zrem(self.BY_TIME_KEY, s3_key)
+        await pipe.execute()
+
+    async def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Look up one PDF. A catalog miss is checked against S3 with a single HEAD request,
+        so PDFs the reconcile job hasn't seen yet are still found."""
+        s3_key = self.s3_key(filename)
+        try:
+            cached = await redis_client.hget(self.ENTRIES_KEY, s3_key)
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"Redis error reading PDF catalog: {str(e)}")
+
+        loop = asyncio.get_running_loop()
+        try:
+            head = await loop.run_in_executor(
+                None, lambda: s3_service.s3_client.head_object(Bucket=s3_service.bucket_name, Key=s3_key)
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                logger.error(f"Error checking S3 for {s3_key}: {str(e)}")
+            return None
+
+        entry = {
+            "filename": s3_key,
+            "size": head["ContentLength"],
+            "uploaded_at": head["LastModified"].timestamp(),
+            "content_hash": None,
+            "etag": head.get("ETag")
+        }
+        try:
+            await self.add(s3_key, entry["size"], etag=entry["etag"], uploaded_at=entry["uploaded_at"])
+        except Exception as e:
+            logger.warning(f"Redis error updating PDF catalog: {str(e)}")
+        return entry
+
+    async def list_page(self, limit: int, cursor: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """List PDFs newest first. Returns one page of entries and the cursor for the next page.
+
+        The cursor is "<score>:<skip>": the upload time to continue from and how many entries
+        with exactly that time were already returned, so equal timestamps never split a page wrongly.
+        """
+        max_score, skip = "+inf", 0
+        if cursor:
+            score, _, skip = cursor.rpartition(":")
+            max_score, skip = float(score), int(skip)
+
+        members = await redis_client.zrevrangebyscore(
+            self.BY_TIME_KEY, max_score, "-inf", start=skip, num=limit, withscores=True
+        )
+        if not members:
+            return [], None
+
+        keys = [key for key, _ in members]
+        entries = [json.loads(raw) for raw in await redis_client.hmget(self.ENTRIES_KEY, keys) if raw]
+
+        next_cursor = None
+        if len(members) == limit:
+            last_score = members[-1][1]
+            ties = sum(1 for _, score in members if score == last_score)
+            if max_score != "+inf" and last_score == max_score:
+                ties += skip
+            next_cursor = f"{last_score!r}:{ties}"
+        return entries, next_cursor
+
+    async def list_all(self) -> List[Dict[str, Any]]:
+        """List every PDF in the catalog, newest first."""
+        entries = []
+        cursor = None
+        while True:
+            page, cursor = await self.list_page(settings.CATALOG_PAGE_SIZE_MAX, cursor)
+            entries.extend(page)
+            if not cursor:
+                return entries
+
+    async def reconcile(self) -> Dict[str, int]:
+        """Bring the catalog in line with the bucket, one ListObjectsV2 page at a time."""
+        started_at = time.time()
+        loop = asyncio.get_running_loop()
+        paginator = s3_service.s3_client.get_paginator("list_objects_v2")
+        pages = iter(paginator.paginate(Bucket=s3_service.bucket_name, Prefix=self.PREFIX))
+
+        seen = set()
+        added = 0
+        while True:
+            page = await loop.run_in_executor(None, next, pages, None)
+            if page is None:
+                break
+            objects = [obj for obj in page.get("Contents", []) if obj["Key"].endswith(".pdf")]
+            if not objects:
+                continue
+
+            keys = [obj["Key"] for obj in objects]
+            seen.update(keys)
+            existing = await redis_client.hmget(self.ENTRIES_KEY, keys)
+
+            entries = {}
+            scores = {}
+            for obj, raw in zip(objects, existing):
+                current = json.loads(raw) if raw else None
+                if current and current.get("etag") in (None, obj["ETag"]):
+                    continue
+                uploaded_at = obj["LastModified"].timestamp()
+                entries[obj["Key"]] = json.dumps({
+                    "filename": obj["Key"],
+                    "size": obj["Size"],
+                    "uploaded_at": uploaded_at,
+                    "content_hash": None,  # The object changed, so any recorded hash is stale
+                    "etag": obj["ETag"]
+                })
+                scores[obj["Key"]] = uploaded_at
+            if entries:
+                pipe = await redis_client.pipeline()
+                pipe.hset(self.ENTRIES_KEY, mapping=entries)
+                pipe.zadd(self.BY_TIME_KEY, scores)
+                await pipe.execute()
+                added += len(entries)
+
+        # Entries recorded after the listing started may not be in it yet, so leave them alone
+        recorded = await redis_client.zrevrangebyscore(self.BY_TIME_KEY, started_at, "-inf")
+        stale = [key for key in recorded if key not in seen]
+        if stale:
+            pipe = await redis_client.pipeline()
+            pipe.hdel(self.ENTRIES_KEY, *stale)
+            pipe.zrem(self.BY_TIME_KEY, *stale)
+            await pipe.execute()
+
+        logger.info(f"Reconciled PDF catalog: {len(seen)} in S3, {added} updated, {len(stale)} removed")
+        return {"total": len(seen), "updated": added, "removed": len(stale)}
+
+    async def start(self):
+        """Reconcile at startup and then every reconcile_interval seconds."""
+        self.running = True
+        while self.running:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Error reconciling PDF catalog: {str(e)}")
+            await asyncio.sleep(self.reconcile_interval)
+
+    def stop(self):
+        """Stop the reconcile loop."""
+        self.running = False
+
+# Create a singleton instance
+pdf_catalog = PDFCatalog()
@@ -0,0 +1,114 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import PyPDF2
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def _count_pages(pdf_bytes: bytes) -> int:
+    """Count the pages of a PDF."""
+    return len(PyPDF2.PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+def _worker_ready() -> int:
+    """No-op run once per worker at warm-up; unpickling it imports this module and PyPDF2."""
+    return os.getpid()
+
+def _extract_page_range(pdf_bytes: bytes, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop). Runs inside a worker process."""
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+class PDFExtractor:
+    """Page-level PDF text extraction spread across a process pool."""
+
+    def __init__(self):
+        self.max_workers = settings.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+        self.min_pages_per_task = max(1, settings.PDF_EXTRACT_MIN_PAGES_PER_TASK)
+        self.parallel_min_pages = settings.PDF_EXTRACT_PARALLEL_MIN_PAGES
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        """Get the process pool, creating it on first use. Returns None when running single-process."""
+        if self.max_workers <= 1:
+            return None
+        if self._executor is None:
+            # Spawn rather than fork so workers don't inherit the server's threads and sockets
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Started PDF extraction pool with {self.max_workers} workers")
+        return self._executor
+
+    async def warm_up(self):
+        """Start every worker process ahead of the first request. Spawning a worker and importing
+        PyPDF2 in it takes far longer than extracting a typical document, so a cold pool would
+        make the first large documents slower than serial extraction."""
+        executor = self._get_executor()
+        if executor is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            pids = await asyncio.gather(*[
+                loop.run_in_executor(executor, _worker_ready) for _ in range(self.max_workers)
+            ])
+            logger.info(f"Warmed up PDF extraction pool ({len(set(pids))} workers ready)")
+        except Exception as e:
+            logger.error(f"Error warming up PDF extraction pool: {str(e)}")
+
+    def _page_ranges(self, num_pages: int) -> List[Tuple[int, int]]:
+        """Split pages into one contiguous range per worker, respecting the minimum task size."""
+        if num_pages == 0:
+            return []
+        num_tasks = max(1, min(self.max_workers, num_pages // self.min_pages_per_task))
+        base, extra = divmod(num_pages, num_tasks)
+        ranges = []
+        start = 0
+        for i in range(num_tasks):
+            stop = start + base + (1 if i < extra else 0)
+            ranges.append((start, stop))
+            start = stop
+        return ranges
+
+    def extract_pages_serial(self, pdf_bytes: bytes) -> List[str]:
+        """Extract every page in the calling thread."""
+        return _extract_page_range(pdf_bytes, 0, _count_pages(pdf_bytes))
+
+    async def extract_pages(self, pdf_bytes: bytes) -> List[str]:
+        """Extract the text of every page without blocking the event loop. Documents shorter
+        than PDF_EXTRACT_PARALLEL_MIN_PAGES are extracted in one thread, since shipping the
+        bytes to worker processes costs more than it saves for them."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if executor is None:
+            return await loop.run_in_executor(None, self.extract_pages_serial, pdf_bytes)
+
+        num_pages = await loop.run_in_executor(None, _count_pages, pdf_bytes)
+        ranges = self._page_ranges(num_pages)
+        if num_pages < self.parallel_min_pages or len(ranges) < 2:
+            return await loop.run_in_executor(None, _extract_page_range, pdf_bytes, 0, num_pages)
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, _extract_page_range, pdf_bytes, start, stop)
+            for start, stop in ranges
+        ])
+
+        # Ranges are contiguous and gathered in order, so this matches the serial page order
+        pages = []
+        for page_texts in results:
+            pages.extend(page_texts)
+        return pages
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Create a singleton instance
+pdf_extractor = PDFExtractor()
@@ -1,135 +1,299 @@
 import PyPDF2
+import asyncio
 from pathlib import Path
-from typing import List, Dict, Optional, Any
-import json
+from typing import Awaitable, Callable, List, Dict, Optional, Any, Tuple
 import logging
 from models.pdf_model import PDFContent, PDFListItem
 from config import get_settings
 from redis_client import redis_client
 from services.s3_service import s3_service
-import tempfile
+from services.extraction_cache import extraction_cache
+from services.chunker import chunk_pages, chunk_spans, chunk_texts, page_starts
+from services.token_counter import token_counter
+from services.pdf_catalog import pdf_catalog
+from services.pdf_extractor import pdf_extractor
+from services.bm25_index import BM25Index
+from services.vector_index import vector_index, DocumentVectors
+from services.metrics import instrument_s3_client, stage
 import boto3
 import requests
-import io
 import os
+import hashlib
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+async def _no_progress(stage_name: str):
+    pass
+
+class FileTooLarge(Exception):
+    """Raised when an upload is larger than MAX_FILE_SIZE."""
+
 class PDFService:
     def __init__(self):
         self.settings = get_settings()
         # Initialize S3 client
-        self.s3_client = boto3.client(
+        self.s3_client = instrument_s3_client(boto3.client(
             's3',
             aws_access_key_id=self.settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=self.settings.AWS_SECRET_ACCESS_KEY,
             region_name=self.settings.AWS_REGION
-        )
+        ))
         self.bucket_name = self.settings.S3_BUCKET_NAME
         self.upload_dir = Path(settings.PDF_UPLOAD_DIR)
         self.upload_dir.mkdir(exist_ok=True)
-        self.chunk_size = 1000  # characters per chunk
         self.pdf_storage_dir = "pdfs"  # Default storage directory
 
-    async def process_pdf(self, file: bytes, filename: str) -> PDFContent:
+    async def process_pdf(self, file: bytes, filename: str, content_hash: str = None) -> PDFContent:
         """Process PDF file and store its content."""
         try:
-            # Create a temporary file for processing
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_file.write(file)
-                temp_path = temp_file.name
-
-            # Extract text content
-            content = ""
-            page_texts = []  # Store text from each page
-            with open(temp_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    content += page_text
-                    page_texts.append(page_text)  # Add each page's text to the list
+            # Extract text content (reusing the extraction cache if this content was seen before)
+            extraction = await self.extract_and_cache(file, filename, content_hash=content_hash)
 
             # Upload to S3
             s3_key = f"pdfs/{filename}"
-            s3_url = await s3_service.upload_file(temp_path, s3_key)
-
-            # Create chunks for processing
-            chunks = self._create_chunks(content)
+            s3_url = await s3_service.upload_bytes(file, s3_key)
+            await self.add_to_catalog(s3_key, len(file), extraction["content_hash"])
 
             # Create PDF content object
-            pdf_content = PDFContent(
+            return PDFContent(
                 filename=filename,
-                content=content,
-                pages=page_texts,  # Use the list of page texts
+                content=extraction["content"],
+                pages=extraction["pages"],
                 file_path=s3_key,
                 s3_url=s3_url,
-                chunks=chunks
+                chunks=extraction["chunks"],
+                content_hash=extraction["content_hash"]
             )
 
-            # Store in Redis
-            await self._store_pdf_content(pdf_content)
+        except Exception as e:
+            logger.error(f"Error processing PDF {filename}: {str(e)}")
+            raise
+
+    async def upload_stream(self, file, filename: str) -> Dict[str, Any]:
+        """Stream an uploaded file to S3 chunk by chunk, hashing it on the way through.
+        Raises FileTooLarge, and stores nothing, if it is larger than MAX_FILE_SIZE."""
+        s3_key = f"pdfs/{filename}"
+        hasher = hashlib.sha256()
+        max_size = self.settings.MAX_FILE_SIZE
+        if getattr(file, "size", None) is not None and file.size > max_size:
+            raise FileTooLarge(f"File is larger than {max_size} bytes")
 
-            # Clean up temporary file
-            Path(temp_path).unlink()
+        async def read_chunks():
+            size = 0
+            while True:
+                chunk = await file.read(self.settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    # Aborts the multipart upload if one was started
+                    raise FileTooLarge(f"File is larger than {max_size} bytes")
+                hasher.update(chunk)
+                yield chunk
 
-            return pdf_content
+        size = await s3_service.upload_stream(read_chunks(), s3_key)
+        return {
+            "s3_key": s3_key,
+            "s3_url": s3_service.generate_presigned_url(s3_key),
+            "content_hash": hasher.hexdigest(),
+            "size": size
+        }
 
+    async def add_to_catalog(self, s3_key: str, size: int, content_hash: str):
+        """Record an upload in the PDF catalog. The reconcile job catches up if this fails."""
+        try:
+            await pdf_catalog.add(s3_key, size, content_hash)
         except Exception as e:
-            logger.error(f"Error processing PDF {filename}: {str(e)}")
-            raise
+            logger.warning(f"Redis error updating PDF catalog: {str(e)}")
+
+    async def cache_upload_extraction(self, file, filename: str, content_hash: str) -> Dict[str, Any]:
+        """Fill the extraction cache for an uploaded file that was already streamed to S3."""
+        cached = None
+        try:
+            with stage("redis_lookup"):
+                cached = await extraction_cache.get(content_hash)
+        except Exception as redis_error:
+            logger.warning(f"Redis error reading extraction cache: {str(redis_error)}")
+
+        if cached:
+            # Same bytes were extracted before: only the filename pointer needs updating
+            logger.info(f"Found cached extraction for {filename} ({content_hash[:12]})")
+            await extraction_cache.link_filename(filename, content_hash)
+            return cached
+
+        # Re-read the spooled upload rather than downloading it back from S3
+        await file.seek(0)
+        pdf_bytes = await file.read()
+        return await self.extract_and_cache(pdf_bytes, filename, content_hash=content_hash)
+
+    async def extract_and_cache(self, pdf_bytes: bytes, filename: str, content_hash: str = None,
+                                progress: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """Extract text, pages and chunks from PDF bytes, using the content-addressed cache.
+        progress, if given, is awaited with the name of each stage as it starts."""
+        content_hash = content_hash or extraction_cache.content_hash(pdf_bytes)
+        progress = progress or _no_progress
+
+        cached = None
+        try:
+            with stage("redis_lookup"):
+                cached = await extraction_cache.get(content_hash)
+        except Exception as redis_error:
+            logger.warning(f"Redis error reading extraction cache: {str(redis_error)}")
+
+        if cached:
+            logger.info(f"Found cached extraction for {filename} ({content_hash[:12]})")
+        else:
+            await progress("extraction")
+            with stage("pdf_extraction"):
+                pages = await pdf_extractor.extract_pages(pdf_bytes)
+            content = self._join_pages(pages)
+            await progress("chunking")
+            with stage("chunking"):
+                starts = page_starts(pages)
+                spans = chunk_spans(content, starts=starts)
+                chunks = chunk_texts(content, spans)
+            loop = asyncio.get_running_loop()
+            with stage("token_counting"):
+                token_counts = await loop.run_in_executor(None, token_counter.count_document, content)
+            cached = {
+                "content": content,
+                "pages": pages,
+                "chunks": chunks,
+                "chunk_spans": spans,
+                "chunk_pages": chunk_pages(spans, starts),
+                "token_counts": token_counts,
+                "content_hash": content_hash
+            }
+            await progress("indexing")
+            try:
+                await extraction_cache.put(content_hash, content, pages, spans, token_counts)
+                # Build the retrieval index once at ingest so questions don't rebuild it
+                await extraction_cache.put_index(content_hash, BM25Index.build(chunks).to_json())
+            except Exception as redis_error:
+                logger.warning(f"Redis error writing extraction cache: {str(redis_error)}")
+            try:
+                await loop.run_in_executor(None, vector_index.build, content_hash, chunks)
+            except Exception as index_error:
+                logger.warning(f"Error building vector index for {filename}: {str(index_error)}")
+
+        try:
+            await extraction_cache.link_filename(filename, content_hash)
+        except Exception as redis_error:
+            logger.warning(f"Redis error linking {filename} to extraction cache: {str(redis_error)}")
+
+        return cached
+
+    async def get_text_range(self, filename: str, pages: Optional[Tuple[int, Optional[int]]] = None,
+                             byte_range: Optional[Tuple[int, Optional[int]]] = None) -> Optional[Dict[str, Any]]:
+        """Resolve a page range (1-based, inclusive) or byte range (inclusive) of a PDF's text to a
+        byte span of the stored page text. Raises ValueError if the range is outside the document."""
+        content_hash = await extraction_cache.get_hash_for_filename(filename)
+        result = await self._stored_text_range(content_hash, pages, byte_range) if content_hash else None
+        if result is None:
+            # Not cached yet, or expired: extract the document once, which stores it
+            pdf_content = await self.get_pdf_content(filename)
+            if not pdf_content or not pdf_content.get("content_hash"):
+                return None
+            result = await self._stored_text_range(pdf_content["content_hash"], pages, byte_range)
+        return result
+
+    async def _stored_text_range(self, content_hash: str, pages: Optional[Tuple[int, Optional[int]]],
+                                 byte_range: Optional[Tuple[int, Optional[int]]]) -> Optional[Dict[str, Any]]:
+        """Resolve a range against a stored extraction, or None if it isn't stored."""
+        total_pages = await extraction_cache.get_page_count(content_hash)
+        total_bytes = await extraction_cache.get_text_size(content_hash)
+        if total_pages is None or total_bytes is None:
+            return None
+
+        result = {"content_hash": content_hash, "total_pages": total_pages, "total_bytes": total_bytes}
+        if pages:
+            first, last = pages
+            last = min(last or total_pages, total_pages)
+            if first < 1 or first > last:
+                raise ValueError(f"Page range {pages[0]}-{pages[1] or ''} is outside 1-{total_pages}")
+            span = await extraction_cache.get_page_span(content_hash, first - 1, last - 1)
+            if span is None:
+                return None
+            result["start"], result["end"] = span
+            result["first_page"], result["last_page"] = first, last
+        elif byte_range:
+            start, end = byte_range
+            end = min(end + 1 if end is not None else total_bytes, total_bytes)
+            if start >= end:
+                raise ValueError(f"Byte range {byte_range[0]}-{byte_range[1] or ''} is outside 0-{total_bytes - 1}")
+            result["start"], result["end"] = start, end
+        else:
+            result["start"], result["end"] = 0, total_bytes
+        return result
+
+    async def get_chunks_and_index(self, pdf_content: Dict[str, Any]) -> Tuple[List[str], BM25Index]:
+        """Get a document's chunks and their BM25 index, building the index if it isn't stored yet."""
+        chunks = pdf_content.get("chunks")
+        if chunks is None:
+            chunks = self._create_chunks(pdf_content.get("content", ""))
+
+        content_hash = pdf_content.get("content_hash")
+        if content_hash:
+            try:
+                index_data = await extraction_cache.get_index(content_hash)
+                if index_data:
+                    return chunks, BM25Index.from_json(index_data)
+            except Exception as redis_error:
+                logger.warning(f"Redis error reading chunk index: {str(redis_error)}")
+
+        index = BM25Index.build(chunks)
+        if content_hash:
+            try:
+                await extraction_cache.put_index(content_hash, index.to_json())
+            except Exception as redis_error:
+                logger.warning(f"Redis error writing chunk index: {str(redis_error)}")
+        return chunks, index
+
+    async def get_chunks_and_vectors(self, pdf_content: Dict[str, Any]) -> Tuple[List[str], DocumentVectors]:
+        """Get a document's chunks and their embedding matrix, embedding them if they aren't stored yet."""
+        chunks = pdf_content.get("chunks")
+        if chunks is None:
+            chunks = self._create_chunks(pdf_content.get("content", ""))
+
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(
+            None, vector_index.load_or_build, pdf_content.get("content_hash"), chunks
+        )
+        return chunks, vectors
+
+    async def get_token_count(self, pdf_content: Dict[str, Any], model: str = None) -> int:
+        """Tokens in a document for a model. Counted once per tokenizer and stored with the
+        extraction, so later requests only read the number."""
+        tokenizer = token_counter.tokenizer_name(model)
+        token_counts = pdf_content.setdefault("token_counts", {})
+        if tokenizer not in token_counts:
+            loop = asyncio.get_running_loop()
+            counter = token_counter.counter(tokenizer)
+            token_counts[tokenizer] = await loop.run_in_executor(None, counter, pdf_content.get("content", ""))
+            if pdf_content.get("content_hash"):
+                try:
+                    await extraction_cache.set_token_count(pdf_content["content_hash"], tokenizer, token_counts[tokenizer])
+                except Exception as redis_error:
+                    logger.warning(f"Redis error storing token count: {str(redis_error)}")
+        return token_counts[tokenizer]
 
     def _create_chunks(self, content: str) -> List[str]:
         """Split content into chunks for processing."""
-        words = content.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
-
-        for word in words:
-            word_size = len(word) + 1  # +1 for space
-            if current_size + word_size > self.chunk_size:
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_size = word_size
-            else:
-                current_chunk.append(word)
-                current_size += word_size
-
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
-
-        return chunks
-
-    async def _store_pdf_content(self, pdf_content: PDFContent):
-        """Store PDF content in Redis."""
-        try:
-            key = f"pdf:{pdf_content.filename}"
-            data = pdf_content.model_dump_json()
-            redis_client.set(key, data)
-        except Exception as e:
-            logger.error(f"Error storing PDF content in Redis: {str(e)}")
-            raise
+        return chunk_texts(content, chunk_spans(content))
 
     async def get_pdf_content(self, filename: str, s3_url: str = None) -> Optional[Dict[str, Any]]:
         """Get the content of a PDF file."""
         try:
             logger.info(f"Getting content for PDF: {filename}, S3 URL: {s3_url}")
             
-            # First try to get from Redis cache
+            # First try the extraction cache (which also migrates legacy per-filename entries)
             try:
-                key = f"pdf:{filename}"
-                # Check if redis_client.get is a coroutine
-                if hasattr(redis_client.get, "__await__"):
-                    cached_content = await redis_client.get(key)
-                else:
-                    cached_content = redis_client.get(key)
-                
-                if cached_content:
-                    pdf_data = json.loads(cached_content)
-                    if 'content' in pdf_data:
-                        logger.info(f"Found PDF content in Redis cache for {filename}")
-                        return {"content": pdf_data['content']}
+                with stage("redis_lookup"):
+                    cached_extraction = await extraction_cache.get_by_filename(filename)
+                if cached_extraction:
+                    logger.info(f"Found cached extraction for {filename}")
+                    return cached_extraction
             except Exception as redis_error:
                 logger.warning(f"Redis error: {str(redis_error)}")
             
@@ -137,12 +301,13 @@ class PDFService:
             if s3_url:
                 try:
                     logger.info(f"Downloading PDF from S3 URL: {s3_url}")
-                    response = requests.get(s3_url)
+                    with stage("s3_download"):
+                        response = requests.get(s3_url)
                     if response.status_code == 200:
                         # Process the PDF content
-                        pdf_content = self._extract_text_from_pdf(io.BytesIO(response.content))
-                        logger.info(f"Successfully extracted {len(pdf_content)} characters from PDF")
-                        return {"content": pdf_content}
+                        extraction = await self.extract_and_cache(response.content, filename)
+                        logger.info(f"Successfully extracted {len(extraction['content'])} characters from PDF")
+                        return extraction
                     else:
                         logger.error(f"Failed to download PDF from S3 URL: {response.status_code}")
                 except Exception as s3_error:
@@ -160,9 +325,9 @@ class PDFService:
                     logger.info(f"Trying direct S3 download with key: {s3_key}")
                     pdf_bytes = await self.download_from_s3(s3_key)
                     if pdf_bytes:
-                        pdf_content = self._extract_text_from_pdf(io.BytesIO(pdf_bytes))
-                        logger.info(f"Successfully extracted {len(pdf_content)} characters from PDF")
-                        return {"content": pdf_content}
+                        extraction = await self.extract_and_cache(pdf_bytes, filename)
+                        logger.info(f"Successfully extracted {len(extraction['content'])} characters from PDF")
+                        return extraction
                 except Exception as s3_error:
                     logger.error(f"Error with direct S3 download: {str(s3_error)}")
             
@@ -182,8 +347,8 @@ class PDFService:
                     if os.path.exists(path):
                         logger.info(f"Found PDF at path: {path}")
                         with open(path, 'rb') as f:
-                            pdf_content = self._extract_text_from_pdf(f)
-                        return {"content": pdf_content}
+                            pdf_bytes = f.read()
+                        return await self.extract_and_cache(pdf_bytes, filename)
             except Exception as local_error:
                 logger.error(f"Error reading local PDF: {str(local_error)}")
             
@@ -197,20 +362,31 @@ class PDFService:
     def _extract_text_from_pdf(self, pdf_file) -> str:
         """Extract text from a PDF file."""
         try:
-            reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return self._join_pages(self._extract_pages(pdf_file))
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             return ""
 
-    async def list_pdfs(self) -> List[Dict[str, Any]]:
-        """List all processed PDFs."""
+    def _extract_pages(self, pdf_file) -> List[str]:
+        """Extract the text of each page of a PDF file."""
+        reader = PyPDF2.PdfReader(pdf_file)
+        return [page.extract_text() for page in reader.pages]
+
+    def _join_pages(self, pages: List[str]) -> str:
+        """Join page texts into the document text, one newline after each page."""
+        return "".join(page + "\n" for page in pages)
+
+    async def list_pdfs(self, with_urls: bool = False) -> List[Dict[str, Any]]:
+        """List all processed PDFs. Download URLs are only signed when with_urls is set."""
         try:
-            # Get PDFs from S3
-            s3_pdfs = await self._list_s3_pdfs()
+            # Get PDFs from the catalog rather than listing the bucket
+            try:
+                s3_pdfs = await pdf_catalog.list_all()
+            except Exception as catalog_error:
+                logger.warning(f"Error reading PDF catalog, listing S3 instead: {str(catalog_error)}")
+                s3_pdfs = await self._list_s3_pdfs()
+            if with_urls:
+                s3_pdfs = [self._with_url(pdf) for pdf in s3_pdfs]
             
             # Get PDFs from local storage
             local_pdfs = await self._list_local_pdfs()
@@ -230,33 +406,44 @@ class PDFService:
             logger.error(f"Error listing PDFs: {str(e)}")
             return []
 
+    async def list_pdfs_page(self, limit: int, cursor: str = None,
+                             with_urls: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """List one page of PDFs from the catalog, newest first."""
+        entries, next_cursor = await pdf_catalog.list_page(limit, cursor)
+        if with_urls:
+            entries = [self._with_url(entry) for entry in entries]
+        return entries, next_cursor
+
+    def _with_url(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a presigned download URL to a catalog entry."""
+        url, expires_at = s3_service.get_signed_url(entry['filename'])
+        return {**entry, 'url': url, 'url_expires_at': expires_at}
+
     async def delete_pdf(self, filename: str) -> bool:
-        """Delete PDF from both S3 and Redis."""
+        """Delete PDF from S3, the catalog and Redis."""
         try:
             # Delete from S3
-            await s3_service.delete_file(filename)
+            s3_key = pdf_catalog.s3_key(filename)
+            await s3_service.delete_file(s3_key)
+            await pdf_catalog.remove(s3_key)
             
-            # Delete from Redis
+            # Delete from Redis; the extraction itself stays, other filenames may share its content
             key = f"pdf:{filename}"
-            redis_client.delete(key)
+            await redis_client.delete(key)
+            await extraction_cache.unlink_filename(filename)
             
             return True
         except Exception as e:
             logger.error(f"Error deleting PDF {filename}: {str(e)}")
             return False
 
-    async def get_pdf_metadata(self, filename: str) -> Optional[Dict[str, Any]]:
-        """Get metadata for a PDF file."""
+    async def get_pdf_metadata(self, filename: str, with_url: bool = False) -> Optional[Dict[str, Any]]:
+        """Get metadata for a PDF file, optionally with a download URL."""
         try:
-            # Get the list of PDFs
-            pdfs = await self.list_pdfs()
-            
-            # Find the PDF in the list
-            for pdf in pdfs:
-                if pdf.get('filename') == filename or pdf.get('filename').endswith(f"/{filename}"):
-                    return pdf
-            
-            return None
+            entry = await pdf_catalog.get(filename)
+            if entry and with_url:
+                return self._with_url(entry)
+            return entry
         except Exception as e:
             logger.error(f"Error getting PDF metadata: {str(e)}")
             return None
@@ -275,19 +462,10 @@ class PDFService:
                 for obj in response['Contents']:
                     key = obj['Key']
                     if key.endswith('.pdf'):
-                        # Generate a pre-signed URL for the PDF
-                        url = self.s3_client.generate_presigned_url(
-                            'get_object',
-                            Params={
-                                'Bucket': self.bucket_name,
-                                'Key': key
-                            },
-                            ExpiresIn=3600  # URL expires in 1 hour
-                        )
-                        
                         pdfs.append({
                             'filename': key,
-                            'url': url
+                            'size': obj['Size'],
+                            'uploaded_at': obj['LastModified'].timestamp()
                         })
             
             return pdfs
@@ -313,12 +491,16 @@ class PDFService:
 
     async def download_from_s3(self, key: str) -> Optional[bytes]:
         """Download a file directly from S3."""
-        try:
+        def read_object() -> bytes:
             response = self.s3_client.get_object(
                 Bucket=self.bucket_name,
                 Key=key
             )
             return response['Body'].read()
+
+        try:
+            with stage("s3_download"):
+                return await asyncio.get_running_loop().run_in_executor(None, read_object)
         except Exception as e:
             logger.error(f"Error downloading from S3: {str(e)}")
             return None
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Dict, Optional
+from config import get_settings
+from redis_client import redis_client
+from services.stream_consumer import stream_consumer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Redis cache of LLM responses keyed by document content hash, model and prompt parameters."""
+
+    TEMPLATE_VERSION = "1"  # Bump when the summarize or ask prompt templates change
+    LRU_KEY = "llmcache:lru"
+
+    def __init__(self):
+        self.ttl = settings.RESPONSE_CACHE_TTL
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """Normalize a question so trivially different phrasings share an entry."""
+        question = re.sub(r"\s+", " ", question.strip().lower())
+        return question.rstrip("?.! ")
+
+    def summary_key(self, content_hash: str, model: str, max_length: int) -> str:
+        return f"llmcache:summary:{self.TEMPLATE_VERSION}:{content_hash}:{model}:{max_length}"
+
+    def question_key(self, content_hash: str, model: str, question: str, retrieval: str = None) -> str:
+        question_hash = hashlib.sha256(self.normalize_question(question).encode("utf-8")).hexdigest()
+        return f"llmcache:question:{self.TEMPLATE_VERSION}:{content_hash}:{model}:{retrieval or 'default'}:{question_hash}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response, refreshing its recency on a hit."""
+        try:
+            cached = await redis_client.get(key)
+            if cached:
+                await redis_client.zadd(self.LRU_KEY, {key: time.time()})
+                stream_consumer.record_cache_lookup(hit=True)
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"Redis error reading response cache: {str(e)}")
+        stream_consumer.record_cache_lookup(hit=False)
+        return None
+
+    async def put(self, key: str, response: Dict[str, Any]):
+        """Cache a response and evict the least recently used entries beyond max_entries."""
+        try:
+            pipe = await redis_client.pipeline()
+            pipe.set(key, json.dumps(response), ex=self.ttl)
+            pipe.zadd(self.LRU_KEY, {key: time.time()})
+            pipe.zcard(self.LRU_KEY)
+            excess = (await pipe.execute())[-1] - self.max_entries
+            if excess > 0:
+                evicted = [member for member, _ in await redis_client.zpopmin(self.LRU_KEY, excess)]
+                if evicted:
+                    await redis_client.delete(*evicted)
+                    logger.info(f"Evicted {len(evicted)} cached LLM responses")
+        except Exception as e:
+            logger.warning(f"Redis error writing response cache: {str(e)}")
+
+# Create a singleton instance
+response_cache = ResponseCache()
@@ -1,8 +1,14 @@
 import boto3
 from botocore.exceptions import ClientError
+import asyncio
+import functools
 import logging
+import threading
+import time
+from collections import OrderedDict
 from config import get_settings
-from typing import Optional, BinaryIO
+from services.metrics import instrument_s3_client
+from typing import Optional, BinaryIO, AsyncIterator, Dict, Tuple
 from pathlib import Path
 import os
 
@@ -11,12 +17,17 @@ logger = logging.getLogger(__name__)
 
 class S3Service:
     def __init__(self):
-        self.s3_client = boto3.client('s3',
+        self.s3_client = instrument_s3_client(boto3.client('s3',
             aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
             region_name=os.getenv('AWS_REGION')
-        )
+        ))
         self.bucket_name = os.getenv('S3_BUCKET_NAME')
+        self.part_size = max(settings.S3_MULTIPART_PART_SIZE, 5 * 1024 * 1024)
+        self.url_expiry = settings.S3_PRESIGNED_URL_EXPIRY
+        # s3_key -> (url, expires_at); signing is pure CPU, so reuse URLs until close to expiry
+        self._signed_urls: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._signed_urls_lock = threading.Lock()
         logger.info(f"Initialized S3 service with bucket: {self.bucket_name}")
 
     def upload_file(self, file_path: str, s3_key: str) -> str:
@@ -30,6 +41,118 @@ class S3Service:
             logger.error(f"Error uploading to S3: {str(e)}")
             raise
 
+    async def upload_bytes(self, data: bytes, s3_key: str) -> str:
+        """Upload an in-memory file without blocking the event loop. Returns a download URL."""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, functools.partial(
+                self.s3_client.put_object, Bucket=self.bucket_name, Key=s3_key, Body=data
+            ))
+            return self.generate_presigned_url(s3_key)
+        except Exception as e:
+            logger.error(f"Error uploading to S3: {str(e)}")
+            raise
+
+    async def upload_stream(self, chunks: AsyncIterator[bytes], s3_key: str) -> int:
+        """Stream chunks into S3 as a multipart upload. Returns the number of bytes uploaded.
+
+        At most one part is buffered while the previous one is in flight, so memory
+        stays bounded by two part sizes regardless of the file size.
+        """
+        loop = asyncio.get_running_loop()
+        buffer = bytearray()
+        total_size = 0
+        upload_id = None
+        part_number = 0
+        parts = []
+        pending_part = None
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                total_size += len(chunk)
+                if len(buffer) < self.part_size:
+                    continue
+
+                if upload_id is None:
+                    response = await loop.run_in_executor(None, functools.partial(
+                        self.s3_client.create_multipart_upload,
+                        Bucket=self.bucket_name,
+                        Key=s3_key,
+                        ContentType="application/pdf"
+                    ))
+                    upload_id = response["UploadId"]
+
+                # Wait for the previous part before sending the next one. Shielded, so cancelling
+                # the upload leaves the part to finish and the abort below can wait for it
+                if pending_part is not None:
+                    parts.append(await asyncio.shield(pending_part))
+                part_number += 1
+                pending_part = loop.run_in_executor(
+                    None, self._upload_part, s3_key, upload_id, part_number, bytes(buffer)
+                )
+                buffer = bytearray()
+
+            if upload_id is None:
+                # Smaller than one part: a single PUT is cheaper than a multipart upload
+                await loop.run_in_executor(None, functools.partial(
+                    self.s3_client.put_object,
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=bytes(buffer),
+                    ContentType="application/pdf"
+                ))
+                logger.info(f"Uploaded {total_size} bytes to {s3_key}")
+                return total_size
+
+            if pending_part is not None:
+                parts.append(await asyncio.shield(pending_part))
+            if buffer:
+                part_number += 1
+                pending_part = loop.run_in_executor(
+                    None, self._upload_part, s3_key, upload_id, part_number, bytes(buffer)
+                )
+                parts.append(await asyncio.shield(pending_part))
+
+            await loop.run_in_executor(None, functools.partial(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            ))
+            logger.info(f"Uploaded {total_size} bytes to {s3_key} in {len(parts)} parts")
+            return total_size
+        except BaseException as e:
+            logger.error(f"Error streaming upload to S3: {str(e)}")
+            if upload_id is not None:
+                # Shielded, so a cancelled request still waits for the part in flight and aborts
+                await asyncio.shield(self._abort_multipart_upload(s3_key, upload_id, pending_part))
+            raise
+
+    async def _abort_multipart_upload(self, s3_key: str, upload_id: str, pending_part: Optional[asyncio.Future]):
+        """Abort a multipart upload once its part in flight has finished, so that part can't
+        land after the abort and leave orphaned storage behind."""
+        if pending_part is not None:
+            await asyncio.gather(pending_part, return_exceptions=True)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                self.s3_client.abort_multipart_upload, Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id
+            ))
+        except Exception as abort_error:
+            logger.error(f"Error aborting multipart upload: {str(abort_error)}")
+
+    def _upload_part(self, s3_key: str, upload_id: str, part_number: int, data: bytes) -> Dict:
+        """Upload one part of a multipart upload."""
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
     async def download_file(self, object_name: str, file_path: str) -> bool:
         """Download a file from S3 bucket."""
         try:
@@ -49,31 +172,36 @@ class S3Service:
             return False
 
     def generate_presigned_url(self, s3_key: str) -> str:
+        """Get a download URL for an object, reusing a cached one while it is still fresh."""
+        return self.get_signed_url(s3_key)[0]
+
+    def get_signed_url(self, s3_key: str) -> Tuple[str, float]:
+        """Get a download URL for an object and the time it expires."""
+        now = time.time()
+        with self._signed_urls_lock:
+            cached = self._signed_urls.get(s3_key)
+            if cached and cached[1] - settings.SIGNED_URL_REFRESH_MARGIN > now:
+                self._signed_urls.move_to_end(s3_key)
+                return cached
+
         try:
             url = self.s3_client.generate_presigned_url('get_object',
                 Params={'Bucket': self.bucket_name, 'Key': s3_key},
-                ExpiresIn=3600
+                ExpiresIn=self.url_expiry
             )
-            return url
         except Exception as e:
             logger.error(f"Error generating presigned URL: {str(e)}")
             raise
 
+        signed = (url, now + self.url_expiry)
+        with self._signed_urls_lock:
+            self._signed_urls[s3_key] = signed
+            while len(self._signed_urls) > settings.SIGNED_URL_CACHE_SIZE:
+                self._signed_urls.popitem(last=False)
+        return signed
+
     async def get_file_url(self, filename: str) -> str:
         """Get a presigned URL for a file in S3."""
-        s3_key = f"pdfs/{filename}"
-        try:
-            url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': s3_key
-                },
-                ExpiresIn=604800  # 7 days in seconds
-            )
-            return url
-        except ClientError as e:
-            logger.error(f"Error generating presigned URL: {str(e)}")
-            raise
+        return self.generate_presigned_url(f"pdfs/{filename}")
 
 s3_service = S3Service() 
\ No newline at end of file
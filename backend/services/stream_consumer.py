@@ -3,11 +3,50 @@ import logging
 from redis_client import redis_client
 import json
 import datetime
-from typing import Dict, Any
+import os
+import socket
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
 import redis.exceptions
+from collections import defaultdict
+from config import get_settings
+from services.analytics_rollup import analytics_rollup
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Acknowledge a batch of stream messages and apply its rollup increments in one atomic step.
+# If any message is no longer pending, another consumer acknowledged and counted it: then
+# nothing is applied and those ids are returned, so the batch can be recounted without them.
+# KEYS: the stream, then the rollup buckets. ARGV: the group, the number of messages, their
+# ids, then the bucket args from AnalyticsRollup.script_args.
+ACK_AND_COUNT_SCRIPT = """
+local group, count = ARGV[1], tonumber(ARGV[2])
+local acked_elsewhere = {}
+for i = 3, count + 2 do
+    if #redis.call('XPENDING', KEYS[1], group, ARGV[i], ARGV[i], 1) == 0 then
+        table.insert(acked_elsewhere, ARGV[i])
+    end
+end
+if #acked_elsewhere > 0 then
+    return acked_elsewhere
+end
+redis.call('XACK', KEYS[1], group, unpack(ARGV, 3, count + 2))
+local pos = count + 3
+for k = 2, #KEYS do
+    local ttl, fields = ARGV[pos], tonumber(ARGV[pos + 1])
+    pos = pos + 2
+    for _ = 1, fields do
+        local op = ARGV[pos] == 'f' and 'HINCRBYFLOAT' or 'HINCRBY'
+        redis.call(op, KEYS[k], ARGV[pos + 1], ARGV[pos + 2])
+        pos = pos + 3
+    end
+    redis.call('EXPIRE', KEYS[k], ttl)
+end
+return acked_elsewhere
+"""
+
 class StreamConsumer:
     def __init__(self):
         self.running = False
@@ -18,10 +57,23 @@ class StreamConsumer:
             "errors": 0,
             "start_time": None,
             "connection_errors": 0,
-            "last_error": None
+            "last_error": None,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "claimed_events": 0
         }
         self.max_retries = 5
         self.retry_delay = 5  # seconds
+        self.batch_size = settings.STREAM_BATCH_SIZE
+        self.stream_name = "llm_events"
+        self.group_name = "analytics_group"
+        # Each process is its own consumer, so replicas split the stream instead of colliding
+        self.consumer_name = settings.STREAM_CONSUMER_NAME or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.heartbeat_key = f"streamconsumers:{self.stream_name}:{self.group_name}"
+        self.queue: Optional[asyncio.Queue] = None
+        self._last_heartbeat: Optional[Tuple[float, int]] = None  # (time, processed_events)
     
     async def start(self):
         """Start consuming messages from Redis streams."""
@@ -33,7 +85,7 @@ class StreamConsumer:
         while retry_count < self.max_retries:
             try:
                 # Create consumer group
-                redis_client.create_consumer_group("llm_events", "analytics_group")
+                await redis_client.create_consumer_group(self.stream_name, self.group_name)
                 logger.info("Started consuming from Redis streams")
                 break
             except redis.exceptions.ConnectionError as e:
@@ -51,128 +103,268 @@ class StreamConsumer:
                 self.stats["last_error"] = str(e)
                 return
         
-        # Consume messages in a loop
-        while self.running:
-            try:
-                # Read messages as a consumer
-                messages = redis_client.read_as_consumer(
-                    "llm_events", "analytics_group", "analytics_consumer"
+        # Batches are handed to a separate task; while it is behind the queue fills up and reads wait
+        self.queue = asyncio.Queue(maxsize=settings.STREAM_MAX_PENDING_BATCHES)
+        processor = asyncio.create_task(self._process_batches())
+        next_claim = next_heartbeat = 0.0
+        try:
+            while self.running:
+                try:
+                    if time.monotonic() >= next_heartbeat:
+                        await self._heartbeat()
+                        next_heartbeat = time.monotonic() + settings.STREAM_HEARTBEAT_INTERVAL
+                    if time.monotonic() >= next_claim:
+                        await self._rebalance()
+                        await self._claim_stuck_messages()
+                        next_claim = time.monotonic() + settings.STREAM_CLAIM_INTERVAL
+                    
+                    # Wait for a batch of new messages as a consumer
+                    messages = await redis_client.read_as_consumer(
+                        self.stream_name, self.group_name, self.consumer_name,
+                        count=self.batch_size, block=settings.STREAM_BLOCK_MS
+                    )
+                    for stream_name, stream_messages in messages or []:
+                        if stream_messages:
+                            await self.queue.put(stream_messages)
+                    
+                except redis.exceptions.ConnectionError as e:
+                    self.stats["connection_errors"] += 1
+                    self.stats["last_error"] = str(e)
+                    logger.error(f"Redis connection error: {str(e)}")
+                    await asyncio.sleep(self.retry_delay)
+                except Exception as e:
+                    logger.error(f"Error reading stream messages: {str(e)}")
+                    self.stats["errors"] += 1
+                    self.stats["last_error"] = str(e)
+                    await asyncio.sleep(1)
+        finally:
+            # Finish what was already read, then leave the group so nothing waits on this consumer
+            await self.queue.join()
+            processor.cancel()
+            await self._leave()
+    
+    async def _claim_stuck_messages(self):
+        """Take over messages that were read but never acknowledged, e.g. by a consumer
+        that crashed mid-batch, and queue them for processing again."""
+        start_id = "0-0"
+        while True:
+            start_id, messages = await redis_client.claim_pending(
+                self.stream_name, self.group_name, self.consumer_name,
+                settings.STREAM_CLAIM_MIN_IDLE_MS, start_id=start_id, count=self.batch_size
+            )
+            if messages:
+                logger.info(f"Reclaimed {len(messages)} unacknowledged stream messages")
+                self.stats["claimed_events"] += len(messages)
+                await self.queue.put(messages)
+            if start_id == "0-0":
+                return
+    
+    async def _heartbeat(self):
+        """Record that this consumer is alive, with its throughput since the last heartbeat."""
+        now = time.time()
+        processed = self.stats["processed_events"]
+        throughput = 0.0
+        if self._last_heartbeat and now > self._last_heartbeat[0]:
+            throughput = (processed - self._last_heartbeat[1]) / (now - self._last_heartbeat[0])
+        self._last_heartbeat = (now, processed)
+        await redis_client.hset(self.heartbeat_key, {self.consumer_name: json.dumps({
+            "last_seen": now,
+            "started_at": self.stats["start_time"],
+            "processed_events": processed,
+            "errors": self.stats["errors"],
+            "throughput": round(throughput, 2)
+        })})
+    
+    async def _heartbeats(self) -> Dict[str, Dict[str, Any]]:
+        """Get the last heartbeat of every consumer in the group."""
+        return {name: json.loads(raw) for name, raw in (await redis_client.hgetall(self.heartbeat_key)).items()}
+    
+    def _is_alive(self, heartbeat: Optional[Dict[str, Any]], idle_ms: int) -> bool:
+        """A consumer is alive if it sent a heartbeat recently. Consumers that never sent one
+        (older releases) count as alive while they are still talking to Redis."""
+        timeout = settings.STREAM_CONSUMER_TIMEOUT
+        if heartbeat:
+            return time.time() - heartbeat["last_seen"] < timeout
+        return idle_ms < timeout * 1000
+    
+    async def _rebalance(self):
+        """Take over the pending messages of consumers that stopped sending heartbeats and
+        remove them from the group."""
+        heartbeats = await self._heartbeats()
+        consumers = await redis_client.consumer_info(self.stream_name, self.group_name)
+        min_idle_ms = settings.STREAM_CONSUMER_TIMEOUT * 1000
+        for consumer in consumers:
+            name = consumer["name"]
+            if name == self.consumer_name or self._is_alive(heartbeats.get(name), consumer["idle"]):
+                continue
+            
+            # Claiming resets the idle time, so a message is only taken over by one live consumer
+            claimed = 0
+            while True:
+                pending = await redis_client.pending_for_consumer(
+                    self.stream_name, self.group_name, name, count=self.batch_size
+                )
+                if not pending:
+                    break
+                messages = await redis_client.claim_messages(
+                    self.stream_name, self.group_name, self.consumer_name, min_idle_ms,
+                    [entry["message_id"] for entry in pending]
                 )
-                
                 if not messages:
-                    await asyncio.sleep(0.1)
-                    continue
-                
-                # Process messages
-                for stream_name, stream_messages in messages:
-                    for message_id, message_data in stream_messages:
-                        # Process the message
-                        await self._process_message(message_data)
-                        
-                        # Acknowledge message
-                        try:
-                            redis_client.acknowledge_message("llm_events", "analytics_group", message_id)
-                        except Exception as e:
-                            logger.error(f"Error acknowledging message {message_id}: {str(e)}")
-                        
-                        # Update stats
-                        self.stats["processed_events"] += 1
-                
-            except redis.exceptions.ConnectionError as e:
-                self.stats["connection_errors"] += 1
+                    break
+                claimed += len(messages)
+                await self.queue.put(messages)
+            self.stats["claimed_events"] += claimed
+            
+            if not await redis_client.pending_for_consumer(self.stream_name, self.group_name, name, count=1):
+                await redis_client.delete_consumer(self.stream_name, self.group_name, name)
+                await redis_client.hdel(self.heartbeat_key, name)
+                logger.info(f"Removed dead stream consumer {name} after taking over {claimed} messages")
+        
+        # Heartbeats of consumers that are gone from the group
+        names = {consumer["name"] for consumer in consumers}
+        stale = [name for name, heartbeat in heartbeats.items()
+                 if name not in names and name != self.consumer_name and not self._is_alive(heartbeat, 0)]
+        if stale:
+            await redis_client.hdel(self.heartbeat_key, *stale)
+    
+    async def _leave(self):
+        """Remove this consumer from the group if it holds no pending messages."""
+        try:
+            pending = await redis_client.pending_for_consumer(
+                self.stream_name, self.group_name, self.consumer_name, count=1
+            )
+            if not pending:
+                await redis_client.delete_consumer(self.stream_name, self.group_name, self.consumer_name)
+                await redis_client.hdel(self.heartbeat_key, self.consumer_name)
+        except Exception as e:
+            logger.error(f"Error leaving consumer group: {str(e)}")
+    
+    async def _process_batches(self):
+        """Process queued batches until cancelled. A batch that fails stays unacknowledged
+        and is reclaimed later; the batches after it are still processed."""
+        while True:
+            messages = await self.queue.get()
+            try:
+                await self._process_batch(messages)
+            except Exception as e:
+                logger.error(f"Error processing a batch of {len(messages)} stream messages: {str(e)}")
+                self.stats["errors"] += 1
                 self.stats["last_error"] = str(e)
-                logger.error(f"Redis connection error: {str(e)}")
-                await asyncio.sleep(self.retry_delay)
+            finally:
+                self.queue.task_done()
+    
+    async def _process_batch(self, messages: List[Tuple[str, Optional[Dict[str, str]]]]):
+        """Process a batch of messages, then acknowledge them and update the usage rollups
+        in one atomic script, so the counts are never applied without the acknowledgement
+        (and counted again when reclaimed) or the other way round. A message that another
+        consumer already acknowledged (it was reclaimed while this one held it) has been
+        counted there, so the batch is recounted without it. A failed batch stays pending
+        and is reclaimed later."""
+        while messages:
+            # Sum the batch's increments first, so each rollup field is written once per batch
+            increments = defaultdict(float)
+            for message_id, message_data in messages:
+                # Messages deleted from the stream come back from XAUTOCLAIM without data
+                if message_data:
+                    for field, value in self._process_message(message_id, message_data).items():
+                        increments[field] += value
+            keys, args = analytics_rollup.script_args(increments)
+            message_ids = [message_id for message_id, _ in messages]
+            
+            try:
+                acked_elsewhere = await redis_client.run_script(
+                    ACK_AND_COUNT_SCRIPT, [self.stream_name, *keys],
+                    [self.group_name, len(message_ids), *message_ids, *args]
+                )
             except Exception as e:
-                logger.error(f"Error processing stream messages: {str(e)}")
+                logger.error(f"Error storing and acknowledging {len(message_ids)} messages: {str(e)}")
                 self.stats["errors"] += 1
                 self.stats["last_error"] = str(e)
-                await asyncio.sleep(1)
+                return
+            if not acked_elsewhere:
+                break
+            logger.info(f"Skipping {len(acked_elsewhere)} stream messages another consumer already counted")
+            acked_elsewhere = set(acked_elsewhere)
+            messages = [message for message in messages if message[0] not in acked_elsewhere]
+        
+        # Update stats, only for the messages counted here
+        self.stats["processed_events"] += len(messages)
+        for _, message_data in messages:
+            event_type = (message_data or {}).get("event_type")
+            if event_type in ("summarize", "question"):
+                self.stats[f"{event_type}_events"] += 1
     
-    async def _process_message(self, message_data):
-        """Process a message from the stream."""
+    def _process_message(self, message_id: str, message_data) -> Dict[Tuple[str, str], float]:
+        """Process a message from the stream. Returns its increments to the usage rollups."""
         try:
             event_type = message_data.get("event_type")
             
-            if event_type == "summarize":
-                # Process summarization event
-                logger.info(f"Processing summarization event: {message_data}")
-                self.stats["summarize_events"] += 1
-                
-                # Extract data from the message
-                filename = message_data.get("filename")
-                model = message_data.get("model")
-                summary = message_data.get("summary")
-                tokens = message_data.get("tokens", 0)
-                cost = message_data.get("cost", 0)
-                
-                # Store analytics data in Redis
-                analytics_key = f"analytics:summary:{filename}"
-                analytics_data = {
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "filename": filename,
-                    "model": model,
-                    "summary_length": len(summary) if summary else 0,
-                    "tokens": tokens,
-                    "cost": cost
-                }
-                
-                # Store analytics data
-                try:
-                    await redis_client.set(analytics_key, json.dumps(analytics_data))
-                except Exception as e:
-                    logger.error(f"Error storing analytics data: {str(e)}")
-                
-            elif event_type == "question":
-                # Process question event
-                logger.info(f"Processing question event: {message_data}")
-                self.stats["question_events"] += 1
-                
-                # Extract data from the message
-                filename = message_data.get("filename")
-                model = message_data.get("model")
-                question = message_data.get("question")
-                answer = message_data.get("answer")
-                tokens = message_data.get("tokens", 0)
-                cost = message_data.get("cost", 0)
-                
-                # Store analytics data in Redis
-                analytics_key = f"analytics:question:{filename}:{hash(question)}"
-                analytics_data = {
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "filename": filename,
-                    "model": model,
-                    "question": question,
-                    "answer_length": len(answer) if answer else 0,
-                    "tokens": tokens,
-                    "cost": cost
-                }
-                
-                # Store analytics data
-                try:
-                    await redis_client.set(analytics_key, json.dumps(analytics_data))
-                except Exception as e:
-                    logger.error(f"Error storing analytics data: {str(e)}")
-                
-            else:
+            if event_type not in ("summarize", "question"):
                 logger.warning(f"Unknown event type: {event_type}")
+                return {}
+            
+            # Bucket by when the event was published (the millisecond part of its id), not when it is read
+            timestamp = int(message_id.split("-")[0]) / 1000
+            return analytics_rollup.increments(message_data, timestamp)
                 
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
             self.stats["errors"] += 1
             self.stats["last_error"] = str(e)
+        return {}
     
+    def record_cache_lookup(self, hit: bool):
+        """Count an LLM response cache lookup."""
+        if hit:
+            self.stats["cache_hits"] += 1
+        else:
+            self.stats["cache_misses"] += 1
+
     def stop(self):
         """Stop consuming messages."""
         self.running = False
         logger.info("Stopped consuming from Redis streams")
         
+    async def get_group_status(self) -> Dict[str, Any]:
+        """Get the lag and pending count of the consumer group, and the pending count,
+        liveness and throughput of each consumer in it."""
+        groups = await redis_client.group_info(self.stream_name)
+        group = next((g for g in groups if g["name"] == self.group_name), None)
+        if group is None:
+            return {"stream": self.stream_name, "group": self.group_name, "consumers": []}
+        
+        heartbeats = await self._heartbeats()
+        consumers = []
+        for consumer in await redis_client.consumer_info(self.stream_name, self.group_name):
+            heartbeat = heartbeats.get(consumer["name"]) or {}
+            consumers.append({
+                "name": consumer["name"],
+                "pending": consumer["pending"],
+                "idle_ms": consumer["idle"],
+                "alive": self._is_alive(heartbeat, consumer["idle"]),
+                "last_seen": heartbeat.get("last_seen"),
+                "processed_events": heartbeat.get("processed_events"),
+                "throughput": heartbeat.get("throughput"),
+                "this_instance": consumer["name"] == self.consumer_name
+            })
+        return {
+            "stream": self.stream_name,
+            "group": self.group_name,
+            "length": await redis_client.stream_length(self.stream_name),
+            "lag": group.get("lag"),  # Entries not yet delivered to the group; Redis 7+ only
+            "pending": group["pending"],
+            "consumers": consumers
+        }
+    
     async def get_stats(self) -> Dict[str, Any]:
         """Get current statistics."""
         self.stats["uptime_seconds"] = (
             datetime.datetime.now() - 
             datetime.datetime.fromisoformat(self.stats["start_time"])
         ).total_seconds() if self.stats["start_time"] else 0
+        self.stats["queued_batches"] = self.queue.qsize() if self.queue else 0
+        self.stats["consumer_name"] = self.consumer_name
         
         return self.stats
 
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from config import get_settings
+from redis_client import redis_client
+from services.token_counter import calculate_cost, token_counter
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# complete(prompt, max_tokens) -> {"text", "input_tokens", "output_tokens", "model"}
+CompletionFn = Callable[[str, int], Awaitable[Dict]]
+
+async def _gather_or_cancel(coroutines) -> List:
+    """Like asyncio.gather, but if one call fails the others are cancelled instead of
+    running on (and being billed) for a summary that will never be returned."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+class MapReduceSummarizer:
+    """Hierarchical summarization for documents that don't fit in one prompt.
+
+    Chunks are grouped into windows and summarized concurrently (map), then the
+    partial summaries are merged in a tree (reduce). Every summary except the final
+    one is independent of max_length and cached by the hash of its input text, so a
+    second request with a different max_length only reruns the final reduce.
+    """
+
+    PROMPT_VERSION = "1"  # Bump when the prompts below change
+
+    def __init__(self):
+        self.max_concurrency = settings.SUMMARY_MAX_CONCURRENCY
+        self.map_input_tokens = settings.SUMMARY_MAP_INPUT_TOKENS
+        self.partial_summary_tokens = settings.SUMMARY_PARTIAL_TOKENS
+        self.fanout = max(2, settings.SUMMARY_REDUCE_FANOUT)
+        self.cache_ttl = settings.SUMMARY_CACHE_TTL
+
+    def _map_prompt(self, text: str) -> str:
+        return f"""Summarize the following section of a longer document.
+Keep names, figures, dates and conclusions. Do not add information that is not in the text.
+
+{text}
+
+Section summary:"""
+
+    def _reduce_prompt(self, summaries: List[str]) -> str:
+        joined = "\n\n".join(summaries)
+        return f"""The following are summaries of consecutive sections of one document.
+Combine them into a single summary that keeps the most important points in order.
+
+{joined}
+
+Combined summary:"""
+
+    def final_prompt(self, summaries: List[str], max_length: int) -> str:
+        """Build the final reduce prompt. It depends on max_length, so its result is never cached."""
+        joined = "\n\n".join(summaries)
+        return f"""The following are summaries of consecutive sections of one document.
+Write a concise summary of the whole document, not exceeding {max_length} characters:
+
+{joined}
+
+Summary:"""
+
+    def _group_chunks(self, chunks: List[str], model: str) -> List[str]:
+        """Group consecutive chunks into windows of roughly map_input_tokens each."""
+        windows = []
+        current = []
+        current_tokens = 0
+        for chunk in chunks:
+            chunk_tokens = token_counter.count(chunk, model)
+            if current and current_tokens + chunk_tokens > self.map_input_tokens:
+                windows.append("\n".join(current))
+                current = []
+                current_tokens = 0
+            current.append(chunk)
+            current_tokens += chunk_tokens
+        if current:
+            windows.append("\n".join(current))
+        return windows
+
+    def _cache_key(self, model: str, stage: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"sumpart:{self.PROMPT_VERSION}:{model}:{stage}:{digest}"
+
+    async def _prefetch(self, stage: str, source_texts: List[str], model: str) -> List[Optional[str]]:
+        """Look up the cached results for a whole stage in one round trip."""
+        try:
+            return await redis_client.mget([self._cache_key(model, stage, text) for text in source_texts])
+        except Exception as e:
+            logger.warning(f"Redis error reading partial summaries: {str(e)}")
+            return [None] * len(source_texts)
+
+    async def _cached_completion(self, stage: str, source_text: str, prompt: str, cached: Optional[str],
+                                 complete: CompletionFn, model: str, semaphore: asyncio.Semaphore,
+                                 usage: Dict) -> str:
+        """Run one map or intermediate reduce completion, unless its prefetched result is cached."""
+        if cached:
+            return cached
+
+        async with semaphore:
+            result = await complete(prompt, self.partial_summary_tokens)
+        usage["input_tokens"] += result["input_tokens"]
+        usage["output_tokens"] += result["output_tokens"]
+        # Priced per call: after a fallback, calls of one summary run on different models
+        usage["cost"] += calculate_cost(result["model"], result["input_tokens"], result["output_tokens"])
+        usage["model"] = result["model"]
+
+        # Cached under the model that answered, which is not the requested one after a fallback
+        key = self._cache_key(result.get("model") or model, stage, source_text)
+        try:
+            await redis_client.set(key, result["text"], expire=self.cache_ttl)
+        except Exception as e:
+            logger.warning(f"Redis error storing partial summary: {str(e)}")
+        return result["text"]
+
+    async def condense(self, chunks: List[str], complete: CompletionFn, model: str) -> Tuple[List[str], Dict]:
+        """Run the map and intermediate reduce steps. Returns the summaries for the final
+        prompt and the token usage and cost spent getting there."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        usage = {"input_tokens": 0, "output_tokens": 0, "cost": 0.0, "model": None}
+
+        # Map: summarize each window concurrently
+        windows = self._group_chunks(chunks, model)
+        cached = await self._prefetch("map", windows, model)
+        summaries = await _gather_or_cancel([
+            self._cached_completion("map", window, self._map_prompt(window), hit, complete, model, semaphore, usage)
+            for window, hit in zip(windows, cached)
+        ])
+        logger.info(f"Summarized {len(windows)} sections of {len(chunks)} chunks")
+
+        # Reduce: merge groups of summaries until one prompt's worth remains
+        while len(summaries) > self.fanout:
+            groups = [summaries[i:i + self.fanout] for i in range(0, len(summaries), self.fanout)]
+            sources = ["\n\n".join(group) for group in groups]
+            cached = await self._prefetch("reduce", sources, model)
+            summaries = await _gather_or_cancel([
+                self._cached_completion("reduce", source, self._reduce_prompt(group),
+                                        hit, complete, model, semaphore, usage)
+                for group, source, hit in zip(groups, sources, cached)
+            ])
+        return list(summaries), usage
+
+    def estimate(self, chunks: List[str], max_length: int, model: str) -> Dict:
+        """Estimate the calls and tokens of summarizing a chunked document, counting every
+        output at its limit and no partial summary as cached."""
+        def overhead(prompt: str) -> int:
+            return token_counter.count(prompt, model)
+
+        windows = self._group_chunks(chunks, model)
+        usage = {
+            "calls": len(windows),
+            "input_tokens": sum(token_counter.count(window, model) for window in windows)
+                            + len(windows) * overhead(self._map_prompt("")),
+            "output_tokens": len(windows) * self.partial_summary_tokens
+        }
+        summaries = len(windows)
+        while summaries > self.fanout:
+            groups = -(-summaries // self.fanout)
+            usage["calls"] += groups
+            usage["input_tokens"] += summaries * self.partial_summary_tokens + groups * overhead(self._reduce_prompt([]))
+            usage["output_tokens"] += groups * self.partial_summary_tokens
+            summaries = groups
+        usage["calls"] += 1
+        usage["input_tokens"] += summaries * self.partial_summary_tokens + overhead(self.final_prompt([], max_length))
+        usage["output_tokens"] += max_length // 4
+        return usage
+
+    async def summarize(self, chunks: List[str], complete: CompletionFn, max_length: int, model: str) -> Dict:
+        """Summarize a chunked document. Returns the summary with the token usage and cost
+        summed over all calls, each call priced for the model that answered it."""
+        summaries, usage = await self.condense(chunks, complete, model)
+        result = await complete(self.final_prompt(summaries, max_length), max_length // 4)
+        return {
+            "summary": result["text"],
+            "model": result["model"],
+            "input_tokens": usage["input_tokens"] + result["input_tokens"],
+            "output_tokens": usage["output_tokens"] + result["output_tokens"],
+            "cost": usage["cost"] + calculate_cost(result["model"], result["input_tokens"], result["output_tokens"])
+        }
+
+# Create a singleton instance
+map_reduce_summarizer = MapReduceSummarizer()
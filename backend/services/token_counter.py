@@ -0,0 +1,84 @@
+import functools
+import logging
+from typing import Callable, Dict, Optional
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Price per 1000 tokens
+PRICING = {
+    "gpt-4": {"input": 0.03, "output": 0.06},
+    "gpt-3.5-turbo": {"input": 0.0015, "output": 0.002},
+    "gemini-pro": {"input": 0.00125, "output": 0.00375},
+    "claude-3": {"input": 0.015, "output": 0.075},
+    "deepseek-chat": {"input": 0.0005, "output": 0.0015},
+    "grok-1": {"input": 0.0005, "output": 0.0015},
+}
+DEFAULT_PRICING = {"input": 0.01, "output": 0.02}
+
+# Name of the heuristic tokenizer used when no real one is available
+APPROX = "approx"
+
+# count(text) -> number of tokens
+CountFn = Callable[[str], int]
+
+def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Calculate the cost of API usage based on token counts."""
+    pricing = PRICING.get(model, DEFAULT_PRICING)
+    return (input_tokens / 1000) * pricing["input"] + (output_tokens / 1000) * pricing["output"]
+
+def approx_tokens(text: str) -> int:
+    """Estimate tokens as one per four characters, the rule of thumb used across the app."""
+    return (len(text) + 3) // 4
+
+@functools.lru_cache()
+def _tiktoken_encoding(name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        raise ImportError("tiktoken package not installed. Run: pip install tiktoken")
+    return tiktoken.get_encoding(name)
+
+class TokenCounter:
+    """Counts tokens with each model's own tokenizer where one is available locally.
+
+    Models listed in TOKENIZER_ENCODINGS are counted exactly with that tiktoken encoding
+    (tiktoken is optional); other models, or every model without tiktoken, fall back to
+    four characters per token. Tokenizers are loaded once and shared. Counts of whole
+    documents are stored with their extraction per tokenizer name (see PDFService.get_token_count).
+    """
+
+    def __init__(self):
+        self.encodings = settings.TOKENIZER_ENCODINGS
+        self._counters: Dict[str, CountFn] = {APPROX: approx_tokens}
+
+    def counter(self, name: str) -> CountFn:
+        """Get the counter for a tokenizer name, or the heuristic if it can't be loaded."""
+        if name not in self._counters:
+            try:
+                encoding = _tiktoken_encoding(name)
+                self._counters[name] = lambda text: len(encoding.encode(text, disallowed_special=()))
+            except Exception as e:
+                logger.warning(f"Error loading tokenizer {name}, counting tokens approximately: {str(e)}")
+                self._counters[name] = approx_tokens
+        return self._counters[name]
+
+    def tokenizer_name(self, model: Optional[str] = None) -> str:
+        """The tokenizer a model's tokens are counted with."""
+        name = self.encodings.get(model) if model else None
+        if name is None or self.counter(name) is approx_tokens:
+            return APPROX
+        return name
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        """Count the tokens of text as a model would."""
+        return self.counter(self.tokenizer_name(model))(text)
+
+    def count_document(self, content: str) -> Dict[str, int]:
+        """Count a document's tokens with every tokenizer in use, for storing with its extraction."""
+        names = {APPROX} | {self.tokenizer_name(model) for model in self.encodings}
+        return {name: self.counter(name)(content) for name in names}
+
+# Create a singleton instance
+token_counter = TokenCounter()
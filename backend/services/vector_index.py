@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+from config import get_settings
+from services.bm25_index import tokenize
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class Embedder:
+    """Base class for local embedders. Subclasses return one L2-normalized float32 row per text."""
+    name = "base"
+    dim = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class HashingEmbedder(Embedder):
+    """Deterministic hashing-trick embedder: no model download, stable across processes."""
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or settings.EMBEDDING_DIM
+        self.name = f"hashing-{self.dim}"
+
+    def _bucket(self, token: str) -> Tuple[int, float]:
+        # blake2b rather than hash(), which is randomized per process
+        digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        return digest % self.dim, (1.0 if digest >> 63 else -1.0)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                column, sign = self._bucket(token)
+                matrix[row, column] += sign
+        # Sublinear term frequency, then unit length so a dot product is cosine similarity
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class SentenceTransformerEmbedder(Embedder):
+    """Embedder backed by a local sentence-transformers model."""
+
+    def __init__(self, model_name: str = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("sentence-transformers package not installed. Run: pip install sentence-transformers")
+        model_name = model_name or settings.EMBEDDING_MODEL
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name.replace('/', '_')}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+    "sentence-transformers": SentenceTransformerEmbedder
+}
+
+class DocumentVectors:
+    """Embeddings of one document's chunks as a single (num_chunks, dim) float32 matrix."""
+
+    def __init__(self, matrix: np.ndarray, embedder: Embedder):
+        self.matrix = matrix
+        self.embedder = embedder
+
+    def search(self, query: str, top_k: int = None) -> List[Tuple[int, float]]:
+        """Score every chunk with one matmul. Returns (chunk_index, score) pairs, best first."""
+        num_chunks = self.matrix.shape[0]
+        if num_chunks == 0:
+            return []
+        scores = self.matrix @ self.embedder.embed([query])[0]
+
+        if top_k and top_k < num_chunks:
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(num_chunks)
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in ordered if scores[i] > 0]
+
+class VectorIndex:
+    """Per-document embedding matrices stored as .npy files and memory-mapped on read."""
+
+    def __init__(self, embedder: Embedder, index_dir: str = None, max_open: int = 64):
+        self.embedder = embedder
+        self.index_dir = Path(index_dir or settings.VECTOR_INDEX_DIR) / settings.EXTRACTOR_VERSION.replace(":", "_")
+        self.max_open = max_open
+        self._open: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, content_hash: str) -> Path:
+        return self.index_dir / f"{content_hash}-{self.embedder.name}.npy"
+
+    def build(self, content_hash: str, chunks: List[str]) -> DocumentVectors:
+        """Embed a document's chunks and write the matrix to disk."""
+        matrix = self.embedder.embed(chunks) if chunks else np.zeros((0, self.embedder.dim), dtype=np.float32)
+        path = self._path(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent readers never map a partial file
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        os.replace(temp_path, path)
+        with self._lock:
+            # A map of the file this one replaced would keep serving the old matrix
+            self._open.pop(content_hash, None)
+        return DocumentVectors(matrix, self.embedder)
+
+    def load(self, content_hash: str) -> Optional[DocumentVectors]:
+        """Memory-map a stored matrix, keeping recently used maps open."""
+        with self._lock:
+            matrix = self._open.get(content_hash)
+            if matrix is not None:
+                self._open.move_to_end(content_hash)
+                return DocumentVectors(matrix, self.embedder)
+
+        path = self._path(content_hash)
+        if not path.exists():
+            return None
+        matrix = np.load(path, mmap_mode="r")
+
+        with self._lock:
+            self._open[content_hash] = matrix
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return DocumentVectors(matrix, self.embedder)
+
+    def load_or_build(self, content_hash: Optional[str], chunks: List[str]) -> DocumentVectors:
+        """Load a document's vectors, embedding and storing them first if needed."""
+        if not content_hash:
+            return DocumentVectors(self.embedder.embed(chunks), self.embedder)
+        vectors = self.load(content_hash)
+        if vectors is not None and vectors.matrix.shape[0] == len(chunks):
+            return vectors
+        return self.build(content_hash, chunks)
+
+# Create a singleton instance
+vector_index = VectorIndex(EMBEDDERS[settings.EMBEDDER]())
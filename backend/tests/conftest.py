@@ -0,0 +1,39 @@
+"""Shared fixtures. Redis is replaced with fakeredis and S3 with moto, so the suite runs
+without network access: `cd backend && python -m pytest tests`."""
+import os
+import sys
+import tempfile
+
+# Settings are read when the services are imported, so these have to be in place first
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("S3_BUCKET_NAME", "summaraize-test")
+os.environ.setdefault("REDIS_TIMEOUT", "1")
+os.environ.setdefault("VECTOR_INDEX_DIR", tempfile.mkdtemp(prefix="summaraize-indexes-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis
+import moto  # Imported before boto3 clients are created, so moto can intercept them
+import pytest
+from redis_client import redis_client
+
+@pytest.fixture
+def fake_redis():
+    """Point the shared Redis client at a fresh in-memory server."""
+    server = fakeredis.FakeServer()
+    originals = (redis_client.redis, redis_client.async_redis, redis_client.async_redis_binary)
+    redis_client.redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_client.async_redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    redis_client.async_redis_binary = fakeredis.FakeAsyncRedis(server=server)
+    yield redis_client
+    redis_client.redis, redis_client.async_redis, redis_client.async_redis_binary = originals
+
+@pytest.fixture
+def s3_bucket():
+    """Mock S3 with an empty bucket named S3_BUCKET_NAME."""
+    from services.s3_service import s3_service
+    with moto.mock_aws():
+        s3_service.s3_client.create_bucket(Bucket=s3_service.bucket_name)
+        s3_service._signed_urls.clear()
+        yield s3_service
@@ -0,0 +1,111 @@
+import asyncio
+import io
+import tarfile
+import zipfile
+from benchmark_batch_ingest import make_pdf
+from services import batch_ingest as module
+from services.batch_ingest import BatchIngestor, _pdf_name, _value, archive_kind
+from services.extraction_cache import extraction_cache
+from services.pdf_catalog import pdf_catalog
+
+def _zip(files) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+def _tar(files) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+async def _collect(results):
+    return [result async for result in results]
+
+def _by_name(results):
+    return {result["filename"]: result for result in results[:-1]}
+
+def test_archive_kind_and_names():
+    assert archive_kind(_zip({"a.pdf": b"x"})) == "zip"
+    assert archive_kind(_tar({"a.pdf": b"x"})) == "tar"
+    assert archive_kind(io.BytesIO(b"%PDF-1.4 not an archive")) is None
+    assert _pdf_name("reports/2024/Q1.PDF") == "reports/2024/Q1.PDF"
+    assert _pdf_name("/pdfs/a.pdf") == "a.pdf"
+    assert _pdf_name("../escape.pdf") is None
+    assert _pdf_name("__MACOSX/._a.pdf") is None and _pdf_name("docs/._a.pdf") is None
+    assert _pdf_name("notes.txt") is None
+
+def test_archive_statuses(fake_redis, s3_bucket, monkeypatch):
+    monkeypatch.setattr(module.settings, "MAX_FILE_SIZE", 5000)
+    first = make_pdf("Batch first", 2)
+    archive = _zip({
+        "docs/first.pdf": first,
+        "docs/copy.pdf": first,
+        "docs/second.pdf": make_pdf("Batch second", 1),
+        "docs/broken.pdf": b"not a pdf",
+        "docs/huge.pdf": make_pdf("Batch huge", 1) + b" " * 5000,
+        "docs/readme.txt": b"ignored"
+    })
+
+    results = asyncio.run(_collect(BatchIngestor().ingest_archive(archive, "zip")))
+    by_name = _by_name(results)
+    assert set(by_name) == {"docs/first.pdf", "docs/copy.pdf", "docs/second.pdf", "docs/broken.pdf", "docs/huge.pdf"}
+    # Either copy of the same content may finish first; the other is its duplicate
+    statuses = sorted(by_name[name]["status"] for name in ("docs/first.pdf", "docs/copy.pdf"))
+    assert statuses == ["duplicate", "ingested"]
+    assert by_name["docs/second.pdf"]["status"] == "ingested"
+    assert by_name["docs/broken.pdf"]["status"] == "failed"
+    assert by_name["docs/huge.pdf"]["status"] == "skipped"
+    assert results[-1]["summary"]["files"] == 5
+    assert {key: results[-1]["summary"][key] for key in ("ingested", "duplicate", "skipped", "failed")} == \
+        {"ingested": 2, "duplicate": 1, "skipped": 1, "failed": 1}
+
+    stored = s3_bucket.s3_client.list_objects_v2(Bucket=s3_bucket.bucket_name)["Contents"]
+    assert len([item for item in stored if item["Key"].startswith("pdfs/docs/")]) == 2
+
+def test_s3_keys(fake_redis, s3_bucket):
+    s3_bucket.s3_client.put_object(Bucket=s3_bucket.bucket_name, Key="pdfs/here.pdf", Body=make_pdf("Batch S3", 1))
+
+    async def run():
+        results = await _collect(BatchIngestor().ingest_s3_keys(["pdfs/here.pdf", "pdfs/missing.pdf", "other/x.pdf"]))
+        entry = await pdf_catalog.get("here.pdf")
+        return results, entry, await extraction_cache.get_by_filename("here.pdf")
+
+    results, entry, extraction = asyncio.run(run())
+    by_name = _by_name(results)
+    assert by_name["here.pdf"]["status"] == "ingested" and not by_name["here.pdf"]["cached"]
+    assert by_name["missing.pdf"]["status"] == "failed"
+    assert by_name["other/x.pdf"]["status"] == "skipped"
+    assert entry["content_hash"] == by_name["here.pdf"]["content_hash"]
+    assert "Batch S3" in extraction["content"]
+
+def test_workers_are_bounded(monkeypatch):
+    ingestor = BatchIngestor()
+    ingestor.concurrency = 3
+    active = {"now": 0, "max": 0}
+
+    async def not_cached(content_hash):
+        return None
+
+    monkeypatch.setattr(extraction_cache, "get_page_count", not_cached)
+
+    async def store(name, data, content_hash):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+
+    async def items():
+        for i in range(12):
+            yield f"doc-{i}.pdf", lambda i=i: _value(f"content {i}".encode())
+
+    results = asyncio.run(_collect(ingestor._run(items(), store)))
+    assert results[-1]["summary"]["ingested"] == 12
+    assert active["max"] == 3
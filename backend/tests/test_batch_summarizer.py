@@ -0,0 +1,120 @@
+import asyncio
+import time
+import pytest
+from models.llm_model import SummaryResponse
+from models.pdf_model import SummaryRequest
+from services import batch_summarizer as batch_module
+from services.batch_summarizer import BatchSummarizer, ProviderLimits
+from services.llm_providers import FakeProvider, ProviderRegistry, RateLimitError
+from services.model_router import ModelRouter
+
+class TrackingProvider(FakeProvider):
+    """Records how many calls run at once, and rate-limits the first rate_limited calls."""
+
+    def __init__(self, name, rate_limited=0):
+        super().__init__(name)
+        self.rate_limited = rate_limited
+        self.active = 0
+        self.max_active = 0
+        self.starts = []
+
+    async def complete(self, prompt, max_tokens):
+        self.starts.append(time.monotonic())
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise RateLimitError(f"{self.name}: slow down", retry_after=0.05)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            return await super().complete(prompt, max_tokens)
+        finally:
+            self.active -= 1
+
+def _router(*providers) -> ModelRouter:
+    registry = ProviderRegistry()
+    registry.providers = {provider.name: provider for provider in providers}
+    return ModelRouter(registry)
+
+async def _summarize(request: SummaryRequest, complete) -> SummaryResponse:
+    """Stand-in for the /summarize path: one completion per document."""
+    if request.filename == "broken.pdf":
+        raise ValueError("No text could be extracted")
+    result = await complete(f"Summarize {request.filename}.\n\nIt reports steady growth.\n\n", 100)
+    return SummaryResponse(filename=request.filename, summary=result["text"], model=result["model"],
+                           input_tokens=result["input_tokens"], output_tokens=result["output_tokens"],
+                           cost=0.01, cached=False)
+
+@pytest.fixture(autouse=True)
+def fast_fake_backend(monkeypatch):
+    from services import llm_providers
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_LATENCY", 0.02)
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_RPM", 0)
+
+def test_limits_cap_concurrency_per_model():
+    gpt, gemini = TrackingProvider("gpt-3.5-turbo"), TrackingProvider("gemini-pro")
+    limits = ProviderLimits({"gpt-3.5-turbo": 3, "gemini-pro": 1}, {})
+
+    async def run():
+        calls = [limits.run(provider.name, lambda provider=provider: provider.complete("Hello.\n\nWorld.", 16))
+                 for provider in [gpt] * 12 + [gemini] * 4]
+        await asyncio.gather(*calls)
+
+    asyncio.run(run())
+    assert gpt.max_active == 3
+    assert gemini.max_active == 1
+
+def test_limits_pace_requests_per_minute():
+    provider = TrackingProvider("gemini-pro")
+    limits = ProviderLimits({"gemini-pro": 10}, {"gemini-pro": 600})  # One start per 0.1s
+
+    async def run():
+        await asyncio.gather(*[limits.run(provider.name, lambda: provider.complete("Hi.", 16)) for _ in range(5)])
+
+    asyncio.run(run())
+    gaps = [later - earlier for earlier, later in zip(provider.starts, provider.starts[1:])]
+    assert min(gaps) >= 0.09
+
+def test_limits_wait_out_rate_limits_and_retry():
+    provider = TrackingProvider("gpt-3.5-turbo", rate_limited=2)
+    limits = ProviderLimits({}, {})
+
+    async def run():
+        started = time.monotonic()
+        result = await limits.run(provider.name, lambda: provider.complete("Hi.\n\nThere.", 16))
+        return result, time.monotonic() - started
+
+    result, seconds = asyncio.run(run())
+    assert result["model"] == "gpt-3.5-turbo"
+    assert limits.rate_limited["gpt-3.5-turbo"] == 2
+    assert seconds >= 0.1  # Two Retry-After pauses
+
+def test_batch_on_fake_backend(fake_redis, monkeypatch):
+    gpt, gemini = TrackingProvider("gpt-3.5-turbo", rate_limited=1), TrackingProvider("gemini-pro")
+    monkeypatch.setattr(batch_module, "model_router", _router(gpt, gemini))
+    monkeypatch.setattr(batch_module.settings, "BATCH_SUMMARY_CONCURRENCY", 6)
+    summarizer = BatchSummarizer()
+    summarizer.limits = ProviderLimits({"gpt-3.5-turbo": 2, "gemini-pro": 1}, {})
+    requests = [SummaryRequest(filename=f"{i}.pdf", model="gpt-3.5-turbo") for i in range(6)]
+    requests += [SummaryRequest(filename=f"g{i}.pdf", model="gemini-pro") for i in range(3)]
+    requests += [SummaryRequest(filename="0.pdf", model="gpt-3.5-turbo"),  # Same as the first
+                 SummaryRequest(filename="broken.pdf", model="gpt-3.5-turbo")]
+
+    async def run():
+        batch_id = await summarizer.submit(requests, _summarize)
+        await summarizer._tasks[batch_id]
+        return await summarizer.get_batch(batch_id)
+
+    batch = asyncio.run(run())
+    assert batch["status"] == "done"
+    assert (batch["total"], batch["completed"], batch["failed"]) == (11, 10, 1)
+    assert gpt.max_active <= 2 and gemini.max_active == 1
+    assert summarizer.limits.rate_limited["gpt-3.5-turbo"] == 1
+
+    results = batch["results"]
+    assert [result["index"] for result in results] == list(range(11))
+    assert results[9] == {**results[0], "index": 9}  # Summarized once, stored under both indexes
+    assert results[10]["status"] == "failed" and "No text" in results[10]["error"]
+    assert {result["model"] for result in results[6:9]} == {"gemini-pro"}
+    # The duplicate's tokens count once
+    assert batch["input_tokens"] == sum(result["input_tokens"] for result in results[:9])
+    assert batch["cost"] == pytest.approx(0.09)
@@ -0,0 +1,22 @@
+from benchmark_retrieval import evaluate
+from services.bm25_index import BM25Index
+
+def test_search_ranks_matching_chunks_first():
+    index = BM25Index.build([
+        "The bridge is long and the river is wide.",
+        "The Halvorsen bridge is 420 metres long.",
+        "Museums sold tickets in May."
+    ])
+    ranked = index.search("How long is the Halvorsen bridge?")
+    assert ranked[0][0] == 1
+    assert 2 not in [chunk_index for chunk_index, _ in ranked]
+
+def test_round_trip_keeps_scores():
+    index = BM25Index.build(["alpha beta", "beta gamma gamma", "delta"])
+    restored = BM25Index.from_json(index.to_json())
+    assert restored.search("gamma beta") == index.search("gamma beta")
+
+def test_recall_on_fixture_documents():
+    result = evaluate(documents=2, pages=10, facts_per_document=8, top_k=8)
+    assert result["recall@8"] >= 0.9
+    assert result["context_reduction"] > 3
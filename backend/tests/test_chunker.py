@@ -0,0 +1,69 @@
+from services.chunker import chunk_pages, chunk_spans, chunk_texts, page_starts, without_overlap
+
+def words(text: str) -> int:
+    """Count whitespace-separated words, so token budgets are easy to reason about."""
+    return len(text.split())
+
+def _sentences(count: int, length: int = 4):
+    return [f"S{i} " + " ".join(["word"] * (length - 2)) + " end." for i in range(count)]
+
+def test_chunks_end_on_sentence_boundaries():
+    content = " ".join(_sentences(6))
+    spans = chunk_spans(content, max_tokens=10, overlap_tokens=0, count_tokens=words)
+    # Two four-word sentences fit in ten tokens, a third doesn't
+    assert chunk_texts(content, spans) == [
+        " ".join(_sentences(6)[0:2]), " ".join(_sentences(6)[2:4]), " ".join(_sentences(6)[4:6])
+    ]
+    assert all(content[end - 1] == "." for _, end in spans)
+
+def test_sentences_do_not_cross_pages():
+    pages = ["Page one starts here and runs on", "without a full stop. Page two ends."]
+    content = "".join(page + "\n" for page in pages)
+    starts = page_starts(pages)
+    spans = chunk_spans(content, max_tokens=8, overlap_tokens=0, starts=starts, count_tokens=words)
+    assert chunk_texts(content, spans) == pages
+    assert chunk_pages(spans, starts) == [(1, 1), (2, 2)]
+    # Without page starts the first sentence runs into page two, and is split on words
+    unpaged = chunk_texts(content, chunk_spans(content, max_tokens=8, overlap_tokens=0, count_tokens=words))
+    assert unpaged[0] == "Page one starts here and runs on without"
+
+def test_chunk_pages_of_a_chunk_spanning_pages():
+    pages = ["One.", "Two.", "Three."]
+    content = "".join(page + "\n" for page in pages)
+    starts = page_starts(pages)
+    spans = chunk_spans(content, max_tokens=100, overlap_tokens=0, starts=starts, count_tokens=words)
+    assert spans == [(0, len(content) - 1)]
+    assert chunk_pages(spans, starts) == [(1, 3)]
+    assert chunk_pages(spans, []) == [(1, 1)]
+
+def test_overlap_carries_trailing_sentences():
+    sentences = _sentences(6)
+    content = " ".join(sentences)
+    spans = chunk_spans(content, max_tokens=12, overlap_tokens=4, count_tokens=words)
+    # Each chunk starts with the last sentence of the previous one
+    assert chunk_texts(content, spans) == [
+        " ".join(sentences[0:3]), " ".join(sentences[2:5]), " ".join(sentences[4:6])
+    ]
+    # Without overlap nothing is repeated
+    spans = chunk_spans(content, max_tokens=12, overlap_tokens=0, count_tokens=words)
+    assert chunk_texts(content, spans) == [" ".join(sentences[0:3]), " ".join(sentences[3:6])]
+
+def test_without_overlap_tiles_the_text():
+    content = " ".join(_sentences(8))
+    spans = chunk_spans(content, max_tokens=12, overlap_tokens=4, count_tokens=words)
+    trimmed = without_overlap(spans)
+    assert trimmed[0][0] == spans[0][0] and trimmed[-1][1] == len(content)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(trimmed, trimmed[1:]))
+    assert " ".join(content[start:end].strip() for start, end in trimmed) == content
+    # A chunk entirely inside the previous one is dropped
+    assert without_overlap([(0, 10), (2, 8), (5, 20)]) == [(0, 10), (10, 20)]
+
+def test_sentence_over_budget_is_split_on_words():
+    long_sentence = " ".join(f"w{i}" for i in range(25)) + "."
+    content = f"Short one. {long_sentence} Short two."
+    spans = chunk_spans(content, max_tokens=10, overlap_tokens=0, count_tokens=words)
+    texts = chunk_texts(content, spans)
+    assert all(words(text) <= 10 for text in texts)
+    assert " ".join(texts) == " ".join(content.split())
+    # A single word longer than the budget is still kept whole
+    assert chunk_texts("x" * 50, chunk_spans("x" * 50, max_tokens=1, count_tokens=len)) == ["x" * 50]
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from services import event_publisher as module
+from services.event_publisher import EventPublisher
+
+@pytest.fixture
+def small_queue(monkeypatch):
+    monkeypatch.setattr(module.settings, "EVENT_QUEUE_SIZE", 3)
+    monkeypatch.setattr(module.settings, "EVENT_BATCH_SIZE", 2)
+    monkeypatch.setattr(module.settings, "EVENT_FLUSH_INTERVAL", 0.05)
+
+def test_publish_never_waits(small_queue):
+    async def run():
+        publisher = EventPublisher()
+        for i in range(5):
+            publisher.publish("question", model="gpt-4", tokens=i, filename=None)
+        return publisher, [publisher.queue.get_nowait() for _ in range(publisher.queue.qsize())]
+
+    publisher, queued = asyncio.run(run())
+    # None fields are left out and values are sent as strings
+    assert queued[0] == {"event_type": "question", "model": "gpt-4", "tokens": "0"}
+    assert len(queued) == 3 and publisher.stats["dropped"] == 2
+
+def test_batches_fill_up_or_time_out(small_queue):
+    async def run():
+        publisher = EventPublisher()
+        for i in range(3):
+            publisher.publish("question", tokens=i)
+        full = await publisher._next_batch()
+        partial = await publisher._next_batch()
+        return full, partial
+
+    full, partial = asyncio.run(run())
+    assert [event["tokens"] for event in full] == ["0", "1"]
+    assert [event["tokens"] for event in partial] == ["2"]
+
+def test_events_reach_the_stream(fake_redis, small_queue, monkeypatch):
+    monkeypatch.setattr(module.settings, "EVENT_STREAM_MAXLEN", 1000)
+
+    async def run():
+        publisher = EventPublisher()
+        task = asyncio.create_task(publisher.start())
+        for i in range(3):
+            publisher.publish("summarize", model="gpt-4", tokens=i)
+        while publisher.stats["published"] < 2:
+            await asyncio.sleep(0.01)
+        await publisher.stop()
+        task.cancel()
+        return publisher, await fake_redis.async_redis.xrange("llm_events")
+
+    publisher, entries = asyncio.run(run())
+    assert [fields["tokens"] for _, fields in entries] == ["0", "1", "2"]
+    assert publisher.stats == {"published": 3, "dropped": 0, "flush_errors": 0}
+
+def test_slow_redis_drops_the_batch(fake_redis, monkeypatch):
+    monkeypatch.setattr(module.settings, "EVENT_FLUSH_TIMEOUT", 0.01)
+
+    class SlowPipeline:
+        def xadd(self, *args, **kwargs):
+            pass
+
+        async def execute(self):
+            await asyncio.sleep(1)
+
+    async def pipeline():
+        return SlowPipeline()
+
+    monkeypatch.setattr(fake_redis, "pipeline", pipeline)
+
+    async def run():
+        publisher = EventPublisher()
+        await publisher._flush([{"event_type": "question"}, {"event_type": "summarize"}])
+        return publisher.stats
+
+    assert asyncio.run(run()) == {"published": 0, "dropped": 2, "flush_errors": 1}
@@ -0,0 +1,133 @@
+import asyncio
+import json
+from benchmark_batch_ingest import make_pdf
+from services.chunker import chunk_spans, chunk_texts, page_starts
+from services.extraction_cache import extraction_cache
+from services.pdf_service import pdf_service
+
+def _store(content_hash: str, pages):
+    content = "".join(page + "\n" for page in pages)
+    spans = [(0, len(content.encode("utf-8")))]
+    return extraction_cache.put(content_hash, content, pages, spans)
+
+def test_link_filename_expires_with_extraction(fake_redis):
+    async def run():
+        await _store("abc", ["one", "two"])
+        await extraction_cache.link_filename("pdfs/a.pdf", "abc")
+        return await fake_redis.async_redis.ttl("pdfhash:a.pdf")
+
+    ttl = asyncio.run(run())
+    assert 0 < ttl <= extraction_cache.ttl
+
+def test_delete_pdf_forgets_filename(fake_redis, s3_bucket):
+    async def run():
+        await _store("abc", ["one", "two"])
+        await extraction_cache.link_filename("a.pdf", "abc")
+        assert await pdf_service.delete_pdf("a.pdf")
+        return await extraction_cache.get_by_filename("a.pdf")
+
+    assert asyncio.run(run()) is None
+
+def test_expired_extraction_is_a_miss(fake_redis):
+    async def run():
+        await _store("abc", ["one", "two"])
+        await fake_redis.delete(extraction_cache._doc_key("abc"), extraction_cache._frames_key("abc"))
+        span = await extraction_cache.get_page_span("abc", 0, 1)
+        text = [block async for block in extraction_cache.iter_text("abc", 0, 8)]
+        return span, text
+
+    assert asyncio.run(run()) == (None, [])
+
+def test_text_range_reextracts_expired_extraction(fake_redis, s3_bucket):
+    s3_bucket.s3_client.put_object(Bucket=s3_bucket.bucket_name, Key="pdfs/a.pdf",
+                                   Body=make_pdf("Range", 3))
+
+    async def run():
+        first = await pdf_service.get_text_range("a.pdf", pages=(2, 2))
+        content_hash = first["content_hash"]
+        # The extraction can expire while the filename still points to it
+        await fake_redis.delete(extraction_cache._doc_key(content_hash), extraction_cache._frames_key(content_hash))
+        second = await pdf_service.get_text_range("a.pdf", pages=(2, 2))
+        text = b"".join([block async for block in extraction_cache.iter_text(content_hash, second["start"], second["end"])])
+        return first, second, text
+
+    first, second, text = asyncio.run(run())
+    assert second == first
+    assert b"Range" in text
+
+def test_compact_format_round_trip(fake_redis, monkeypatch):
+    # Small frames, so the text spans several independently compressed frames
+    monkeypatch.setattr(extraction_cache, "frame_size", 16)
+    pages = ["First page about plants.", "Second page: crates shipped in spring.", "Third — ünïcode page."]
+    content = "".join(page + "\n" for page in pages)
+    spans = chunk_spans(content, starts=page_starts(pages))
+
+    async def run():
+        await extraction_cache.put("abc", content, pages, spans, {"cl100k_base": 42})
+        page_span = await extraction_cache.get_page_span("abc", 1, 2)
+        middle = b"".join([block async for block in extraction_cache.iter_text("abc", *page_span, block_size=7)])
+        return await extraction_cache.get("abc"), middle, await extraction_cache.get_page_count("abc")
+
+    doc, middle, page_count = asyncio.run(run())
+    assert doc["content"] == content and doc["pages"] == pages
+    assert doc["chunk_spans"] == spans and doc["chunks"] == chunk_texts(content, spans)
+    assert doc["token_counts"] == {"cl100k_base": 42}
+    assert middle.decode("utf-8") == pages[1] + "\n" + pages[2] + "\n"
+    assert page_count == 3
+
+def test_legacy_entry_is_migrated_and_old_keys_deleted(fake_redis):
+    pages = ["One page.", "Two page."]
+    content = "".join(page + "\n" for page in pages)
+    legacy_keys = extraction_cache._legacy_keys("abc")
+
+    async def run():
+        await fake_redis.set(legacy_keys[0], json.dumps({"content": content, "pages": pages, "chunks": [content]}))
+        await fake_redis.set(legacy_keys[1], content)
+        await fake_redis.set("pdf:b.pdf", json.dumps({"content": "Old per-filename entry.\n", "pages": []}))
+        migrated = await extraction_cache.migrate_legacy()
+        return migrated, await extraction_cache.get("abc"), await extraction_cache.get_by_filename("b.pdf"), \
+            await fake_redis.exists(*legacy_keys, "pdf:b.pdf")
+
+    migrated, doc, by_filename, remaining = asyncio.run(run())
+    assert migrated == {"extractions": 1, "filenames": 1}
+    assert doc["content"] == content and doc["pages"] == pages
+    assert by_filename["content"] == "Old per-filename entry.\n"
+    assert remaining == 0
+
+def test_token_count_keeps_ttl_and_skips_expired_documents(fake_redis):
+    async def run():
+        await _store("abc", ["one", "two"])
+        await extraction_cache.set_token_count("abc", "cl100k_base", 3)
+        stored = (await extraction_cache.get("abc"))["token_counts"]
+        ttl = await fake_redis.async_redis.ttl(extraction_cache._doc_key("abc"))
+        await extraction_cache.set_token_count("gone", "cl100k_base", 3)
+        return stored, ttl, await fake_redis.exists(extraction_cache._doc_key("gone"))
+
+    stored, ttl, gone_exists = asyncio.run(run())
+    assert stored == {"cl100k_base": 3}
+    assert 0 < ttl <= extraction_cache.ttl
+    assert gone_exists == 0
+
+def test_token_count_skipped_when_document_changes_meanwhile(fake_redis, monkeypatch):
+    async def run():
+        await _store("abc", ["one", "two"])
+        key = extraction_cache._doc_key("abc")
+        real_pipeline = fake_redis.pipeline
+
+        async def pipeline(**kwargs):
+            pipe = await real_pipeline(**kwargs)
+            real_hget = pipe.hget
+
+            async def hget(*args):
+                meta = await real_hget(*args)
+                # The document expires between reading its metadata and writing it back
+                await fake_redis.delete(key, extraction_cache._frames_key("abc"))
+                return meta
+            pipe.hget = hget
+            return pipe
+
+        monkeypatch.setattr(fake_redis, "pipeline", pipeline)
+        await extraction_cache.set_token_count("abc", "cl100k_base", 3)
+        return await fake_redis.exists(key)
+
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import pytest
+from benchmark_batch_ingest import make_pdf
+from services.ingest_queue import IngestQueue
+
+@pytest.fixture
+def queue(monkeypatch):
+    from services import ingest_queue
+    monkeypatch.setattr(ingest_queue.settings, "INGEST_CLAIM_MIN_IDLE_MS", 0)
+    queue = IngestQueue()
+    queue.consumer_name = "worker-a"
+    return queue
+
+async def _enqueue(queue: IngestQueue, s3_bucket, name: str, upload: bool = True) -> str:
+    pdf_bytes = make_pdf(f"Document {name}", 2)
+    s3_key = f"pdfs/{name}"
+    if upload:
+        s3_bucket.s3_client.put_object(Bucket=s3_bucket.bucket_name, Key=s3_key, Body=pdf_bytes)
+    await queue._ensure_group()
+    return await queue.enqueue(name, s3_key, hashlib.sha256(pdf_bytes).hexdigest(), len(pdf_bytes))
+
+async def _read(fake_redis, consumer: str, count: int = 1):
+    messages = await fake_redis.read_as_consumer(IngestQueue.STREAM_NAME, IngestQueue.GROUP_NAME, consumer, count=count)
+    return messages[0][1] if messages else []
+
+async def _pending(fake_redis) -> int:
+    groups = await fake_redis.group_info(IngestQueue.STREAM_NAME)
+    return groups[0]["pending"]
+
+def test_successful_job_is_acknowledged(fake_redis, s3_bucket, queue):
+    async def run():
+        job_id = await _enqueue(queue, s3_bucket, "a.pdf")
+        for message_id, data in await _read(fake_redis, "worker-a"):
+            await queue._handle(message_id, data)
+        return await queue.get_job(job_id), await _pending(fake_redis)
+
+    job, pending = asyncio.run(run())
+    assert job["status"] == "done" and job["attempts"] == 1
+    assert all(job["stages"][stage]["status"] == "done" for stage in ("download", "extraction", "catalog"))
+    assert pending == 0
+
+def test_failed_job_is_retried_until_attempts_run_out(fake_redis, s3_bucket, queue):
+    async def run():
+        # Never uploaded, so every attempt fails at download
+        job_id = await _enqueue(queue, s3_bucket, "missing.pdf", upload=False)
+        for message_id, data in await _read(fake_redis, "worker-a"):
+            await queue._handle(message_id, data)
+        history = [(await queue.get_job(job_id), await _pending(fake_redis))]
+        for _ in range(2):
+            await queue._claim_stuck_jobs()
+            history.append((await queue.get_job(job_id), await _pending(fake_redis)))
+        return history
+
+    history = asyncio.run(run())
+    assert [(job["status"], job["attempts"], pending) for job, pending in history] == [
+        ("retrying", 1, 1), ("retrying", 2, 1), ("failed", 3, 0)
+    ]
+    assert history[-1][0]["stages"]["download"]["status"] == "failed"
+    assert "could not be downloaded" in history[-1][0]["error"]
+
+def test_claim_follows_the_cursor(fake_redis, s3_bucket, queue):
+    async def run():
+        job_ids = [await _enqueue(queue, s3_bucket, f"{i}.pdf") for i in range(23)]
+        # A worker that crashed after reading every job; more than one XAUTOCLAIM page
+        await _read(fake_redis, "worker-crashed", count=len(job_ids))
+        await queue._claim_stuck_jobs()
+        return [await queue.get_job(job_id) for job_id in job_ids], await _pending(fake_redis)
+
+    jobs, pending = asyncio.run(run())
+    assert [job["status"] for job in jobs] == ["done"] * len(jobs)
+    assert pending == 0
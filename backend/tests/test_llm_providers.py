@@ -0,0 +1,64 @@
+import asyncio
+import json
+import httpx
+import pytest
+from benchmark_llm_concurrency import FakeProviderServer, run
+from services.llm_providers import GeminiProvider, ProviderError, RateLimitError
+
+@pytest.mark.parametrize("model", ["gpt-3.5-turbo", "gemini-pro"])
+def test_concurrent_completions_overlap(model):
+    results = asyncio.run(run(model, latency=0.2, levels=[1, 8], rounds=2))
+    # Eight calls at once take about as long as one: nothing blocks the event loop. Serialized
+    # calls would score 1/8; the margin below ~0.8 absorbs a busy test machine
+    assert results[1]["efficiency"] > 0.5
+
+def test_provider_answers_through_pooled_client():
+    async def complete():
+        async with FakeProviderServer(latency=0) as server:
+            provider = server.provider("gemini-pro")
+            await provider.startup()
+            try:
+                first = await provider.complete("Hello", 16)
+                client = provider.client
+                await provider.complete("Hello again", 16)
+                return first, client is provider.client
+            finally:
+                await provider.shutdown()
+
+    result, reused = asyncio.run(complete())
+    assert result == {"text": "Fake answer.", "input_tokens": 10, "output_tokens": 3, "model": "gemini-pro"}
+    assert reused
+
+def _gemini(handler) -> GeminiProvider:
+    """A Gemini provider whose HTTP calls are answered by handler(request)."""
+    provider = GeminiProvider()
+    provider.client = httpx.AsyncClient(base_url="http://gemini.test/v1beta", transport=httpx.MockTransport(handler))
+    return provider
+
+def test_gemini_rate_limit_on_stream():
+    provider = _gemini(lambda request: httpx.Response(429, headers={"retry-after": "7"}, text="quota exceeded"))
+
+    async def stream():
+        return [item async for item in provider.stream("Hello", 16)]
+
+    with pytest.raises(RateLimitError) as raised:
+        asyncio.run(stream())
+    assert raised.value.retry_after == 7.0
+
+@pytest.mark.parametrize("body", [
+    {"promptFeedback": {"blockReason": "SAFETY"}},
+    {"candidates": [{"finishReason": "SAFETY"}]},
+    {"candidates": [{"content": {"parts": []}, "finishReason": "MAX_TOKENS"}]},
+])
+def test_gemini_blocked_or_empty_response_is_a_provider_error(body):
+    provider = _gemini(lambda request: httpx.Response(200, json=body))
+    events = "".join(f"data: {json.dumps(body)}\n\n" for _ in range(2))
+    streaming = _gemini(lambda request: httpx.Response(200, text=events))
+
+    async def stream():
+        return [item async for item in streaming.stream("Hello", 16)]
+
+    with pytest.raises(ProviderError, match="no text"):
+        asyncio.run(provider.complete("Hello", 16))
+    with pytest.raises(ProviderError, match="no text"):
+        asyncio.run(stream())
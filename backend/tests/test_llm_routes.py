@@ -0,0 +1,226 @@
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("litellm")  # llm_service, which the routes import, needs it
+
+from models.llm_model import QuestionResponse, SummaryResponse
+from models.pdf_model import EstimateRequest, SummaryRequest
+from routes import llm_routes
+from services.event_publisher import event_publisher
+from services.llm_providers import FakeProvider, ProviderError
+from services.llm_service import llm_service
+from services.model_router import ModelRouter
+from services.pdf_service import pdf_service
+from services.token_counter import calculate_cost
+
+class Registry:
+    """Provider registry made of the given providers."""
+
+    def __init__(self, *providers):
+        self.providers = {provider.name: provider for provider in providers}
+
+    @property
+    def available_models(self):
+        return list(self.providers)
+
+    def get(self, model):
+        return self.providers[model]
+
+class DownProvider(FakeProvider):
+    async def complete(self, prompt, max_tokens):
+        raise ProviderError(f"{self.name} is down")
+
+    async def stream(self, prompt, max_tokens):
+        raise ProviderError(f"{self.name} is down")
+        yield
+
+@pytest.fixture(autouse=True)
+def fast_fake_backend(monkeypatch):
+    from services import llm_providers
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_LATENCY", 0.001)
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_RPM", 0)
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """Route LLM calls to fake providers for gpt-3.5-turbo and gpt-4."""
+    router = ModelRouter(Registry(FakeProvider("gpt-3.5-turbo"), FakeProvider("gpt-4")))
+    monkeypatch.setattr(llm_routes, "model_router", router)
+    monkeypatch.setattr(event_publisher, "queue", asyncio.Queue())
+    return router
+
+@pytest.fixture
+def document(monkeypatch):
+    """Serve one extracted document for any filename."""
+    content = {"content": "Plant seven shipped forty crates in spring. " * 50, "content_hash": "doc-hash"}
+
+    async def get_pdf_content(filename, s3_url=None):
+        return dict(content)
+
+    monkeypatch.setattr(pdf_service, "get_pdf_content", get_pdf_content)
+    return content
+
+def _parse_sse(chunks):
+    """Split SSE chunks into (event, data) pairs; plain data events are named "message"."""
+    events = []
+    for chunk in chunks:
+        event = "message"
+        for line in chunk.strip().splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+async def _drain(response):
+    return _parse_sse([chunk async for chunk in response.body_iterator])
+
+def test_usage_events_carry_no_document_text(monkeypatch):
+    monkeypatch.setattr(event_publisher, "queue", asyncio.Queue())
+    usage = {"filename": "a.pdf", "model": "gpt-3.5-turbo", "input_tokens": 100, "output_tokens": 20, "cost": 0.5}
+    llm_routes._publish_usage(SummaryResponse(summary="Confidential summary.", **usage), 1.23456)
+    llm_routes._publish_usage(QuestionResponse(question="Secret question?", answer="Secret answer.", **usage), 2.0)
+
+    summarize, question = event_publisher.queue.get_nowait(), event_publisher.queue.get_nowait()
+    fields = {"filename": "a.pdf", "model": "gpt-3.5-turbo", "tokens": "120", "cost": "0.5"}
+    assert summarize == {"event_type": "summarize", "latency": "1.235", **fields}
+    assert question == {"event_type": "question", "latency": "2.0", **fields}
+
+def test_sse_stream_relays_tokens_then_done(fake_redis, monkeypatch):
+    monkeypatch.setattr(event_publisher, "queue", asyncio.Queue())
+
+    async def events():
+        yield {"token": "Plants "}
+        yield {"token": "shipped."}
+        yield {"model": "gpt-4", "input_tokens": 10, "output_tokens": 2}
+
+    def build_response(summary, usage):
+        return SummaryResponse(filename="a.pdf", summary=summary, cost=0.0, **usage)
+
+    async def run():
+        return _parse_sse([chunk async for chunk in llm_routes._sse_stream(events(), build_response, None, "gpt-4")])
+
+    sent = asyncio.run(run())
+    assert sent[:2] == [("message", {"token": "Plants "}), ("message", {"token": "shipped."})]
+    assert sent[2][0] == "done" and sent[2][1]["summary"] == "Plants shipped."
+    assert event_publisher.queue.qsize() == 1
+
+def test_sse_stream_reports_failures_as_error_event(fake_redis):
+    async def events():
+        yield {"token": "Plants "}
+        raise HTTPException(status_code=503, detail="All available language models failed.")
+
+    async def run():
+        return _parse_sse([chunk async for chunk in llm_routes._sse_stream(events(), None, None, "gpt-4")])
+
+    assert asyncio.run(run()) == [
+        ("message", {"token": "Plants "}),
+        ("error", {"detail": "All available language models failed."})
+    ]
+
+def test_stream_replays_cached_summary(fake_redis, fake_models, document):
+    request = SummaryRequest(filename="a.pdf", model="gpt-3.5-turbo", max_length=400)
+
+    async def run():
+        first = await _drain(await llm_routes.summarize_pdf_stream(request))
+        second = await _drain(await llm_routes.summarize_pdf_stream(request))
+        return first, second
+
+    first, second = asyncio.run(run())
+    live, replayed = first[-1][1], second[-1][1]
+    assert not live["cached"] and replayed["cached"]
+    assert replayed["summary"] == live["summary"] and replayed["cost"] == 0.0
+    assert second[0] == ("message", {"token": live["summary"]})
+
+def test_stream_map_reduce_cost_adds_earlier_calls(fake_redis, fake_models, document, monkeypatch):
+    monkeypatch.setattr(llm_routes.settings, "SUMMARY_MAP_REDUCE_THRESHOLD", 0)
+
+    async def prepare_map_reduce_prompt(pdf_content, max_length, model, complete):
+        # Section summaries that ran on gpt-4 before the final call
+        return "Summarize these section summaries.", {"input_tokens": 1000, "output_tokens": 200,
+                                                      "cost": calculate_cost("gpt-4", 1000, 200)}
+
+    monkeypatch.setattr(llm_service, "prepare_map_reduce_prompt", prepare_map_reduce_prompt)
+    request = SummaryRequest(filename="a.pdf", model="gpt-3.5-turbo", max_length=400)
+
+    async def run():
+        return await _drain(await llm_routes.summarize_pdf_stream(request))
+
+    event, done = asyncio.run(run())[-1]
+    assert event == "done" and done["model"] == "gpt-3.5-turbo"
+    final_input, final_output = done["input_tokens"] - 1000, done["output_tokens"] - 200
+    expected = calculate_cost("gpt-4", 1000, 200) + calculate_cost("gpt-3.5-turbo", final_input, final_output)
+    assert done["cost"] == pytest.approx(expected)
+
+def test_fallback_answers_are_not_cached_as_the_requested_model(fake_redis, document, monkeypatch):
+    monkeypatch.setattr(llm_routes, "model_router", ModelRouter(Registry(DownProvider("gpt-4"), FakeProvider("gpt-3.5-turbo"))))
+    monkeypatch.setattr(event_publisher, "queue", asyncio.Queue())
+    request = SummaryRequest(filename="a.pdf", model="gpt-4", max_length=400)
+
+    async def complete(prompt, max_tokens):
+        return await llm_routes._complete_with_fallback(prompt, request.model, max_tokens)
+
+    async def run():
+        first = await llm_routes._summarize(request, complete)
+        second = await llm_routes._summarize(request, complete)
+        streamed = await _drain(await llm_routes.summarize_pdf_stream(request))
+        return first, second, streamed[-1][1], await fake_redis.async_redis.keys("llmcache:summary:*")
+
+    first, second, streamed, keys = asyncio.run(run())
+    assert first.model == second.model == streamed["model"] == "gpt-3.5-turbo"
+    assert not second.cached and not streamed["cached"]
+    assert keys == []
+
+def test_unserved_model_is_cached_under_the_model_that_answers(fake_redis, document, monkeypatch):
+    monkeypatch.setattr(llm_routes, "model_router", ModelRouter(Registry(FakeProvider("gpt-3.5-turbo"))))
+    monkeypatch.setattr(event_publisher, "queue", asyncio.Queue())
+    request = SummaryRequest(filename="a.pdf", model="gpt-4", max_length=400)
+
+    async def complete(prompt, max_tokens):
+        return await llm_routes._complete_with_fallback(prompt, request.model, max_tokens)
+
+    async def run():
+        first = await llm_routes._summarize(request, complete)
+        return first, await llm_routes._summarize(request, complete)
+
+    first, second = asyncio.run(run())
+    assert first.model == "gpt-3.5-turbo" and not first.cached
+    assert second.cached and second.summary == first.summary
+
+def test_estimate_is_for_the_model_that_will_answer(fake_redis, document, monkeypatch):
+    # gpt-4, the default, has no provider here; the router answers with gpt-3.5-turbo
+    monkeypatch.setattr(llm_routes, "model_router", ModelRouter(Registry(FakeProvider("gpt-3.5-turbo"), FakeProvider("gemini-pro"))))
+    estimate = asyncio.run(llm_routes.estimate_cost(EstimateRequest(filename="a.pdf", max_length=400)))
+    assert estimate.estimate.model == "gpt-3.5-turbo"
+    assert [alternative.model for alternative in estimate.alternatives] == ["gemini-pro"]
+
+def test_estimate_matches_the_live_request(fake_redis, fake_models, document):
+    request = SummaryRequest(filename="a.pdf", model="gpt-3.5-turbo", max_length=400)
+    estimate_request = EstimateRequest(filename="a.pdf", model="gpt-3.5-turbo", max_length=400)
+
+    async def complete(prompt, max_tokens):
+        return await llm_routes._complete_with_fallback(prompt, request.model, max_tokens)
+
+    async def run():
+        before = await llm_routes.estimate_cost(estimate_request)
+        summary = await llm_routes._summarize(request, complete)
+        return before, summary, await llm_routes.estimate_cost(estimate_request)
+
+    before, summary, after = asyncio.run(run())
+    assert before.estimate.model == summary.model == "gpt-3.5-turbo"
+    assert [alternative.model for alternative in before.alternatives] == ["gpt-4"]
+    assert before.strategy == "single" and before.estimate.calls == 1
+    assert before.estimate.input_tokens == summary.input_tokens
+    assert before.estimate.output_tokens == 100
+    assert before.estimate.cost == pytest.approx(
+        calculate_cost("gpt-3.5-turbo", before.estimate.input_tokens, before.estimate.output_tokens)
+    )
+    # Once the summary is cached, running it again costs nothing
+    assert not before.cached and after.cached and after.estimate.cost == 0.0
+
+def test_estimate_switches_to_map_reduce_for_long_documents(fake_redis, fake_models, document, monkeypatch):
+    monkeypatch.setattr(llm_routes.settings, "SUMMARY_MAP_REDUCE_THRESHOLD", 100)
+    estimate = asyncio.run(llm_routes.estimate_cost(EstimateRequest(filename="a.pdf", model="gpt-3.5-turbo")))
+    assert estimate.strategy == "map_reduce" and estimate.document_tokens > 100
+    assert estimate.estimate.model == "gpt-3.5-turbo" and estimate.estimate.calls > 1
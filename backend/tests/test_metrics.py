@@ -0,0 +1,61 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from benchmark_batch_ingest import make_pdf
+from services.metrics import MetricsMiddleware, render
+from services.pdf_service import pdf_service
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_requests_are_timed_per_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"in_flight": sample("http_requests_in_flight", method="GET", route="/items/{item_id}")}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                yield b"chunk"
+        return StreamingResponse(chunks())
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    stream_before = sample("http_request_duration_seconds_sum", method="GET", route="/stream", status="200")
+    with TestClient(app) as client:
+        responses = [client.get(f"/items/{i}") for i in range(3)]
+        client.get("/stream")
+        missing = client.get("/nowhere")
+
+    # One series for every item id, and the gauge counts the request being handled
+    assert sample("http_request_duration_seconds_count", **labels) - before == 3
+    assert [response.json()["in_flight"] for response in responses] == [1, 1, 1]
+    assert sample("http_requests_in_flight", method="GET", route="/items/{item_id}") == 0
+    # A streamed response is timed until its last chunk
+    assert sample("http_request_duration_seconds_sum", method="GET", route="/stream", status="200") - stream_before >= 0.15
+    assert missing.status_code == 404
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+
+def test_extraction_records_stages_and_s3_calls(fake_redis, s3_bucket):
+    s3_bucket.s3_client.put_object(Bucket=s3_bucket.bucket_name, Key="pdfs/m.pdf", Body=make_pdf("Metrics", 2))
+    stages = ("redis_lookup", "s3_download", "pdf_extraction", "chunking")
+    before = {name: sample("stage_duration_seconds_count", stage=name) for name in stages}
+    gets = sample("s3_requests_total", operation="GetObject")
+
+    content = asyncio.run(pdf_service.get_pdf_content("m.pdf"))
+    assert "Metrics" in content["content"]
+    assert all(sample("stage_duration_seconds_count", stage=name) > before[name] for name in stages)
+    assert sample("s3_requests_total", operation="GetObject") > gets
+
+def test_render_is_prometheus_text():
+    body, content_type = render()
+    assert content_type.startswith("text/plain")
+    for name in ("http_request_duration_seconds", "stage_duration_seconds", "redis_commands_total", "s3_requests_total"):
+        assert f"# TYPE {name}" in body.decode()
@@ -0,0 +1,125 @@
+import asyncio
+import time
+import pytest
+from services.llm_providers import FakeProvider, ProviderError
+from services.model_router import ModelHealth, ModelRouter
+
+class Registry:
+    """Provider registry made of the given providers."""
+
+    def __init__(self, *providers):
+        self.providers = {provider.name: provider for provider in providers}
+
+    @property
+    def available_models(self):
+        return list(self.providers)
+
+    def get(self, model):
+        return self.providers[model]
+
+class GatedProvider(FakeProvider):
+    """Counts calls, optionally fails them and holds each one until the gate is set."""
+
+    def __init__(self, name, fail=False):
+        super().__init__(name)
+        self.fail = fail
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def complete(self, prompt, max_tokens):
+        self.calls += 1
+        await self.gate.wait()
+        if self.fail:
+            raise ProviderError(f"{self.name} is down")
+        return await super().complete(prompt, max_tokens)
+
+@pytest.fixture(autouse=True)
+def fast_fake_backend(monkeypatch):
+    from services import llm_providers
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_LATENCY", 0.001)
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_RPM", 0)
+
+def _cooled_down(health: ModelHealth):
+    """Open the circuit, then let its cooldown run out."""
+    health.record_failure(trial=True)
+    health.open_until = time.monotonic() - 1
+
+def test_half_open_lets_one_trial_through():
+    health = ModelHealth()
+    _cooled_down(health)
+    assert health.is_half_open and not health.is_open
+
+    assert health.acquire()
+    assert health.is_open
+    assert not health.acquire()
+    assert not health.acquire()
+
+def test_trial_outcome_decides_the_circuit():
+    health = ModelHealth()
+    _cooled_down(health)
+    assert health.acquire()
+    health.record_failure(trial=True)
+    assert health.is_open and not health.is_half_open
+
+    _cooled_down(health)
+    assert health.acquire()
+    health.record_success(0.1)
+    assert not health.is_open and not health.open_until
+    assert health.acquire() and health.acquire()
+
+def test_router_sends_one_trial_to_a_half_open_model():
+    primary = GatedProvider("gpt-3.5-turbo")
+    backup = GatedProvider("gemini-pro")
+    router = ModelRouter(Registry(primary, backup))
+    _cooled_down(router.health["gpt-3.5-turbo"])
+    primary.gate.clear()
+
+    async def run():
+        requests = [asyncio.ensure_future(router.complete("Hello there.", "gpt-3.5-turbo", 16)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        # One request holds the trial; the others went to the backup instead of piling on
+        assert primary.calls == 1
+        assert backup.calls == 4
+        primary.gate.set()
+        results = await asyncio.gather(*requests)
+        return [result["model"] for result in results]
+
+    models = asyncio.run(run())
+    assert models.count("gpt-3.5-turbo") == 1
+    assert not router.health["gpt-3.5-turbo"].open_until
+
+def test_router_reopens_when_the_trial_fails():
+    primary = GatedProvider("gpt-3.5-turbo", fail=True)
+    backup = GatedProvider("gemini-pro")
+    router = ModelRouter(Registry(primary, backup))
+    _cooled_down(router.health["gpt-3.5-turbo"])
+
+    async def run():
+        first = await router.complete("Hello there.", "gpt-3.5-turbo", 16)
+        second = await router.complete("Hello again.", "gpt-3.5-turbo", 16)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["model"] == second["model"] == "gemini-pro"
+    assert primary.calls == 1
+    assert router.health["gpt-3.5-turbo"].is_open
+
+def test_cancelled_trial_is_released():
+    primary = GatedProvider("gpt-3.5-turbo")
+    router = ModelRouter(Registry(primary, GatedProvider("gemini-pro")))
+    health = router.health["gpt-3.5-turbo"]
+    _cooled_down(health)
+    primary.gate.clear()
+
+    async def run():
+        request = asyncio.ensure_future(router.complete("Hello there.", "gpt-3.5-turbo", 16))
+        await asyncio.sleep(0.05)
+        assert health.trial_in_flight
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert not health.trial_in_flight
+    assert health.is_half_open and not health.is_open
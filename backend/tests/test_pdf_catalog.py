@@ -0,0 +1,80 @@
+import asyncio
+from services.pdf_catalog import pdf_catalog
+
+def _put(s3_bucket, key: str, body: bytes = b"%PDF-1.4 fake"):
+    return s3_bucket.s3_client.put_object(Bucket=s3_bucket.bucket_name, Key=key, Body=body)
+
+class SmallPages:
+    """Paginator wrapper listing two objects per page, so reconcile has to page."""
+
+    def __init__(self, paginator):
+        self.paginator = paginator
+
+    def paginate(self, **kwargs):
+        return self.paginator.paginate(PaginationConfig={"PageSize": 2}, **kwargs)
+
+def test_add_get_remove(fake_redis, s3_bucket):
+    async def run():
+        await pdf_catalog.add("pdfs/a.pdf", 10, content_hash="abc", etag='"e"', uploaded_at=100.0)
+        found = await pdf_catalog.get("a.pdf")
+        await pdf_catalog.remove("pdfs/a.pdf")
+        return found, await pdf_catalog.get("a.pdf")
+
+    found, missing = asyncio.run(run())
+    assert found == {"filename": "pdfs/a.pdf", "size": 10, "uploaded_at": 100.0,
+                     "content_hash": "abc", "etag": '"e"'}
+    assert missing is None
+
+def test_get_falls_back_to_head_and_records_it(fake_redis, s3_bucket):
+    _put(s3_bucket, "pdfs/outside.pdf")
+
+    async def run():
+        entry = await pdf_catalog.get("outside.pdf")
+        return entry, await fake_redis.hget(pdf_catalog.ENTRIES_KEY, "pdfs/outside.pdf")
+
+    entry, recorded = asyncio.run(run())
+    assert entry["filename"] == "pdfs/outside.pdf"
+    assert entry["size"] == len(b"%PDF-1.4 fake")
+    assert recorded is not None
+
+def test_list_page_follows_cursor_across_equal_timestamps(fake_redis):
+    # Three uploads share a timestamp, so a page boundary falls between them
+    times = [500.0, 400.0, 400.0, 400.0, 300.0, 200.0, 100.0]
+
+    async def run():
+        for i, uploaded_at in enumerate(times):
+            await pdf_catalog.add(f"pdfs/{i}.pdf", i, uploaded_at=uploaded_at)
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = await pdf_catalog.list_page(2, cursor)
+            pages.append([entry["filename"] for entry in page])
+            if not cursor:
+                return pages
+
+    pages = asyncio.run(run())
+    listed = [name for page in pages for name in page]
+    assert sorted(listed) == sorted(f"pdfs/{i}.pdf" for i in range(len(times)))
+    assert len(listed) == len(set(listed))
+    assert all(len(page) <= 2 for page in pages)
+
+def test_reconcile_pages_through_the_bucket(fake_redis, s3_bucket, monkeypatch):
+    for i in range(5):
+        _put(s3_bucket, f"pdfs/{i}.pdf")
+    _put(s3_bucket, "pdfs/notes.txt")
+    _put(s3_bucket, "pdfs/changed.pdf", b"%PDF-1.4 new")
+    paginator = s3_bucket.s3_client.get_paginator
+    monkeypatch.setattr(s3_bucket.s3_client, "get_paginator", lambda name: SmallPages(paginator(name)))
+
+    async def run():
+        await pdf_catalog.add("pdfs/gone.pdf", 1, uploaded_at=1.0)
+        await pdf_catalog.add("pdfs/changed.pdf", 1, content_hash="old", etag='"stale"', uploaded_at=1.0)
+        stats = await pdf_catalog.reconcile()
+        return stats, await pdf_catalog.list_all()
+
+    stats, entries = asyncio.run(run())
+    assert stats == {"total": 6, "updated": 6, "removed": 1}
+    by_name = {entry["filename"]: entry for entry in entries}
+    assert set(by_name) == {f"pdfs/{i}.pdf" for i in range(5)} | {"pdfs/changed.pdf"}
+    assert by_name["pdfs/changed.pdf"]["content_hash"] is None
+    assert by_name["pdfs/changed.pdf"]["size"] == len(b"%PDF-1.4 new")
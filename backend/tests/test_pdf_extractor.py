@@ -0,0 +1,35 @@
+import asyncio
+from benchmark_batch_ingest import make_pdf
+from services.pdf_extractor import PDFExtractor
+
+def _extractor(parallel_min_pages: int) -> PDFExtractor:
+    extractor = PDFExtractor()
+    extractor.max_workers = 2
+    extractor.min_pages_per_task = 5
+    extractor.parallel_min_pages = parallel_min_pages
+    return extractor
+
+def test_pooled_extraction_matches_serial():
+    pdf_bytes = make_pdf("Pooled", 23, lines=3)
+    extractor = _extractor(parallel_min_pages=0)
+    try:
+        async def run():
+            await extractor.warm_up()
+            return await extractor.extract_pages(pdf_bytes)
+
+        pages = asyncio.run(run())
+    finally:
+        extractor.shutdown()
+    assert pages == extractor.extract_pages_serial(pdf_bytes)
+    assert len(pages) == 23
+
+def test_short_documents_skip_the_pool():
+    pdf_bytes = make_pdf("Short", 10)
+    extractor = _extractor(parallel_min_pages=300)
+    extractor._get_executor = lambda: _Unusable()
+    pages = asyncio.run(extractor.extract_pages(pdf_bytes))
+    assert pages == extractor.extract_pages_serial(pdf_bytes)
+
+class _Unusable:
+    def submit(self, *args, **kwargs):
+        raise AssertionError("short documents should not be sent to the process pool")
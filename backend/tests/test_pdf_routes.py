@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from routes import pdf_routes
+from services.extraction_cache import extraction_cache
+from services.pdf_catalog import pdf_catalog
+from services.s3_service import s3_service
+
+@pytest.fixture
+def signed(monkeypatch):
+    """Record every URL signed."""
+    calls = []
+    original = s3_service.get_signed_url
+
+    def get_signed_url(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(s3_service, "get_signed_url", get_signed_url)
+    return calls
+
+def test_content_from_cache_signs_no_url(fake_redis, s3_bucket, signed):
+    content = "one\ntwo\n"
+
+    async def run():
+        await extraction_cache.put("abc", content, ["one", "two"], [(0, len(content))])
+        await extraction_cache.link_filename("a.pdf", "abc")
+        await pdf_catalog.add("pdfs/a.pdf", 100)
+        return await pdf_routes.get_pdf_content("a.pdf", pages=None, byte_range=None)
+
+    assert asyncio.run(run()) == content
+    assert signed == []
+
+def test_content_miss_signs_to_download(fake_redis, s3_bucket, signed):
+    s3_bucket.s3_client.put_object(Bucket=s3_bucket.bucket_name, Key="pdfs/b.pdf", Body=b"not a pdf")
+
+    async def run():
+        with pytest.raises(HTTPException):
+            await pdf_routes.get_pdf_content("b.pdf", pages=None, byte_range=None)
+
+    asyncio.run(run())
+    assert [args[0] for args in signed] == ["pdfs/b.pdf"]
@@ -0,0 +1,89 @@
+import asyncio
+import redis.asyncio
+from prometheus_client import REGISTRY
+from config import get_settings
+from redis_client import (InstrumentedAsyncConnection, InstrumentedAsyncSSLConnection, RedisClient,
+                          _InstrumentedAsyncConnectionMixin)
+
+settings = get_settings()
+
+def _client(**config) -> RedisClient:
+    client = RedisClient.__new__(RedisClient)
+    client._config = {"host": "localhost", "port": 6379, "password": None, "db": 0, **config}
+    return client
+
+def test_async_pool_is_bounded_and_instrumented():
+    pool = _client(ssl=False)._async_pool()
+    assert isinstance(pool, redis.asyncio.BlockingConnectionPool)
+    assert pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+    assert pool.timeout == settings.REDIS_POOL_TIMEOUT
+    assert pool.connection_class is InstrumentedAsyncConnection
+    assert pool.connection_kwargs["decode_responses"] is True
+
+    binary = _client(ssl=True)._async_pool(decode_responses=False)
+    assert binary.connection_class is InstrumentedAsyncSSLConnection
+    assert binary.connection_kwargs["decode_responses"] is False
+    assert "ssl" not in binary.connection_kwargs and "ssl_cert_reqs" in binary.connection_kwargs
+
+def test_connections_count_commands_and_round_trips():
+    class Connection:
+        def pack_command(self, *args):
+            return args
+
+        async def send_packed_command(self, command, check_health=True):
+            return None
+
+    class Counted(_InstrumentedAsyncConnectionMixin, Connection):
+        pass
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    before = sample("redis_commands_total", command="XACK"), sample("redis_round_trips_total")
+    connection = Counted()
+    commands = [connection.pack_command(b"xack", "llm_events", "analytics_group", "1-0") for _ in range(3)]
+    asyncio.run(connection.send_packed_command(commands))
+    assert sample("redis_commands_total", command="XACK") - before[0] == 3
+    assert sample("redis_round_trips_total") - before[1] == 1
+
+def test_multi_key_helpers(fake_redis):
+    async def run():
+        await fake_redis.set("a", "1", expire=60)
+        await fake_redis.mset({"b": "2", "c": "3"}, expire=60)
+        values = await fake_redis.mget(["a", "b", "missing", "c"])
+        ttls = [await fake_redis.async_redis.ttl(key) for key in ("a", "b", "c")]
+        await fake_redis.hset_bytes("h", {"field": b"\x00\x01"}, expire=60)
+        binary = await fake_redis.hmget_bytes("h", ["field"])
+        return values, ttls, await fake_redis.mget([]), binary, await fake_redis.async_redis.ttl("h")
+
+    values, ttls, empty, binary, hash_ttl = asyncio.run(run())
+    assert values == ["1", "2", None, "3"]
+    assert all(0 < ttl <= 60 for ttl in ttls) and 0 < hash_ttl <= 60
+    assert empty == []
+    assert binary == [b"\x00\x01"]
+
+def test_pipelines(fake_redis):
+    async def run():
+        pipe = await fake_redis.pipeline()
+        pipe.set("text", "one")
+        pipe.get("text")
+        binary = await fake_redis.pipeline(binary=True, transaction=True)
+        binary.get("text")
+        return pipe.is_transaction, binary.is_transaction, await pipe.execute(), await binary.execute()
+
+    plain, transaction, results, binary_results = asyncio.run(run())
+    assert (plain, transaction) == (False, True)
+    assert results == [True, "one"]
+    assert binary_results == [b"one"]
+
+def test_batch_acknowledgement(fake_redis):
+    async def run():
+        await fake_redis.create_consumer_group("llm_events", "analytics_group")
+        for i in range(3):
+            await fake_redis.async_redis.xadd("llm_events", {"n": str(i)})
+        messages = (await fake_redis.read_as_consumer("llm_events", "analytics_group", "worker", count=3))[0][1]
+        acked = await fake_redis.acknowledge_messages("llm_events", "analytics_group", [m for m, _ in messages])
+        return acked, await fake_redis.acknowledge_messages("llm_events", "analytics_group", []), \
+            await fake_redis.pending_for_consumer("llm_events", "analytics_group", "worker")
+
+    assert asyncio.run(run()) == (3, 0, [])
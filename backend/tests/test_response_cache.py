@@ -0,0 +1,44 @@
+import asyncio
+from services.response_cache import ResponseCache
+
+def test_keys_ignore_trivial_question_differences():
+    cache = ResponseCache()
+    assert cache.question_key("h", "gpt-4", "What was shipped?") == cache.question_key("h", "gpt-4", "  what WAS   shipped ")
+    assert cache.question_key("h", "gpt-4", "What was shipped?") != cache.question_key("h", "gpt-3.5-turbo", "What was shipped?")
+    assert cache.question_key("h", "gpt-4", "What?", "bm25") != cache.question_key("h", "gpt-4", "What?", "semantic")
+    assert cache.summary_key("h", "gpt-4", 400) != cache.summary_key("h", "gpt-4", 200)
+
+def test_round_trip_with_ttl(fake_redis):
+    cache = ResponseCache()
+    key = cache.summary_key("h", "gpt-4", 400)
+
+    async def run():
+        missing = await cache.get(key)
+        await cache.put(key, {"summary": "Plants shipped.", "model": "gpt-4"})
+        return missing, await cache.get(key), await fake_redis.async_redis.ttl(key)
+
+    missing, cached, ttl = asyncio.run(run())
+    assert missing is None
+    assert cached == {"summary": "Plants shipped.", "model": "gpt-4"}
+    assert 0 < ttl <= cache.ttl
+
+def test_evicts_least_recently_used_beyond_max_entries(fake_redis):
+    cache = ResponseCache()
+    cache.max_entries = 3
+    keys = [cache.summary_key(f"doc-{i}", "gpt-4", 400) for i in range(5)]
+
+    async def run():
+        for key in keys[:3]:
+            await cache.put(key, {"summary": key})
+            await asyncio.sleep(0.01)
+        # Reading the oldest entry makes it the most recent, so the next two puts evict 1 and 2
+        await cache.get(keys[0])
+        await asyncio.sleep(0.01)
+        for key in keys[3:]:
+            await cache.put(key, {"summary": key})
+            await asyncio.sleep(0.01)
+        return [await cache.get(key) is not None for key in keys], await fake_redis.async_redis.zcard(cache.LRU_KEY)
+
+    present, tracked = asyncio.run(run())
+    assert present == [True, False, False, True, True]
+    assert tracked == 3
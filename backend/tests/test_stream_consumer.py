@@ -0,0 +1,187 @@
+import asyncio
+import json
+import time
+import pytest
+from services.analytics_rollup import analytics_rollup
+from services.stream_consumer import StreamConsumer
+
+def _consumer(name: str) -> StreamConsumer:
+    consumer = StreamConsumer()
+    consumer.consumer_name = name
+    return consumer
+
+async def _publish(fake_redis, count: int, model: str = "gpt-3.5-turbo"):
+    for i in range(count):
+        await fake_redis.async_redis.xadd("llm_events", {
+            "event_type": "question", "model": model, "filename": f"doc{i % 3}.pdf",
+            "tokens": "10", "cost": "0.001", "latency": "0.5"
+        })
+
+def test_failed_batch_does_not_stop_processing(fake_redis, monkeypatch):
+    consumer = _consumer("worker-a")
+    process_batch = consumer._process_batch
+    batches = []
+
+    async def flaky(messages):
+        batches.append(messages)
+        if len(batches) == 1:
+            raise RuntimeError("boom")
+        await process_batch(messages)
+
+    monkeypatch.setattr(consumer, "_process_batch", flaky)
+
+    async def run():
+        await fake_redis.create_consumer_group("llm_events", "analytics_group")
+        await _publish(fake_redis, 4)
+        messages = (await fake_redis.read_as_consumer("llm_events", "analytics_group", "worker-a", count=4))[0][1]
+        consumer.queue = asyncio.Queue()
+        processor = asyncio.create_task(consumer._process_batches())
+        await consumer.queue.put(messages[:2])
+        await consumer.queue.put(messages[2:])
+        await consumer.queue.join()
+        processor.cancel()
+        return await fake_redis.pending_for_consumer("llm_events", "analytics_group", "worker-a")
+
+    pending = asyncio.run(run())
+    assert len(batches) == 2
+    assert consumer.stats["errors"] == 1 and consumer.stats["last_error"] == "boom"
+    assert consumer.stats["processed_events"] == 2
+    # The failed batch stays pending, to be reclaimed
+    assert [entry["message_id"] for entry in pending] == [message_id for message_id, _ in batches[0]]
+
+@pytest.fixture
+def fast_stream(monkeypatch):
+    from services import stream_consumer
+    monkeypatch.setattr(stream_consumer.settings, "STREAM_BLOCK_MS", 20)
+    monkeypatch.setattr(stream_consumer.settings, "STREAM_BATCH_SIZE", 4)
+
+async def _until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not await condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_consumers_split_the_stream(fake_redis, fast_stream):
+    consumers = [_consumer(f"worker-{i}") for i in range(3)]
+
+    async def run():
+        # Everything is published up front, so each consumer's reads run into the others'
+        await fake_redis.create_consumer_group("llm_events", "analytics_group")
+        await _publish(fake_redis, 60)
+        tasks = [asyncio.create_task(consumer.start()) for consumer in consumers]
+
+        async def joined():
+            return len(await fake_redis.consumer_info("llm_events", "analytics_group")) == len(consumers)
+
+        async def drained():
+            return sum(consumer.stats["processed_events"] for consumer in consumers) == 60
+
+        await _until(joined)
+        await _until(drained)
+        status = await consumers[0].get_group_status()
+        for consumer in consumers:
+            consumer.stop()
+        await asyncio.gather(*tasks)
+        bucket = analytics_rollup.bucket_start("day", time.time())
+        total = await fake_redis.async_redis.hget(f"rollup:day:{bucket}", "all|count")
+        remaining = await fake_redis.consumer_info("llm_events", "analytics_group")
+        return status, int(total), remaining, await fake_redis.hgetall(consumers[0].heartbeat_key)
+
+    status, total, remaining, heartbeats = asyncio.run(run())
+    # Every event is counted once, and the work was shared
+    assert total == 60
+    assert all(consumer.stats["processed_events"] for consumer in consumers)
+    assert status["pending"] == 0
+    assert sorted(c["name"] for c in status["consumers"]) == [consumer.consumer_name for consumer in consumers]
+    assert all(c["alive"] for c in status["consumers"])
+    assert sum(c["this_instance"] for c in status["consumers"]) == 1
+    # Consumers leave the group and drop their heartbeat when they stop
+    assert remaining == [] and heartbeats == {}
+
+def test_heartbeat_reports_throughput(fake_redis):
+    consumer = _consumer("worker-a")
+
+    async def run():
+        consumer.stats["start_time"] = "2026-01-01T00:00:00"
+        await consumer._heartbeat()
+        consumer.stats["processed_events"] = 10
+        consumer._last_heartbeat = (consumer._last_heartbeat[0] - 2, 0)
+        await consumer._heartbeat()
+        return await consumer._heartbeats()
+
+    heartbeat = asyncio.run(run())["worker-a"]
+    assert heartbeat["processed_events"] == 10
+    assert 4 <= heartbeat["throughput"] <= 5
+    assert consumer._is_alive(heartbeat, 0)
+
+def test_rebalance_takes_over_a_dead_consumer(fake_redis, monkeypatch):
+    from services import stream_consumer
+    monkeypatch.setattr(stream_consumer.settings, "STREAM_CONSUMER_TIMEOUT", 1)
+    live = _consumer("worker-live")
+    dead = _consumer("worker-dead")
+
+    async def run():
+        await fake_redis.create_consumer_group("llm_events", "analytics_group")
+        await _publish(fake_redis, 6)
+        # The dead consumer read everything, then stopped sending heartbeats
+        await fake_redis.read_as_consumer("llm_events", "analytics_group", "worker-dead", count=6)
+        await dead._heartbeat()
+        heartbeats = await dead._heartbeats()
+        heartbeats["worker-dead"]["last_seen"] -= 120
+        await fake_redis.hset(dead.heartbeat_key, {"worker-dead": json.dumps(heartbeats["worker-dead"])})
+        await asyncio.sleep(1.1)  # Claims only take messages idle for STREAM_CONSUMER_TIMEOUT
+
+        live.queue = asyncio.Queue()
+        await live._rebalance()
+        while not live.queue.empty():
+            await live._process_batch(live.queue.get_nowait())
+        return (await fake_redis.consumer_info("llm_events", "analytics_group"),
+                await live._heartbeats(),
+                (await live.get_group_status())["pending"])
+
+    consumers, heartbeats, pending = asyncio.run(run())
+    assert live.stats["claimed_events"] == 6
+    assert live.stats["processed_events"] == 6
+    assert "worker-dead" not in [consumer["name"] for consumer in consumers]
+    assert "worker-dead" not in heartbeats
+    assert pending == 0
+
+def test_message_counted_once_when_two_consumers_hold_it(fake_redis):
+    slow, fast = _consumer("worker-slow"), _consumer("worker-fast")
+
+    async def run():
+        await fake_redis.create_consumer_group("llm_events", "analytics_group")
+        await _publish(fake_redis, 4)
+        held = (await fake_redis.read_as_consumer("llm_events", "analytics_group", "worker-slow", count=4))[0][1]
+        # Two of them are reclaimed and counted elsewhere while the slow consumer still holds them
+        _, reclaimed = await fake_redis.claim_pending("llm_events", "analytics_group", "worker-fast", 0, count=2)
+        await fast._process_batch(reclaimed)
+        await slow._process_batch(held)
+        bucket = analytics_rollup.bucket_start("day", time.time())
+        return await fake_redis.async_redis.hgetall(f"rollup:day:{bucket}"), \
+            (await slow.get_group_status())["pending"]
+
+    rollup, pending = asyncio.run(run())
+    assert rollup["all|count"] == "4" and rollup["all|tokens"] == "40"
+    assert float(rollup["all|cost"]) == pytest.approx(0.004)
+    assert (fast.stats["processed_events"], slow.stats["processed_events"]) == (2, 2)
+    assert (fast.stats["question_events"], slow.stats["question_events"]) == (2, 2)
+    assert pending == 0
+
+def test_failed_write_leaves_event_stats_alone(fake_redis, monkeypatch):
+    consumer = _consumer("worker-a")
+
+    async def run():
+        await fake_redis.create_consumer_group("llm_events", "analytics_group")
+        await _publish(fake_redis, 2)
+        messages = (await fake_redis.read_as_consumer("llm_events", "analytics_group", "worker-a", count=2))[0][1]
+
+        async def unavailable(*args):
+            raise ConnectionError("Redis went away")
+
+        monkeypatch.setattr(fake_redis, "run_script", unavailable)
+        await consumer._process_batch(messages)
+
+    asyncio.run(run())
+    assert consumer.stats["errors"] == 1
+    assert consumer.stats["processed_events"] == consumer.stats["question_events"] == 0
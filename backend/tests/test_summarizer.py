@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from services.llm_providers import FakeProvider, ProviderError
+from services.model_router import ModelRouter
+from services.summarizer import MapReduceSummarizer
+from services.token_counter import calculate_cost
+
+class Registry:
+    """Provider registry made of the given providers."""
+
+    def __init__(self, *providers):
+        self.providers = {provider.name: provider for provider in providers}
+
+    @property
+    def available_models(self):
+        return list(self.providers)
+
+    def get(self, model):
+        return self.providers[model]
+
+class CountingProvider(FakeProvider):
+    def __init__(self, name, fail=False):
+        super().__init__(name)
+        self.fail = fail
+        self.calls = 0
+
+    async def complete(self, prompt, max_tokens):
+        self.calls += 1
+        if self.fail:
+            raise ProviderError(f"{self.name} is down")
+        return await super().complete(prompt, max_tokens)
+
+def _summarizer() -> MapReduceSummarizer:
+    summarizer = MapReduceSummarizer()
+    summarizer.map_input_tokens = 60
+    summarizer.fanout = 3
+    return summarizer
+
+def _chunks(count: int):
+    return [f"Section {i} reports that plant {i} shipped {i * 17} crates in spring. " * 4 for i in range(count)]
+
+@pytest.fixture(autouse=True)
+def fast_fake_backend(monkeypatch):
+    from services import llm_providers
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_LATENCY", 0.001)
+    monkeypatch.setattr(llm_providers.settings, "LLM_FAKE_RPM", 0)
+
+def test_map_reduce_on_fake_backend_reuses_partials(fake_redis):
+    provider = CountingProvider("gpt-3.5-turbo")
+    router = ModelRouter(Registry(provider))
+    summarizer = _summarizer()
+
+    async def complete(prompt, max_tokens):
+        return await router.complete(prompt, "gpt-3.5-turbo", max_tokens)
+
+    async def run():
+        first = await summarizer.summarize(_chunks(12), complete, 400, "gpt-3.5-turbo")
+        first_calls = provider.calls
+        # A different max_length only reruns the final reduce
+        await summarizer.summarize(_chunks(12), complete, 200, "gpt-3.5-turbo")
+        return first, first_calls
+
+    first, first_calls = asyncio.run(run())
+    assert first["summary"]
+    assert first["model"] == "gpt-3.5-turbo"
+    assert first_calls > 12 // 3  # Map calls, at least one reduce level and the final call
+    assert first["input_tokens"] > 0 and first["output_tokens"] > 0
+    assert provider.calls == first_calls + 1
+
+def test_partials_are_cached_under_the_model_that_answered(fake_redis):
+    requested = CountingProvider("gpt-3.5-turbo", fail=True)
+    fallback = CountingProvider("gemini-pro")
+    router = ModelRouter(Registry(requested, fallback))
+    summarizer = _summarizer()
+
+    async def complete(prompt, max_tokens):
+        return await router.complete(prompt, "gpt-3.5-turbo", max_tokens)
+
+    async def run():
+        result = await summarizer.summarize(_chunks(6), complete, 400, "gpt-3.5-turbo")
+        keys = [key async for key in fake_redis.scan_iter("sumpart:*")]
+        return result, keys
+
+    result, keys = asyncio.run(run())
+    assert result["model"] == "gemini-pro"
+    assert keys and all(":gemini-pro:" in key for key in keys)
+
+def test_failed_map_call_cancels_the_others(fake_redis):
+    started, cancelled = [], []
+
+    async def complete(prompt, max_tokens):
+        started.append(prompt)
+        if len(started) == 1:
+            await asyncio.sleep(0.01)
+            raise ProviderError("boom")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(prompt)
+            raise
+        return {"text": "", "input_tokens": 0, "output_tokens": 0, "model": "gpt-3.5-turbo"}
+
+    async def run():
+        with pytest.raises(ProviderError):
+            await _summarizer().summarize(_chunks(8), complete, 400, "gpt-3.5-turbo")
+        # Checked before the loop closes, which would cancel leftover tasks anyway
+        return len(started), len(cancelled)
+
+    started_count, cancelled_count = asyncio.run(asyncio.wait_for(run(), 5))
+    assert started_count > 1
+    assert cancelled_count == started_count - 1
+
+def test_cost_prices_each_call_for_the_model_that_answered(fake_redis):
+    calls = []
+
+    async def complete(prompt, max_tokens):
+        # The final call falls back to a model with different prices than the map calls
+        model = "gemini-pro" if prompt.startswith("The following are summaries") else "gpt-3.5-turbo"
+        calls.append((model, 1000, 100))
+        return {"text": "Plant output grew.", "input_tokens": 1000, "output_tokens": 100, "model": model}
+
+    result = asyncio.run(_summarizer().summarize(_chunks(6), complete, 400, "gpt-3.5-turbo"))
+    assert {model for model, _, _ in calls} == {"gpt-3.5-turbo", "gemini-pro"}
+    assert result["cost"] == pytest.approx(sum(calculate_cost(*call) for call in calls))
+    assert result["cost"] != pytest.approx(calculate_cost("gemini-pro", result["input_tokens"], result["output_tokens"]))
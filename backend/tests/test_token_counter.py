@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from services.extraction_cache import extraction_cache
+from services.pdf_service import pdf_service
+from services.token_counter import APPROX, TokenCounter, approx_tokens, calculate_cost, token_counter
+
+def words(text: str) -> int:
+    return len(text.split())
+
+def test_cost_uses_model_pricing():
+    assert calculate_cost("gpt-3.5-turbo", 2000, 1000) == pytest.approx(2 * 0.0015 + 0.002)
+    # Models without a price use the default one
+    assert calculate_cost("unknown-model", 1000, 1000) == pytest.approx(0.01 + 0.02)
+
+def test_approx_is_four_characters_per_token():
+    assert [approx_tokens(text) for text in ("", "a", "abcd", "abcde")] == [0, 1, 1, 2]
+
+def test_missing_tokenizer_falls_back_to_approx(monkeypatch):
+    from services import token_counter as module
+
+    def unavailable(name):
+        raise ImportError("tiktoken package not installed. Run: pip install tiktoken")
+
+    monkeypatch.setattr(module, "_tiktoken_encoding", unavailable)
+    counter = TokenCounter()
+    counter.encodings = {"gpt-3.5-turbo": "cl100k_base"}
+    assert counter.tokenizer_name("gpt-3.5-turbo") == APPROX
+    assert counter.count("abcdefgh", "gpt-3.5-turbo") == 2
+    assert counter.count_document("abcdefgh") == {APPROX: 2}
+
+def test_models_count_with_their_own_tokenizer():
+    counter = TokenCounter()
+    counter.encodings = {"gpt-3.5-turbo": "words"}
+    counter._counters["words"] = words
+    assert counter.tokenizer_name("gpt-3.5-turbo") == "words"
+    assert counter.tokenizer_name("gemini-pro") == APPROX
+    assert counter.count("one two three", "gpt-3.5-turbo") == 3
+    assert counter.count("one two three", "gemini-pro") == approx_tokens("one two three")
+    assert counter.count_document("one two three") == {"words": 3, APPROX: 4}
+
+def test_document_token_counts_are_stored_with_the_extraction(fake_redis, monkeypatch):
+    monkeypatch.setattr(token_counter, "encodings", {"gpt-3.5-turbo": "words"})
+    monkeypatch.setitem(token_counter._counters, "words", words)
+    content = "One two three four.\n"
+
+    async def run():
+        await extraction_cache.put("abc", content, ["One two three four."], [(0, len(content))])
+        first = await pdf_service.get_token_count(await extraction_cache.get("abc"), "gpt-3.5-turbo")
+
+        # Later requests read the stored count instead of counting again
+        def uncounted(text):
+            raise AssertionError("counted again")
+
+        monkeypatch.setitem(token_counter._counters, "words", uncounted)
+        stored = await extraction_cache.get("abc")
+        return first, stored["token_counts"], await pdf_service.get_token_count(stored, "gpt-3.5-turbo")
+
+    first, token_counts, second = asyncio.run(run())
+    assert first == second == 4
+    assert token_counts == {"words": 4}
@@ -0,0 +1,56 @@
+import numpy as np
+from benchmark_retrieval import evaluate
+from services.vector_index import DocumentVectors, HashingEmbedder, VectorIndex
+
+CHUNKS = [
+    "The bridge is long and the river is wide.",
+    "The Halvorsen bridge is 420 metres long.",
+    "Museums sold tickets in May.",
+    "Warehouse pallets were counted in March.",
+    ""
+]
+
+def test_hashing_embedder_is_normalized_and_deterministic():
+    embedder = HashingEmbedder(dim=64)
+    matrix = embedder.embed(CHUNKS)
+    assert matrix.shape == (len(CHUNKS), 64) and matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix[:-1], axis=1), 1.0)
+    assert not matrix[-1].any()  # No tokens, no direction
+    assert np.array_equal(HashingEmbedder(dim=64).embed(CHUNKS), matrix)
+
+def test_search_top_k_matches_full_ranking():
+    embedder = HashingEmbedder()
+    vectors = DocumentVectors(embedder.embed(CHUNKS), embedder)
+    ranked = vectors.search("How long is the Halvorsen bridge?")
+    assert ranked[0][0] == 1
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+    assert vectors.search("How long is the Halvorsen bridge?", top_k=2) == ranked[:2]
+    assert 4 not in [chunk_index for chunk_index, _ in ranked]
+    assert DocumentVectors(np.zeros((0, embedder.dim), dtype=np.float32), embedder).search("bridge") == []
+
+def test_index_round_trips_through_memory_mapped_files(tmp_path):
+    index = VectorIndex(HashingEmbedder(), index_dir=str(tmp_path), max_open=1)
+    built = index.build("abc", CHUNKS)
+    loaded = index.load("abc")
+    assert isinstance(loaded.matrix, np.memmap)
+    assert np.array_equal(np.asarray(loaded.matrix), built.matrix)
+    assert loaded.search("Halvorsen bridge") == built.search("Halvorsen bridge")
+
+    index.build("def", CHUNKS[:2])
+    index.load("def")
+    assert list(index._open) == ["def"]  # Only max_open maps are kept open
+    assert index.load("missing") is None
+
+def test_load_or_build_rebuilds_stale_matrices(tmp_path):
+    index = VectorIndex(HashingEmbedder(), index_dir=str(tmp_path))
+    index.build("abc", CHUNKS[:2])
+    assert index.load("abc").matrix.shape[0] == 2
+    vectors = index.load_or_build("abc", CHUNKS)
+    assert vectors.matrix.shape[0] == len(CHUNKS)
+    assert index.load("abc").matrix.shape[0] == len(CHUNKS)
+    assert index.load_or_build(None, CHUNKS[:3]).matrix.shape[0] == 3
+    assert not list(tmp_path.rglob("*.tmp"))
+
+def test_semantic_recall_on_fixture_documents():
+    result = evaluate(documents=2, pages=10, facts_per_document=8, top_k=8, retrieval="semantic")
+    assert result["recall@8"] >= 0.8
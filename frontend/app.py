@@ -42,6 +42,16 @@ def upload_file(file):
         st.error(f"Upload error: {str(e)}")
         return {"success": False, "error": str(e)}
 
+def get_job_status(job_id):
+    """Get the progress of a PDF ingestion job."""
+    try:
+        response = requests.get(f"{API_URL}/api/pdf/jobs/{job_id}")
+        if response.status_code == 200:
+            return response.json()
+    except Exception as e:
+        st.error(f"Error fetching job status: {str(e)}")
+    return None
+
 def get_pdf_list():
     """Get list of processed PDFs."""
     try:
@@ -58,15 +68,30 @@ def get_pdf_list():
         st.error(f"Error fetching PDFs: {str(e)}")
         return []
 
-def get_pdf_content(filename: str) -> Optional[dict]:
-    """Get the content of a specific PDF."""
+def get_pdf_url(filename: str) -> Optional[str]:
+    """Get a signed download URL for a PDF."""
+    try:
+        response = requests.get(f"{API_URL}/api/pdf/url", params={"filename": filename})
+        if response.status_code == 200:
+            return response.json().get("url")
+        return None
+    except Exception as e:
+        st.error(f"Error getting PDF URL: {str(e)}")
+        return None
+
+def get_pdf_content(filename: str, pages: Optional[str] = None) -> Optional[str]:
+    """Get the content of a specific PDF, or only the given page range (e.g. "1-2")."""
     try:
         # Extract just the filename without the path
         simple_filename = filename.split('/')[-1] if '/' in filename else filename
         
-        response = requests.get(f"{API_URL}/api/pdf/r", params={"filename": simple_filename})
+        params = {"filename": simple_filename}
+        if pages:
+            params["pages"] = pages
+        response = requests.get(f"{API_URL}/api/pdf/r", params=params)
         if response.status_code == 200:
-            return response.json()
+            # Page ranges come back as plain text, the whole document as a JSON string
+            return response.text if pages else response.json()
         else:
             st.error(f"Failed to get PDF content: {response.status_code}")
             return None
@@ -74,6 +99,31 @@ def get_pdf_content(filename: str) -> Optional[dict]:
         st.error(f"Error retrieving PDF content: {str(e)}")
         return None
 
+def read_llm_stream(response: requests.Response) -> dict:
+    """Render tokens from a streaming LLM response as they arrive.
+    Returns the final response from the "done" event."""
+    placeholder = st.empty()
+    text = ""
+    event = None
+    result = {"error": "Stream ended before the response was complete"}
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            event = None
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = json.loads(line[len("data:"):])
+            if event == "done":
+                result = data
+            elif event == "error":
+                result = {"error": data.get("detail", "Unknown error")}
+            else:
+                text += data.get("token", "")
+                placeholder.markdown(text + "▌")
+    # The caller renders the complete text, so drop the partial one
+    placeholder.empty()
+    return result
+
 def get_summary(filename: str, model: str = "gpt-4", max_length: int = 1000) -> Optional[dict]:
     """Get summary of the PDF."""
     try:
@@ -94,14 +144,15 @@ def get_summary(filename: str, model: str = "gpt-4", max_length: int = 1000) ->
         if s3_url:
             payload["s3_url"] = s3_url
         
-        # Send the request
+        # Send the request and stream the response
         response = requests.post(
-            f"{API_URL}/api/llm/summarize",
-            json=payload
+            f"{API_URL}/api/llm/summarize/stream",
+            json=payload,
+            stream=True
         )
         
         if response.status_code == 200:
-            return response.json()
+            return read_llm_stream(response)
         else:
             st.error(f"Failed to get summary: {response.status_code}")
             if response.text:
@@ -130,14 +181,15 @@ def ask_question(filename: str, question: str, model: str = "gpt-4") -> Optional
         if s3_url:
             payload["s3_url"] = s3_url
         
-        # Send the request
+        # Send the request and stream the response
         response = requests.post(
-            f"{API_URL}/api/llm/ask",
-            json=payload
+            f"{API_URL}/api/llm/ask/stream",
+            json=payload,
+            stream=True
         )
         
         if response.status_code == 200:
-            return response.json()
+            return read_llm_stream(response)
         else:
             st.error(f"Failed to get answer: {response.status_code}")
             if response.text:
@@ -148,7 +200,8 @@ def ask_question(filename: str, question: str, model: str = "gpt-4") -> Optional
 
 def open_pdf_in_browser(url: str):
     """Open PDF in a new browser tab."""
-    webbrowser.open_new_tab(url)
+    if url:
+        webbrowser.open_new_tab(url)
 
 def check_pdf_exists(filename: str) -> bool:
     """Check if a PDF exists in the backend."""
@@ -213,7 +266,11 @@ def main():
             st.write(f"Upload result: {result}")  # Debug log
             if result:
                 if result.get("success", False):
-                    st.success("PDF uploaded and processed successfully!")
+                    if result.get("job_id"):
+                        st.success("PDF uploaded! Text extraction is running in the background.")
+                        st.session_state.ingest_job = result["job_id"]
+                    else:
+                        st.success("PDF uploaded and processed successfully!")
                     if result.get("s3_url"):
                         st.markdown(f"[View PDF in Browser]({result['s3_url']})")
                     st.session_state.pdfs = get_pdf_list()
@@ -222,6 +279,16 @@ def main():
             else:
                 st.error("Failed to process the PDF. Please try again.")
 
+    if st.session_state.get("ingest_job"):
+        if st.button("Check processing status"):
+            job = get_job_status(st.session_state.ingest_job)
+            if job:
+                st.write(f"{job['filename']}: {job['status']} ({job['stage']})")
+                if job["status"] == "failed":
+                    st.error(f"Processing failed: {job.get('error')}")
+                elif job["status"] == "done":
+                    st.session_state.ingest_job = None
+
     # PDF Selection Section
     st.subheader("Select a PDF")
     if st.button("Refresh PDF List"):
@@ -239,12 +306,12 @@ def main():
             with col1:
                 if st.button(f"📄 {display_name}", key=f"select_{filename}"):
                     st.session_state.selected_pdf = filename
-                    st.session_state.current_s3_url = pdf.get('url')
+                    st.session_state.current_s3_url = get_pdf_url(filename)
             
             with col2:
-                if pdf.get('url'):
-                    st.button("🔍 View", key=f"view_{filename}", 
-                             on_click=lambda url=pdf['url']: webbrowser.open_new_tab(url))
+                # The list carries no URLs; sign one only when the PDF is opened
+                st.button("🔍 View", key=f"view_{filename}", 
+                         on_click=lambda name=filename: open_pdf_in_browser(get_pdf_url(name)))
     else:
         st.info("No PDFs available. Upload one to get started!")
 
@@ -253,6 +320,12 @@ def main():
         st.success(f"Currently selected: {st.session_state.selected_pdf}")
         if hasattr(st.session_state, 'current_s3_url'):
             st.markdown(f"[View Current PDF]({st.session_state.current_s3_url})")
+        with st.expander("Preview", expanded=False):
+            # Only the first pages are fetched, not the whole document
+            if st.session_state.get("preview_pdf") != st.session_state.selected_pdf:
+                st.session_state.preview_text = get_pdf_content(st.session_state.selected_pdf, pages="1-2")
+                st.session_state.preview_pdf = st.session_state.selected_pdf
+            st.text(st.session_state.preview_text or "No preview available")
 
     # Main content area with tabs
     tab1, tab2 = st.tabs(["📤 Process PDF", "❓ Ask Questions"])